@@ -1,18 +1,35 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Request, Response, Depends, Query, UploadFile, File
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, APIRouter, HTTPException, Request, Response, Depends, Query, UploadFile, File, WebSocket, WebSocketDisconnect, BackgroundTasks
+from fastapi.responses import JSONResponse, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorGridFSBucket
+from pymongo import ASCENDING, DESCENDING, ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
 import os
 import logging
+import mimetypes
 from pathlib import Path
+from urllib.parse import quote
 from pydantic import BaseModel, Field, ConfigDict
 from typing import List, Optional
 import uuid
 import bcrypt
 import jwt
 import httpx
+import pandas as pd
+import asyncio
+import base64
+import csv
+import hashlib
+import html
+import io
+import json
+import math
+import re
+import time
+from collections import Counter, defaultdict
 from datetime import datetime, timezone, timedelta
+from decimal import Decimal
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -102,13 +119,36 @@ class DealCreate(BaseModel):
 class MeetingRequest(BaseModel):
     product_id: str
     preferred_date: Optional[str] = None
+    duration_minutes: Optional[int] = None
     message: Optional[str] = None
 
+class FavoriteStatusRequest(BaseModel):
+    product_ids: List[str]
+
 class MessageCreate(BaseModel):
     receiver_id: str
     content: str
     deal_id: Optional[str] = None
 
+class BroadcastCreate(BaseModel):
+    content: str
+    role: Optional[str] = None  # client, shareholder, representative, admin
+    registry_status: Optional[str] = None
+
+class BulkUserModeration(BaseModel):
+    user_ids: List[str]
+    is_blocked: Optional[bool] = None
+    is_verified: Optional[bool] = None
+    role: Optional[str] = None
+
+class BulkProductStatus(BaseModel):
+    product_ids: List[str]
+    status: str
+
+class MessagesRead(BaseModel):
+    other_user_id: str
+    up_to_message_id: Optional[str] = None
+
 # ============ AUTH HELPERS ============
 
 def create_jwt(user_id: str, role: str) -> str:
@@ -145,38 +185,71 @@ async def get_current_user(request: Request) -> dict:
     # Check Authorization header (JWT)
     auth_header = request.headers.get("Authorization", "")
     if auth_header.startswith("Bearer "):
-        token = auth_header.split(" ")[1]
-        # First check if it's a session token
-        session = await db.user_sessions.find_one({"session_token": token}, {"_id": 0})
-        if session:
-            expires_at = session["expires_at"]
-            if isinstance(expires_at, str):
-                expires_at = datetime.fromisoformat(expires_at)
-            if expires_at.tzinfo is None:
-                expires_at = expires_at.replace(tzinfo=timezone.utc)
-            if expires_at > datetime.now(timezone.utc):
-                user = await db.users.find_one({"user_id": session["user_id"]}, {"_id": 0})
-                if user:
-                    return user
-        # Then try JWT
-        try:
-            payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-            user = await db.users.find_one({"user_id": payload["user_id"]}, {"_id": 0})
-            if user:
-                return user
-        except jwt.ExpiredSignatureError:
-            pass
-        except jwt.InvalidTokenError:
-            pass
+        user = await _user_from_bearer_token(auth_header.split(" ")[1])
+        if user:
+            return user
 
     raise HTTPException(status_code=401, detail="Not authenticated")
 
+async def _user_from_bearer_token(token: str) -> Optional[dict]:
+    # First check if it's a session token
+    session = await db.user_sessions.find_one({"session_token": token}, {"_id": 0})
+    if session:
+        expires_at = session["expires_at"]
+        if isinstance(expires_at, str):
+            expires_at = datetime.fromisoformat(expires_at)
+        if expires_at.tzinfo is None:
+            expires_at = expires_at.replace(tzinfo=timezone.utc)
+        if expires_at > datetime.now(timezone.utc):
+            user = await db.users.find_one({"user_id": session["user_id"]}, {"_id": 0})
+            if user:
+                return user
+    # Then try JWT
+    try:
+        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        user = await db.users.find_one({"user_id": payload["user_id"]}, {"_id": 0})
+        if user:
+            return user
+    except jwt.ExpiredSignatureError:
+        pass
+    except jwt.InvalidTokenError:
+        pass
+    return None
+
 async def get_optional_user(request: Request) -> Optional[dict]:
     try:
         return await get_current_user(request)
     except HTTPException:
         return None
 
+# ============ PAGINATION HELPERS ============
+
+def encode_cursor(values: list) -> str:
+    """Opaque keyset cursor from the sort-key values of the last row on a page"""
+    return base64.urlsafe_b64encode(json.dumps(values, default=str).encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor: str) -> list:
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def keyset_after(field: str, value, tiebreak: str, tiebreak_value, descending: bool = True, nullable: bool = False) -> dict:
+    """Rows strictly after (value, tiebreak_value) in (field, tiebreak) order.
+
+    Mongo sorts null/missing values before everything else and $lt/$gt never
+    match them, so for a nullable field the null tier is spelled out: ascending
+    it comes first and is followed by every non-null row, descending it comes last.
+    """
+    op = "$lt" if descending else "$gt"
+    same_tier = {field: value, tiebreak: {op: tiebreak_value}}
+    if nullable and value is None:
+        return same_tier if descending else {"$or": [same_tier, {field: {"$ne": None}}]}
+    clauses = [{field: {op: value}}, same_tier]
+    if nullable and descending:
+        clauses.append({field: None})
+    return {"$or": clauses}
+
 # ============ AUTH ENDPOINTS ============
 
 @api_router.post("/auth/register")
@@ -189,7 +262,9 @@ async def register(data: UserRegister):
     user_doc = {
         "user_id": user_id,
         "email": data.email,
+        "email_lower": data.email.lower(),
         "name": data.name,
+        "name_lower": data.name.lower(),
         "password_hash": hash_password(data.password),
         "role": data.role,
         "phone": data.phone,
@@ -201,6 +276,7 @@ async def register(data: UserRegister):
         "created_at": datetime.now(timezone.utc).isoformat()
     }
     await db.users.insert_one(user_doc)
+    await link_registry_entries(user_doc)
 
     token = create_jwt(user_id, data.role)
     user_response = {k: v for k, v in user_doc.items() if k not in ("password_hash", "_id")}
@@ -319,7 +395,9 @@ async def _create_or_login_oauth_user(email: str, name: str, avatar: str, provid
         user = {
             "user_id": user_id,
             "email": email,
+            "email_lower": email.lower(),
             "name": name,
+            "name_lower": name.lower(),
             "avatar": avatar,
             "role": "client",
             "phone": None,
@@ -331,9 +409,10 @@ async def _create_or_login_oauth_user(email: str, name: str, avatar: str, provid
             "created_at": datetime.now(timezone.utc).isoformat()
         }
         await db.users.insert_one(user)
+        await link_registry_entries(user)
         user = await db.users.find_one({"email": email}, {"_id": 0})
     else:
-        update = {"name": name, "oauth_provider": provider}
+        update = {"name": name, "name_lower": name.lower(), "oauth_provider": provider}
         if avatar:
             update["avatar"] = avatar
         await db.users.update_one({"email": email}, {"$set": update})
@@ -370,15 +449,21 @@ async def list_products(
     min_price: Optional[float] = None,
     max_price: Optional[float] = None,
     region: Optional[str] = None,
+    sort: str = "newest",
     page: int = 1,
-    limit: int = 20
+    limit: int = 20,
+    user: Optional[dict] = Depends(get_optional_user)
 ):
+    if sort not in PRODUCT_SORTS:
+        raise HTTPException(status_code=400, detail="Invalid sort")
     query = {"status": "active"}
     if category:
         query["category"] = category
     if region:
         query["region"] = {"$regex": region, "$options": "i"}
-    if search:
+    if search and sort == "relevance":
+        query["$text"] = {"$search": search}
+    elif search:
         query["$or"] = [
             {"title": {"$regex": search, "$options": "i"}},
             {"description": {"$regex": search, "$options": "i"}},
@@ -393,7 +478,21 @@ async def list_products(
 
     skip = (page - 1) * limit
     total = await db.products.count_documents(query)
-    products = await db.products.find(query, {"_id": 0}).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
+    if sort == "relevance" and search:
+        # Text match weighted by the precomputed rank; only the matched set is scored
+        pipeline = [
+            {"$match": query},
+            {"$addFields": {"relevance": {"$multiply": [{"$meta": "textScore"}, {"$add": [1, {"$ifNull": ["$rank_score", 0]}]}]}}},
+            {"$sort": {"relevance": -1, "product_id": 1}},
+            {"$skip": skip},
+            {"$limit": limit},
+            {"$project": {"_id": 0}}
+        ]
+        products = await db.products.aggregate(pipeline).to_list(limit)
+    elif sort == "relevance":
+        products = await db.products.find(query, {"_id": 0}).sort([("rank_score", -1), ("product_id", 1)]).skip(skip).limit(limit).to_list(limit)
+    else:
+        products = await db.products.find(query, {"_id": 0}).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
 
     # Attach seller info (batch query)
     seller_ids = list(set(p.get("seller_id") for p in products if p.get("seller_id")))
@@ -402,23 +501,52 @@ async def list_products(
     for p in products:
         p["seller"] = sellers_map.get(p.get("seller_id"))
 
+    if user:
+        favorited = await _favorited_ids(user["user_id"], [p["product_id"] for p in products])
+        for p in products:
+            p["is_favorite"] = p["product_id"] in favorited
+
     return {"products": products, "total": total, "page": page, "pages": (total + limit - 1) // limit}
 
+PRODUCT_CATEGORIES = [
+    {"id": "food", "name_ru": "Продукты питания", "name_en": "Food & Agriculture", "name_zh": "食品与农业", "icon": "apple"},
+    {"id": "services", "name_ru": "Услуги", "name_en": "Services", "name_zh": "服务", "icon": "wrench"},
+    {"id": "construction", "name_ru": "Строительство", "name_en": "Construction", "name_zh": "建筑", "icon": "building"},
+    {"id": "transport", "name_ru": "Транспорт", "name_en": "Transport", "name_zh": "交通运输", "icon": "truck"},
+    {"id": "electronics", "name_ru": "Электроника", "name_en": "Electronics", "name_zh": "电子产品", "icon": "cpu"},
+    {"id": "clothing", "name_ru": "Одежда", "name_en": "Clothing", "name_zh": "服装", "icon": "shirt"},
+    {"id": "health", "name_ru": "Здоровье", "name_en": "Health & Wellness", "name_zh": "健康与保健", "icon": "heart-pulse"},
+    {"id": "education", "name_ru": "Образование", "name_en": "Education", "name_zh": "教育", "icon": "graduation-cap"},
+    {"id": "realestate", "name_ru": "Недвижимость", "name_en": "Real Estate", "name_zh": "房地产", "icon": "home"},
+    {"id": "other", "name_ru": "Другое", "name_en": "Other", "name_zh": "其他", "icon": "package"}
+]
+PRODUCT_CATEGORIES_JSON = json.dumps(PRODUCT_CATEGORIES, ensure_ascii=False).encode()
+
 @api_router.get("/products/categories")
 async def get_categories():
-    categories = [
-        {"id": "food", "name_ru": "Продукты питания", "name_en": "Food & Agriculture", "name_zh": "食品与农业", "icon": "apple"},
-        {"id": "services", "name_ru": "Услуги", "name_en": "Services", "name_zh": "服务", "icon": "wrench"},
-        {"id": "construction", "name_ru": "Строительство", "name_en": "Construction", "name_zh": "建筑", "icon": "building"},
-        {"id": "transport", "name_ru": "Транспорт", "name_en": "Transport", "name_zh": "交通运输", "icon": "truck"},
-        {"id": "electronics", "name_ru": "Электроника", "name_en": "Electronics", "name_zh": "电子产品", "icon": "cpu"},
-        {"id": "clothing", "name_ru": "Одежда", "name_en": "Clothing", "name_zh": "服装", "icon": "shirt"},
-        {"id": "health", "name_ru": "Здоровье", "name_en": "Health & Wellness", "name_zh": "健康与保健", "icon": "heart-pulse"},
-        {"id": "education", "name_ru": "Образование", "name_en": "Education", "name_zh": "教育", "icon": "graduation-cap"},
-        {"id": "realestate", "name_ru": "Недвижимость", "name_en": "Real Estate", "name_zh": "房地产", "icon": "home"},
-        {"id": "other", "name_ru": "Другое", "name_en": "Other", "name_zh": "其他", "icon": "package"}
-    ]
-    return categories
+    return Response(content=PRODUCT_CATEGORIES_JSON, media_type="application/json")
+
+PRODUCTS_BATCH_MAX = 100
+SELLER_SUMMARY_PROJECTION = {"_id": 0, "user_id": 1, "name": 1, "avatar": 1, "role": 1, "is_verified": 1}
+
+@api_router.get("/products/batch")
+async def get_products_batch(ids: str):
+    """Several products with seller summaries in two queries, in the order requested"""
+    product_ids = list(dict.fromkeys(i.strip() for i in ids.split(",") if i.strip()))
+    if not product_ids or len(product_ids) > PRODUCTS_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"Provide 1-{PRODUCTS_BATCH_MAX} product ids")
+    found = await db.products.find({"product_id": {"$in": product_ids}}, {"_id": 0}).to_list(len(product_ids))
+    by_id = {p["product_id"]: p for p in found}
+    seller_ids = list({p["seller_id"] for p in found if p.get("seller_id")})
+    sellers = await db.users.find({"user_id": {"$in": seller_ids}}, SELLER_SUMMARY_PROJECTION).to_list(len(seller_ids))
+    sellers_map = {s["user_id"]: s for s in sellers}
+    products = []
+    for product_id in product_ids:
+        product = by_id.get(product_id)
+        if product:
+            product["seller"] = sellers_map.get(product.get("seller_id"))
+            products.append(product)
+    return {"products": products, "missing": [i for i in product_ids if i not in by_id]}
 
 @api_router.get("/products/{product_id}")
 async def get_product(product_id: str):
@@ -450,11 +578,15 @@ async def create_product(data: ProductCreate, user: dict = Depends(get_current_u
         "exchange_available": data.exchange_available,
         "status": "active",
         "views": 0,
+        "favorites_count": 0,
         "created_at": datetime.now(timezone.utc).isoformat(),
         "updated_at": datetime.now(timezone.utc).isoformat()
     }
+    product_doc["rank_score"] = compute_rank_score(product_doc, bool(user.get("is_verified")), datetime.now(timezone.utc))
     await db.products.insert_one(product_doc)
     product_doc.pop("_id", None)
+    invalidate_product_status_counts()
+    exchange_graph.schedule_products([product_id])
     return product_doc
 
 @api_router.put("/products/{product_id}")
@@ -468,6 +600,7 @@ async def update_product(product_id: str, data: ProductUpdate, user: dict = Depe
     update_data = {k: v for k, v in data.model_dump().items() if v is not None}
     update_data["updated_at"] = datetime.now(timezone.utc).isoformat()
     await db.products.update_one({"product_id": product_id}, {"$set": update_data})
+    exchange_graph.schedule_products([product_id])
     updated = await db.products.find_one({"product_id": product_id}, {"_id": 0})
     return updated
 
@@ -479,6 +612,8 @@ async def delete_product(product_id: str, user: dict = Depends(get_current_user)
     if product["seller_id"] != user["user_id"] and user["role"] != "admin":
         raise HTTPException(status_code=403, detail="Not authorized")
     await db.products.delete_one({"product_id": product_id})
+    invalidate_product_status_counts()
+    exchange_graph.schedule_products([product_id])
     return {"message": "Product deleted"}
 
 @api_router.get("/my-products")
@@ -486,6 +621,108 @@ async def get_my_products(user: dict = Depends(get_current_user)):
     products = await db.products.find({"seller_id": user["user_id"]}, {"_id": 0}).sort("created_at", -1).to_list(1000)
     return products
 
+# ============ PRODUCT RANKING ============
+
+PRODUCT_SORTS = ("newest", "relevance")
+RANK_REFRESH_SECONDS = int(os.environ.get('RANK_REFRESH_SECONDS', '3600'))
+RANK_BATCH_SIZE = 500
+RANK_HALF_LIFE_DAYS = 14
+RANK_WEIGHTS = {"recency": 0.4, "views": 0.25, "favorites": 0.25, "verified": 0.1}
+RANK_VIEWS_CAP = 1000
+RANK_FAVORITES_CAP = 100
+
+def compute_rank_score(product: dict, seller_verified: bool, now: datetime) -> float:
+    """Query-independent quality in [0, 1]: recency decay, popularity and seller verification"""
+    try:
+        created = datetime.fromisoformat(product.get("created_at"))
+        age_days = max((now - created).total_seconds() / 86400, 0)
+    except (TypeError, ValueError):
+        age_days = RANK_HALF_LIFE_DAYS * 10
+    recency = 0.5 ** (age_days / RANK_HALF_LIFE_DAYS)
+    views = min(math.log1p(product.get("views") or 0) / math.log1p(RANK_VIEWS_CAP), 1.0)
+    favorites = min(math.log1p(product.get("favorites_count") or 0) / math.log1p(RANK_FAVORITES_CAP), 1.0)
+    score = (
+        RANK_WEIGHTS["recency"] * recency
+        + RANK_WEIGHTS["views"] * views
+        + RANK_WEIGHTS["favorites"] * favorites
+        + RANK_WEIGHTS["verified"] * (1.0 if seller_verified else 0.0)
+    )
+    return round(score, 6)
+
+class ProductRanker:
+    """Keeps products.rank_score current: a periodic full pass (recency decays with time)
+    plus background refreshes for the products a write touched."""
+
+    def __init__(self):
+        self._task = None
+        self._pending = set()
+
+    async def refresh(self, query: Optional[dict] = None) -> int:
+        now = datetime.now(timezone.utc)
+        updated = 0
+        cursor = db.products.find(
+            query or {}, {"_id": 0, "product_id": 1, "seller_id": 1, "created_at": 1, "views": 1, "favorites_count": 1}
+        ).batch_size(RANK_BATCH_SIZE)
+        batch = []
+
+        async def flush(products):
+            seller_ids = list({p.get("seller_id") for p in products if p.get("seller_id")})
+            verified = {
+                u["user_id"] async for u in db.users.find(
+                    {"user_id": {"$in": seller_ids}, "is_verified": True}, {"_id": 0, "user_id": 1}
+                )
+            }
+            ops = [
+                UpdateOne(
+                    {"product_id": p["product_id"]},
+                    {"$set": {"rank_score": compute_rank_score(p, p.get("seller_id") in verified, now)}}
+                )
+                for p in products
+            ]
+            await db.products.bulk_write(ops, ordered=False)
+            return len(ops)
+
+        async for product in cursor:
+            batch.append(product)
+            if len(batch) >= RANK_BATCH_SIZE:
+                updated += await flush(batch)
+                batch = []
+        if batch:
+            updated += await flush(batch)
+        return updated
+
+    def schedule(self, query: dict):
+        task = asyncio.create_task(self.refresh(query))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    def schedule_products(self, product_ids: List[str]):
+        self.schedule({"product_id": {"$in": list(product_ids)}})
+
+    def schedule_sellers(self, seller_ids: List[str]):
+        self.schedule({"seller_id": {"$in": list(seller_ids)}})
+
+    async def start(self):
+        self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _refresh_loop(self):
+        while True:
+            try:
+                count = await self.refresh()
+                logger.info(f"Rank scores refreshed for {count} products")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Rank score refresh failed: {e}")
+            await asyncio.sleep(RANK_REFRESH_SECONDS)
+
+product_ranker = ProductRanker()
+
 # ============ DEALS ENDPOINTS ============
 
 @api_router.post("/deals")
@@ -523,10 +760,12 @@ async def create_deal(data: DealCreate, user: dict = Depends(get_current_user)):
     deal_doc.pop("_id", None)
     return deal_doc
 
+def _deals_query(user: dict) -> dict:
+    return {"$or": [{"buyer_id": user["user_id"]}, {"seller_id": user["user_id"]}]}
+
 @api_router.get("/deals")
 async def list_deals(user: dict = Depends(get_current_user)):
-    query = {"$or": [{"buyer_id": user["user_id"]}, {"seller_id": user["user_id"]}]}
-    deals = await db.deals.find(query, {"_id": 0}).sort("created_at", -1).to_list(1000)
+    deals = await db.deals.find(_deals_query(user), {"_id": 0}).sort("created_at", -1).to_list(1000)
     return deals
 
 @api_router.put("/deals/{deal_id}/confirm")
@@ -573,11 +812,149 @@ async def cancel_deal(deal_id: str, user: dict = Depends(get_current_user)):
 
 # ============ MEETINGS ENDPOINTS ============
 
+# Meeting times are entered in the cooperative's local time and stored as UTC ISO strings
+MEETING_TZ = timezone(timedelta(hours=int(os.environ.get('MEETING_TZ_OFFSET_HOURS', '3'))))
+MEETING_WORK_START_HOUR = 9
+MEETING_WORK_END_HOUR = 18
+MEETING_DEFAULT_DURATION_MIN = 60
+MEETING_MAX_DURATION_MIN = 480
+MEETING_AVAILABILITY_MAX_DAYS = 31
+MEETING_CLAIM_BATCH = 20
+PREFERRED_DATE_FORMATS = ("%Y-%m-%d %H:%M", "%d.%m.%Y %H:%M", "%d.%m.%Y", "%Y-%m-%d")
+
+def parse_preferred_date(value: Optional[str]) -> Optional[datetime]:
+    """Parse a free-form preferred date into an aware UTC datetime; date-only values start the working day"""
+    if not value:
+        return None
+    value = value.strip()
+    parsed = None
+    has_time = True
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        has_time = len(value) > 10
+    except ValueError:
+        for fmt in PREFERRED_DATE_FORMATS:
+            try:
+                parsed = datetime.strptime(value, fmt)
+                has_time = "%H" in fmt
+                break
+            except ValueError:
+                continue
+    if parsed is None:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=MEETING_TZ)
+    if not has_time:
+        parsed = parsed.replace(hour=MEETING_WORK_START_HOUR, minute=0)
+    return parsed.astimezone(timezone.utc).replace(second=0, microsecond=0)
+
+def _iso(dt: datetime) -> str:
+    return dt.astimezone(timezone.utc).isoformat()
+
+def _working_windows(day_from: datetime, day_to: datetime) -> list:
+    """Working-hour windows (UTC) for every local day in [day_from, day_to]"""
+    windows = []
+    day = day_from.astimezone(MEETING_TZ).replace(hour=0, minute=0, second=0, microsecond=0)
+    last = day_to.astimezone(MEETING_TZ)
+    while day <= last:
+        start = day.replace(hour=MEETING_WORK_START_HOUR)
+        end = day.replace(hour=MEETING_WORK_END_HOUR)
+        windows.append((start.astimezone(timezone.utc), end.astimezone(timezone.utc)))
+        day += timedelta(days=1)
+    return windows
+
+def _free_windows(busy: list, windows: list) -> list:
+    """Sweep-line subtraction of busy intervals (sorted by start) from sorted windows"""
+    merged = []
+    for start, end in busy:
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+
+    free = []
+    i = 0
+    for win_start, win_end in windows:
+        while i < len(merged) and merged[i][1] <= win_start:
+            i += 1
+        cursor = win_start
+        j = i
+        while j < len(merged) and merged[j][0] < win_end:
+            if merged[j][0] > cursor:
+                free.append((cursor, merged[j][0]))
+            cursor = max(cursor, merged[j][1])
+            j += 1
+        if cursor < win_end:
+            free.append((cursor, win_end))
+    return free
+
+async def _busy_intervals(rep_id: str, start: datetime, end: datetime) -> list:
+    """One indexed range query: the representative's assigned meetings overlapping [start, end)"""
+    # Meetings are capped at MEETING_MAX_DURATION_MIN, which bounds the scan from below
+    earliest = start - timedelta(minutes=MEETING_MAX_DURATION_MIN)
+    cursor = db.meetings.find(
+        {
+            "representative_id": rep_id,
+            "status": "assigned",
+            "start_at": {"$gte": _iso(earliest), "$lt": _iso(end)},
+            "end_at": {"$gt": _iso(start)}
+        },
+        {"_id": 0, "start_at": 1, "end_at": 1}
+    ).sort("start_at", 1)
+    return [
+        (datetime.fromisoformat(m["start_at"]), datetime.fromisoformat(m["end_at"]))
+        async for m in cursor
+    ]
+
+async def _find_schedule_conflict(rep_id: str, meeting: dict) -> Optional[dict]:
+    if not meeting.get("start_at"):
+        return None
+    return await db.meetings.find_one(
+        {
+            "representative_id": rep_id,
+            "status": "assigned",
+            "meeting_id": {"$ne": meeting["meeting_id"]},
+            "start_at": {"$lt": meeting["end_at"]},
+            "end_at": {"$gt": meeting["start_at"]}
+        },
+        {"_id": 0, "meeting_id": 1, "start_at": 1, "end_at": 1}
+    )
+
+async def _suggest_slots(rep_id: str, meeting: dict, count: int = 5) -> list:
+    """First free slots of the meeting's length within a week of the requested time"""
+    start = datetime.fromisoformat(meeting["start_at"])
+    duration = timedelta(minutes=meeting.get("duration_minutes") or MEETING_DEFAULT_DURATION_MIN)
+    range_end = start + timedelta(days=7)
+    busy = await _busy_intervals(rep_id, start, range_end)
+    windows = [(max(ws, start), we) for ws, we in _working_windows(start, range_end) if we > start]
+    slots = []
+    for free_start, free_end in _free_windows(busy, windows):
+        slot_start = free_start
+        while slot_start + duration <= free_end and len(slots) < count:
+            slots.append({"start_at": _iso(slot_start), "end_at": _iso(slot_start + duration)})
+            slot_start += duration
+        if len(slots) >= count:
+            break
+    return slots
+
+async def _raise_schedule_conflict(rep_id: str, meeting: dict):
+    conflict = await _find_schedule_conflict(rep_id, meeting)
+    if conflict:
+        raise HTTPException(status_code=409, detail={
+            "message": "Representative is busy at this time",
+            "conflict": conflict,
+            "suggestions": await _suggest_slots(rep_id, meeting)
+        })
+
 @api_router.post("/meetings")
 async def request_meeting(data: MeetingRequest, user: dict = Depends(get_current_user)):
     product = await db.products.find_one({"product_id": data.product_id}, {"_id": 0})
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
+    duration = data.duration_minutes or MEETING_DEFAULT_DURATION_MIN
+    if not 15 <= duration <= MEETING_MAX_DURATION_MIN:
+        raise HTTPException(status_code=400, detail="Invalid duration")
+    start_at = parse_preferred_date(data.preferred_date)
 
     meeting_id = f"meet_{uuid.uuid4().hex[:12]}"
     meeting_doc = {
@@ -590,6 +967,9 @@ async def request_meeting(data: MeetingRequest, user: dict = Depends(get_current
         "representative_id": None,
         "status": "pending",
         "preferred_date": data.preferred_date,
+        "start_at": _iso(start_at) if start_at else None,
+        "end_at": _iso(start_at + timedelta(minutes=duration)) if start_at else None,
+        "duration_minutes": duration,
         "message": data.message,
         "result": None,
         "created_at": datetime.now(timezone.utc).isoformat()
@@ -598,126 +978,866 @@ async def request_meeting(data: MeetingRequest, user: dict = Depends(get_current
     meeting_doc.pop("_id", None)
     return meeting_doc
 
+MEETING_QUEUE_VIEWS = ("pending", "mine", "completed")
+
+def _meetings_query(user: dict) -> dict:
+    if user["role"] in ("admin", "representative"):
+        return {}
+    return {"$or": [{"client_id": user["user_id"]}, {"seller_id": user["user_id"]}]}
+
 @api_router.get("/meetings")
 async def list_meetings(user: dict = Depends(get_current_user)):
-    if user["role"] in ("admin", "representative"):
-        meetings = await db.meetings.find({}, {"_id": 0}).sort("created_at", -1).to_list(1000)
-    else:
-        query = {"$or": [{"client_id": user["user_id"]}, {"seller_id": user["user_id"]}]}
-        meetings = await db.meetings.find(query, {"_id": 0}).sort("created_at", -1).to_list(1000)
+    meetings = await db.meetings.find(_meetings_query(user), {"_id": 0}).sort("created_at", -1).to_list(1000)
     return meetings
 
+@api_router.get("/meetings/queue")
+async def meetings_queue(
+    user: dict = Depends(get_current_user),
+    view: str = "pending",
+    page: int = 1,
+    limit: int = 20
+):
+    """Paginated work queue for representatives: pending, assigned to me, completed"""
+    if user["role"] not in ("admin", "representative"):
+        raise HTTPException(status_code=403, detail="Not authorized")
+    if view not in MEETING_QUEUE_VIEWS:
+        raise HTTPException(status_code=400, detail="Invalid view")
+    page = max(page, 1)
+    limit = min(max(limit, 1), 100)
+
+    if view == "pending":
+        # Oldest first, so the queue is worked in arrival order
+        query = {"status": "pending"}
+        sort = [("created_at", 1)]
+    elif view == "mine":
+        query = {"representative_id": user["user_id"], "status": "assigned"}
+        sort = [("created_at", 1)]
+    else:
+        query = {"status": "completed"}
+        if user["role"] == "representative":
+            query["representative_id"] = user["user_id"]
+        sort = [("created_at", -1)]
+
+    skip = (page - 1) * limit
+    total = await db.meetings.count_documents(query)
+    meetings = await db.meetings.find(query, {"_id": 0}).sort(sort).skip(skip).limit(limit).to_list(limit)
+    return {"meetings": meetings, "total": total, "page": page, "pages": (total + limit - 1) // limit}
+
+@api_router.get("/meetings/availability")
+async def meetings_availability(
+    date_from: str,
+    date_to: Optional[str] = None,
+    representative_id: Optional[str] = None,
+    slot_minutes: int = MEETING_DEFAULT_DURATION_MIN,
+    user: dict = Depends(get_current_user)
+):
+    """Free working-hour windows per representative for a date range"""
+    range_start = parse_preferred_date(date_from[:10])
+    range_end = parse_preferred_date((date_to or date_from)[:10])
+    if not range_start or not range_end or range_end < range_start:
+        raise HTTPException(status_code=400, detail="Invalid date range")
+    if (range_end - range_start).days >= MEETING_AVAILABILITY_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"Date range is limited to {MEETING_AVAILABILITY_MAX_DAYS} days")
+
+    rep_query = {"role": "representative"}
+    if representative_id:
+        rep_query["user_id"] = representative_id
+    reps = await db.users.find(rep_query, {"_id": 0, "user_id": 1, "name": 1}).to_list(200)
+
+    windows = _working_windows(range_start, range_end)
+    window_start, window_end = windows[0][0], windows[-1][1]
+    busy_lists = await asyncio.gather(*[_busy_intervals(r["user_id"], window_start, window_end) for r in reps])
+    min_slot = timedelta(minutes=slot_minutes)
+
+    result = []
+    for rep, busy in zip(reps, busy_lists):
+        free = [
+            {"start_at": _iso(start), "end_at": _iso(end)}
+            for start, end in _free_windows(busy, windows)
+            if end - start >= min_slot
+        ]
+        result.append({"representative_id": rep["user_id"], "name": rep.get("name", ""), "free": free})
+    return {"date_from": _iso(window_start), "date_to": _iso(window_end), "representatives": result}
+
+UNCLAIMED_MEETING = {"status": "pending", "representative_id": None, "assigned_at": None, "claim_id": None}
+
+def _claim_fields(rep_id: str) -> dict:
+    return {
+        "representative_id": rep_id,
+        "status": "assigned",
+        "assigned_at": datetime.now(timezone.utc).isoformat(),
+        "claim_id": uuid.uuid4().hex
+    }
+
+async def _claim_meeting(query: dict, rep_id: str) -> Optional[dict]:
+    """Atomically move a pending meeting to assigned; None if someone else got there first"""
+    return await db.meetings.find_one_and_update(
+        {**query, "status": "pending"},
+        {"$set": _claim_fields(rep_id)},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
+    )
+
+async def _settle_claim(meeting: dict, previous: dict) -> bool:
+    """Re-check the calendar once the claim is written; the earlier of two overlapping claims wins.
+
+    The pre-claim conflict check can't see a concurrent claim for the same representative, so
+    the loser (later assigned_at, then claim_id) restores its meeting to `previous` and returns False.
+    """
+    if not meeting.get("start_at"):
+        return True
+    earlier = await db.meetings.find_one(
+        {
+            "representative_id": meeting["representative_id"],
+            "status": "assigned",
+            "meeting_id": {"$ne": meeting["meeting_id"]},
+            "start_at": {"$lt": meeting["end_at"]},
+            "end_at": {"$gt": meeting["start_at"]},
+            "$or": [
+                {"assigned_at": {"$lt": meeting["assigned_at"]}},
+                {"assigned_at": meeting["assigned_at"], "claim_id": {"$lt": meeting["claim_id"]}}
+            ]
+        },
+        {"_id": 0, "meeting_id": 1}
+    )
+    if not earlier:
+        return True
+    await db.meetings.update_one(
+        {"meeting_id": meeting["meeting_id"], "claim_id": meeting["claim_id"]},
+        {"$set": previous}
+    )
+    return False
+
+@api_router.post("/meetings/claim-next")
+async def claim_next_meeting(user: dict = Depends(get_current_user)):
+    if user["role"] not in ("admin", "representative"):
+        raise HTTPException(status_code=403, detail="Not authorized")
+    # Take the oldest pending meeting that fits the representative's calendar, paging through the queue
+    query = {"status": "pending"}
+    conflicted = False
+    while True:
+        candidates = await db.meetings.find(
+            query, {"_id": 0, "meeting_id": 1, "created_at": 1, "start_at": 1, "end_at": 1}
+        ).sort([("created_at", 1), ("meeting_id", 1)]).limit(MEETING_CLAIM_BATCH).to_list(MEETING_CLAIM_BATCH)
+        for candidate in candidates:
+            if await _find_schedule_conflict(user["user_id"], candidate):
+                conflicted = True
+                continue
+            meeting = await _claim_meeting({"meeting_id": candidate["meeting_id"]}, user["user_id"])
+            if meeting:
+                if await _settle_claim(meeting, UNCLAIMED_MEETING):
+                    return meeting
+                conflicted = True
+        if len(candidates) < MEETING_CLAIM_BATCH:
+            break
+        last = candidates[-1]
+        query = {"status": "pending", **keyset_after("created_at", last["created_at"], "meeting_id", last["meeting_id"], descending=False)}
+    if conflicted:
+        raise HTTPException(status_code=409, detail="No pending meeting fits your schedule")
+    raise HTTPException(status_code=404, detail="No pending meetings")
+
+@api_router.put("/meetings/{meeting_id}/claim")
+async def claim_meeting(meeting_id: str, user: dict = Depends(get_current_user)):
+    if user["role"] not in ("admin", "representative"):
+        raise HTTPException(status_code=403, detail="Not authorized")
+    existing = await db.meetings.find_one({"meeting_id": meeting_id}, {"_id": 0})
+    if not existing:
+        raise HTTPException(status_code=404, detail="Meeting not found")
+    await _raise_schedule_conflict(user["user_id"], existing)
+    meeting = await _claim_meeting({"meeting_id": meeting_id}, user["user_id"])
+    if not meeting:
+        raise HTTPException(status_code=409, detail="Meeting already claimed")
+    if not await _settle_claim(meeting, UNCLAIMED_MEETING):
+        await _raise_schedule_conflict(user["user_id"], meeting)
+        raise HTTPException(status_code=409, detail="Representative is busy at this time")
+    return meeting
+
 @api_router.put("/meetings/{meeting_id}/assign")
 async def assign_representative(meeting_id: str, request: Request, user: dict = Depends(get_current_user)):
     if user["role"] not in ("admin", "representative"):
         raise HTTPException(status_code=403, detail="Not authorized")
     body = await request.json()
     rep_id = body.get("representative_id", user["user_id"])
-    await db.meetings.update_one(
-        {"meeting_id": meeting_id},
-        {"$set": {"representative_id": rep_id, "status": "assigned"}}
+    # Representatives may only take unclaimed meetings; admins may also reassign open ones
+    if user["role"] == "admin":
+        guard = {"status": {"$in": ["pending", "assigned"]}}
+    else:
+        if rep_id != user["user_id"]:
+            raise HTTPException(status_code=403, detail="Not authorized")
+        guard = {"status": "pending"}
+    meeting = await db.meetings.find_one({"meeting_id": meeting_id}, {"_id": 0})
+    if not meeting:
+        raise HTTPException(status_code=404, detail="Meeting not found")
+    await _raise_schedule_conflict(rep_id, meeting)
+    previous = {k: meeting.get(k) for k in UNCLAIMED_MEETING}
+    assigned = await db.meetings.find_one_and_update(
+        {"meeting_id": meeting_id, **guard},
+        {"$set": _claim_fields(rep_id)},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
     )
+    if not assigned:
+        raise HTTPException(status_code=409, detail="Meeting already claimed")
+    if not await _settle_claim(assigned, previous):
+        await _raise_schedule_conflict(rep_id, assigned)
+        raise HTTPException(status_code=409, detail="Representative is busy at this time")
     return {"message": "Representative assigned"}
 
 @api_router.put("/meetings/{meeting_id}/complete")
 async def complete_meeting(meeting_id: str, request: Request, user: dict = Depends(get_current_user)):
     body = await request.json()
-    await db.meetings.update_one(
-        {"meeting_id": meeting_id},
-        {"$set": {"status": "completed", "result": body.get("result", "")}}
+    query = {"meeting_id": meeting_id, "status": "assigned"}
+    if user["role"] != "admin":
+        # Only the assigned representative may close the meeting; checked in the same write
+        query["representative_id"] = user["user_id"]
+    result = await db.meetings.update_one(
+        query,
+        {"$set": {
+            "status": "completed",
+            "result": body.get("result", ""),
+            "completed_at": datetime.now(timezone.utc).isoformat()
+        }}
     )
+    if result.matched_count == 0:
+        meeting = await db.meetings.find_one({"meeting_id": meeting_id}, {"_id": 0, "status": 1, "representative_id": 1})
+        if not meeting:
+            raise HTTPException(status_code=404, detail="Meeting not found")
+        if meeting.get("status") != "assigned":
+            raise HTTPException(status_code=409, detail=f"Meeting is {meeting.get('status')}")
+        raise HTTPException(status_code=403, detail="Not authorized")
     return {"message": "Meeting completed"}
 
 # ============ FAVORITES ENDPOINTS ============
 
+FAVORITE_STATUS_MAX_IDS = 200
+
+@api_router.post("/favorites/status")
+async def favorites_status(data: FavoriteStatusRequest, user: dict = Depends(get_current_user)):
+    """Membership bitmap for a page of products, aligned with the requested ids"""
+    if len(data.product_ids) > FAVORITE_STATUS_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {FAVORITE_STATUS_MAX_IDS} ids per request")
+    favorited = await _favorited_ids(user["user_id"], data.product_ids)
+    return {"product_ids": data.product_ids, "favorited": [pid in favorited for pid in data.product_ids]}
+
+async def _favorited_ids(user_id: str, product_ids: List[str]) -> set:
+    # Covered by the unique (user_id, product_id) index
+    if not product_ids:
+        return set()
+    favs = await db.favorites.find(
+        {"user_id": user_id, "product_id": {"$in": list(set(product_ids))}},
+        {"_id": 0, "product_id": 1}
+    ).to_list(len(product_ids))
+    return {f["product_id"] for f in favs}
+
 @api_router.post("/favorites/{product_id}")
 async def add_favorite(product_id: str, user: dict = Depends(get_current_user)):
-    existing = await db.favorites.find_one(
-        {"user_id": user["user_id"], "product_id": product_id}, {"_id": 0}
-    )
-    if existing:
+    # Upsert on the unique (user_id, product_id) index instead of find-then-insert
+    try:
+        result = await db.favorites.update_one(
+            {"user_id": user["user_id"], "product_id": product_id},
+            {"$setOnInsert": {"created_at": datetime.now(timezone.utc).isoformat()}},
+            upsert=True
+        )
+    except DuplicateKeyError:
         return {"message": "Already in favorites"}
-    await db.favorites.insert_one({
-        "user_id": user["user_id"],
-        "product_id": product_id,
-        "created_at": datetime.now(timezone.utc).isoformat()
-    })
+    if result.upserted_id is None:
+        return {"message": "Already in favorites"}
+    await db.products.update_one({"product_id": product_id}, {"$inc": {"favorites_count": 1}})
+    exchange_graph.schedule_user(user["user_id"])
+    product_ranker.schedule_products([product_id])
     return {"message": "Added to favorites"}
 
 @api_router.delete("/favorites/{product_id}")
 async def remove_favorite(product_id: str, user: dict = Depends(get_current_user)):
-    await db.favorites.delete_one({"user_id": user["user_id"], "product_id": product_id})
+    result = await db.favorites.delete_one({"user_id": user["user_id"], "product_id": product_id})
+    if result.deleted_count:
+        await db.products.update_one(
+            {"product_id": product_id, "favorites_count": {"$gt": 0}},
+            {"$inc": {"favorites_count": -1}}
+        )
+        exchange_graph.schedule_user(user["user_id"])
+        product_ranker.schedule_products([product_id])
     return {"message": "Removed from favorites"}
 
 @api_router.get("/favorites")
-async def get_favorites(user: dict = Depends(get_current_user)):
-    favs = await db.favorites.find({"user_id": user["user_id"]}, {"_id": 0}).to_list(1000)
-    product_ids = [f["product_id"] for f in favs]
-    products = await db.products.find({"product_id": {"$in": product_ids}}, {"_id": 0}).to_list(1000)
-    seller_ids = list(set(p.get("seller_id") for p in products if p.get("seller_id")))
-    sellers_list = await db.users.find({"user_id": {"$in": seller_ids}}, {"_id": 0, "password_hash": 0}).to_list(len(seller_ids))
-    sellers_map = {s["user_id"]: s for s in sellers_list}
-    for p in products:
-        p["seller"] = sellers_map.get(p.get("seller_id"))
-    return products
+async def get_favorites(user: dict = Depends(get_current_user), page: int = 1, limit: int = 100):
+    page = max(page, 1)
+    limit = min(max(limit, 1), 100)
+    pipeline = [
+        {"$match": {"user_id": user["user_id"]}},
+        {"$sort": {"created_at": -1}},
+        {"$lookup": {"from": "products", "localField": "product_id", "foreignField": "product_id", "as": "product"}},
+        # Favorites pointing at deleted products have an empty lookup and are dropped here
+        {"$unwind": "$product"},
+        {"$skip": (page - 1) * limit},
+        {"$limit": limit},
+        {"$lookup": {"from": "users", "localField": "product.seller_id", "foreignField": "user_id", "as": "seller"}},
+        {"$addFields": {"product.seller": {"$ifNull": [{"$arrayElemAt": ["$seller", 0]}, None]}}},
+        {"$replaceRoot": {"newRoot": "$product"}},
+        {"$project": {"_id": 0, "seller._id": 0, "seller.password_hash": 0}}
+    ]
+    return await db.favorites.aggregate(pipeline).to_list(limit)
+
+# ============ REALTIME DELIVERY ============
+
+REALTIME_BROKER = os.environ.get('REALTIME_BROKER', 'local')  # local, mongo
+REALTIME_QUEUE_SIZE = 100
+REALTIME_KEEPALIVE_SECONDS = 25
+
+def realtime_channels(collection: str, doc: dict) -> List[str]:
+    """Channels a new document is delivered to; shared by every broker"""
+    if collection == "messages":
+        return [f"user:{doc['sender_id']}", f"user:{doc['receiver_id']}"]
+    if collection == "admin_chat":
+        thread_user_id = doc.get("thread_user_id")
+        if thread_user_id == ADMIN_CHAT_ANNOUNCEMENTS:
+            return ["all"]
+        return [f"user:{thread_user_id}", "role:admin"]
+    return []
+
+class RealtimeHub:
+    """In-process fan-out of events to connected WebSocket/SSE subscribers"""
+
+    def __init__(self):
+        self._subscribers = {}
+        self._channels = {}
+
+    def subscribe(self, user: dict) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=REALTIME_QUEUE_SIZE)
+        channels = [f"user:{user['user_id']}", f"role:{user['role']}", "all"]
+        for channel in channels:
+            self._subscribers.setdefault(channel, set()).add(queue)
+        self._channels[queue] = channels
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        for channel in self._channels.pop(queue, ()):
+            subscribers = self._subscribers.get(channel)
+            if subscribers:
+                subscribers.discard(queue)
+                if not subscribers:
+                    del self._subscribers[channel]
+
+    def dispatch(self, collection: str, doc: dict):
+        event = {"type": collection, "data": doc}
+        delivered = set()
+        for channel in realtime_channels(collection, doc):
+            for queue in self._subscribers.get(channel, ()):
+                if queue in delivered:
+                    continue
+                delivered.add(queue)
+                if queue.full():
+                    # Slow consumer: drop the oldest event rather than block publishers
+                    queue.get_nowait()
+                queue.put_nowait(event)
+
+class LocalBroker:
+    """Single-process broker: publishes go straight to the hub"""
+
+    def __init__(self, hub: RealtimeHub):
+        self.hub = hub
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def publish(self, collection: str, doc: dict):
+        self.hub.dispatch(collection, doc)
+
+class MongoChangeStreamBroker:
+    """Multi-worker broker: every worker tails inserts through Mongo change streams (requires a replica set)"""
+
+    COLLECTIONS = ("messages", "admin_chat")
+
+    def __init__(self, hub: RealtimeHub):
+        self.hub = hub
+        self._tasks = []
+
+    async def start(self):
+        self._tasks = [asyncio.create_task(self._watch(name)) for name in self.COLLECTIONS]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    async def publish(self, collection: str, doc: dict):
+        # The insert itself is the event; the change stream delivers it to all workers
+        pass
+
+    async def _watch(self, collection: str):
+        pipeline = [{"$match": {"operationType": "insert"}}]
+        while True:
+            try:
+                async with db[collection].watch(pipeline) as stream:
+                    async for change in stream:
+                        doc = change["fullDocument"]
+                        doc.pop("_id", None)
+                        self.hub.dispatch(collection, doc)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Change stream on {collection} failed: {e}")
+                await asyncio.sleep(5)
+
+realtime_hub = RealtimeHub()
+realtime = MongoChangeStreamBroker(realtime_hub) if REALTIME_BROKER == "mongo" else LocalBroker(realtime_hub)
+
+async def _realtime_user(conn) -> Optional[dict]:
+    """Browsers can't set headers on WebSocket/EventSource, so also accept ?token="""
+    try:
+        return await get_current_user(conn)
+    except HTTPException:
+        pass
+    token = conn.query_params.get("token")
+    return await _user_from_bearer_token(token) if token else None
+
+@api_router.websocket("/ws")
+async def realtime_websocket(websocket: WebSocket):
+    user = await _realtime_user(websocket)
+    if not user:
+        await websocket.close(code=4401)
+        return
+    await websocket.accept()
+    queue = realtime_hub.subscribe(user)
+
+    async def drain_client():
+        # Clients don't send anything meaningful; this just notices disconnects
+        while True:
+            await websocket.receive_text()
+
+    reader = asyncio.create_task(drain_client())
+    try:
+        while True:
+            getter = asyncio.create_task(queue.get())
+            done, _ = await asyncio.wait({getter, reader}, return_when=asyncio.FIRST_COMPLETED)
+            if reader in done:
+                getter.cancel()
+                break
+            await websocket.send_json(getter.result())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        reader.cancel()
+        realtime_hub.unsubscribe(queue)
+
+@api_router.get("/stream")
+async def realtime_sse(request: Request):
+    """Server-sent events fallback for clients that can't use WebSocket"""
+    user = await _realtime_user(request)
+    if not user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    queue = realtime_hub.subscribe(user)
+
+    async def events():
+        try:
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=REALTIME_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event['data'], ensure_ascii=False)}\n\n"
+        finally:
+            realtime_hub.unsubscribe(queue)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 # ============ MESSAGES ENDPOINTS ============
 
-@api_router.post("/messages")
-async def send_message(data: MessageCreate, user: dict = Depends(get_current_user)):
-    msg_id = f"msg_{uuid.uuid4().hex[:12]}"
-    msg_doc = {
-        "message_id": msg_id,
-        "sender_id": user["user_id"],
-        "sender_name": user.get("name", ""),
-        "receiver_id": data.receiver_id,
-        "content": data.content,
-        "deal_id": data.deal_id,
+CONVERSATION_BACKFILL_BATCH = 500
+
+def conversation_id_for(user_a: str, user_b: str) -> str:
+    """Deterministic key for a participant pair, independent of who wrote first"""
+    first, second = sorted((user_a, user_b))
+    return f"{first}:{second}"
+
+def _new_message_doc(sender: dict, receiver_id: str, content: str, deal_id: Optional[str] = None) -> dict:
+    return {
+        "message_id": f"msg_{uuid.uuid4().hex[:12]}",
+        "sender_id": sender["user_id"],
+        "sender_name": sender.get("name", ""),
+        "receiver_id": receiver_id,
+        "conversation_id": conversation_id_for(sender["user_id"], receiver_id),
+        "content": content,
+        "deal_id": deal_id,
         "read": False,
         "created_at": datetime.now(timezone.utc).isoformat()
     }
+
+def _conversation_update(msg_doc: dict) -> dict:
+    return {
+        "$set": {
+            "last_message": msg_doc["content"],
+            "last_message_id": msg_doc["message_id"],
+            "last_sender_id": msg_doc["sender_id"],
+            "last_date": msg_doc["created_at"]
+        },
+        "$setOnInsert": {
+            "participants": sorted({msg_doc["sender_id"], msg_doc["receiver_id"]}),
+            "created_at": msg_doc["created_at"]
+        },
+        "$inc": {f"unread.{msg_doc['receiver_id']}": 1}
+    }
+
+async def _touch_conversation(msg_doc: dict):
+    """Keep the materialized inbox row for this pair in step with the new message"""
+    conversation_id = msg_doc["conversation_id"]
+    update = _conversation_update(msg_doc)
+    try:
+        await db.conversations.update_one({"conversation_id": conversation_id}, update, upsert=True)
+    except DuplicateKeyError:
+        # Lost an upsert race with the other participant; the row exists now
+        await db.conversations.update_one({"conversation_id": conversation_id}, update)
+
+ADMIN_INBOX_OWNER = "admins"  # all admins share one support inbox counter
+
+def _clamped_inc(field: str, delta: int) -> list:
+    """Pipeline update adding delta to a counter without ever taking it below zero"""
+    return [{"$set": {field: {"$max": [0, {"$add": [{"$ifNull": [f"${field}", 0]}, delta]}]}}}]
+
+async def _bump_unread(owner: str, field: str, delta: int):
+    """Maintained unread counters, so badges never need to count over history"""
+    if delta > 0:
+        await db.unread_counters.update_one({"owner": owner}, {"$inc": {field: delta}}, upsert=True)
+    elif delta < 0:
+        await db.unread_counters.update_one({"owner": owner}, _clamped_inc(field, delta), upsert=True)
+
+@api_router.post("/messages")
+async def send_message(data: MessageCreate, user: dict = Depends(get_current_user)):
+    msg_doc = _new_message_doc(user, data.receiver_id, data.content, data.deal_id)
     await db.messages.insert_one(msg_doc)
     msg_doc.pop("_id", None)
+    await _touch_conversation(msg_doc)
+    await _bump_unread(data.receiver_id, "messages", 1)
+    await realtime.publish("messages", msg_doc)
     return msg_doc
 
+def _normalize_timestamp(value: str) -> str:
+    """ISO timestamp in the stored form (UTC, +00:00) so string comparisons order correctly"""
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc).isoformat()
+
+async def _message_cursor(cursor: str) -> tuple:
+    """(created_at, message_id) to page from; cursors are a message_id, an encoded cursor or an ISO timestamp"""
+    if cursor.startswith("msg_"):
+        ref = await db.messages.find_one({"message_id": cursor}, {"_id": 0, "created_at": 1, "message_id": 1})
+        if not ref:
+            raise HTTPException(status_code=400, detail="Unknown message cursor")
+        return ref["created_at"], ref["message_id"]
+    try:
+        # A bare timestamp has no tiebreak: everything at that instant is on the far side of it
+        return _normalize_timestamp(cursor), None
+    except ValueError:
+        values = decode_cursor(cursor)
+        if len(values) != 2:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        return _normalize_timestamp(values[0]), values[1]
+
+def _message_bound(created_at: str, message_id: Optional[str], op: str) -> dict:
+    """Messages on one side of (created_at, message_id); op is $lt/$gt, or $lte for an inclusive upper bound"""
+    if message_id is None:
+        return {"created_at": {op: created_at}}
+    if op == "$lte":
+        return {"$or": [{"created_at": {"$lt": created_at}}, {"created_at": created_at, "message_id": {"$lte": message_id}}]}
+    return keyset_after("created_at", created_at, "message_id", message_id, descending=op == "$lt")
+
 @api_router.get("/messages")
-async def get_messages(user: dict = Depends(get_current_user), other_user_id: Optional[str] = None):
+async def get_messages(
+    user: dict = Depends(get_current_user),
+    other_user_id: Optional[str] = None,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    limit: int = 50
+):
+    """One page of history in ascending order: the latest page by default, older with before=, newer with after="""
+    limit = min(max(limit, 1), 200)
     if other_user_id:
-        query = {"$or": [
-            {"sender_id": user["user_id"], "receiver_id": other_user_id},
-            {"sender_id": other_user_id, "receiver_id": user["user_id"]}
-        ]}
+        query = {"conversation_id": conversation_id_for(user["user_id"], other_user_id)}
     else:
         query = {"$or": [{"sender_id": user["user_id"]}, {"receiver_id": user["user_id"]}]}
-    messages = await db.messages.find(query, {"_id": 0}).sort("created_at", 1).to_list(1000)
+
+    if after:
+        query = {"$and": [query, _message_bound(*await _message_cursor(after), "$gt")]}
+        return await db.messages.find(query, {"_id": 0}).sort([("created_at", 1), ("message_id", 1)]).limit(limit).to_list(limit)
+
+    if before:
+        query = {"$and": [query, _message_bound(*await _message_cursor(before), "$lt")]}
+    messages = await db.messages.find(query, {"_id": 0}).sort([("created_at", -1), ("message_id", -1)]).limit(limit).to_list(limit)
+    messages.reverse()
     return messages
 
+@api_router.put("/messages/read")
+async def mark_messages_read(data: MessagesRead, user: dict = Depends(get_current_user)):
+    conversation_id = conversation_id_for(user["user_id"], data.other_user_id)
+    query = {"conversation_id": conversation_id, "receiver_id": user["user_id"], "read": False}
+    if data.up_to_message_id:
+        query.update(_message_bound(*await _message_cursor(data.up_to_message_id), "$lte"))
+    result = await db.messages.update_many(query, {"$set": {"read": True}})
+    if result.modified_count:
+        await db.conversations.update_one(
+            {"conversation_id": conversation_id},
+            _clamped_inc(f"unread.{user['user_id']}", -result.modified_count)
+        )
+        await _bump_unread(user["user_id"], "messages", -result.modified_count)
+    return {"marked_read": result.modified_count}
+
+@api_router.get("/messages/unread-count")
+async def unread_count(user: dict = Depends(get_current_user)):
+    owners = [user["user_id"]]
+    if user["role"] == "admin":
+        owners.append(ADMIN_INBOX_OWNER)
+    counters = await db.unread_counters.find({"owner": {"$in": owners}}, {"_id": 0}).to_list(len(owners))
+    by_owner = {c["owner"]: c for c in counters}
+    own = by_owner.get(user["user_id"], {})
+    admin_chat = by_owner.get(ADMIN_INBOX_OWNER, {}) if user["role"] == "admin" else own
+    return {
+        "messages": max(own.get("messages", 0), 0),
+        "admin_chat": max(admin_chat.get("admin_chat", 0), 0)
+    }
+
 @api_router.get("/messages/conversations")
-async def get_conversations(user: dict = Depends(get_current_user)):
-    pipeline = [
-        {"$match": {"$or": [{"sender_id": user["user_id"]}, {"receiver_id": user["user_id"]}]}},
-        {"$sort": {"created_at": -1}},
-        {"$group": {
-            "_id": {"$cond": [{"$eq": ["$sender_id", user["user_id"]]}, "$receiver_id", "$sender_id"]},
-            "last_message": {"$first": "$content"},
-            "last_date": {"$first": "$created_at"},
-            "unread": {"$sum": {"$cond": [{"$and": [{"$eq": ["$receiver_id", user["user_id"]]}, {"$eq": ["$read", False]}]}, 1, 0]}}
-        }}
-    ]
-    convos = await db.messages.aggregate(pipeline).to_list(100)
-    result = []
-    user_ids = [c["_id"] for c in convos]
+async def get_conversations(user: dict = Depends(get_current_user), page: int = 1, limit: int = 50):
+    page = max(page, 1)
+    limit = min(max(limit, 1), 100)
+    convos = await db.conversations.find(
+        {"participants": user["user_id"]}, {"_id": 0}
+    ).sort("last_date", -1).skip((page - 1) * limit).limit(limit).to_list(limit)
+
+    def other_id(c):
+        others = [p for p in c["participants"] if p != user["user_id"]]
+        return others[0] if others else user["user_id"]
+
+    user_ids = list({other_id(c) for c in convos})
     others_list = await db.users.find({"user_id": {"$in": user_ids}}, {"_id": 0, "password_hash": 0}).to_list(len(user_ids))
     others_map = {u["user_id"]: u for u in others_list}
+    result = []
     for c in convos:
         result.append({
-            "user": others_map.get(c["_id"]),
-            "last_message": c["last_message"],
-            "last_date": c["last_date"],
-            "unread": c["unread"]
+            "conversation_id": c["conversation_id"],
+            "user": others_map.get(other_id(c)),
+            "last_message": c.get("last_message"),
+            "last_date": c.get("last_date"),
+            "unread": c.get("unread", {}).get(user["user_id"], 0)
         })
     return result
 
+async def backfill_message_conversation_ids():
+    """Stamp conversation_id on messages written before it was stored"""
+    ops = []
+    cursor = db.messages.find(
+        {"conversation_id": {"$exists": False}},
+        {"_id": 1, "sender_id": 1, "receiver_id": 1}
+    )
+    async for msg in cursor:
+        ops.append(UpdateOne(
+            {"_id": msg["_id"]},
+            {"$set": {"conversation_id": conversation_id_for(msg["sender_id"], msg["receiver_id"])}}
+        ))
+        if len(ops) >= CONVERSATION_BACKFILL_BATCH:
+            await db.messages.bulk_write(ops, ordered=False)
+            ops = []
+    if ops:
+        await db.messages.bulk_write(ops, ordered=False)
+
+async def backfill_conversations():
+    """Rebuild the conversations collection from the full messages history"""
+    await backfill_message_conversation_ids()
+    pipeline = [
+        {"$sort": {"created_at": 1}},
+        {"$group": {
+            "_id": {
+                "first": {"$cond": [{"$lte": ["$sender_id", "$receiver_id"]}, "$sender_id", "$receiver_id"]},
+                "second": {"$cond": [{"$lte": ["$sender_id", "$receiver_id"]}, "$receiver_id", "$sender_id"]}
+            },
+            "last_message": {"$last": "$content"},
+            "last_message_id": {"$last": "$message_id"},
+            "last_sender_id": {"$last": "$sender_id"},
+            "last_date": {"$last": "$created_at"},
+            "created_at": {"$first": "$created_at"},
+            "unread": {"$push": {"$cond": [{"$eq": ["$read", False]}, "$receiver_id", "$$REMOVE"]}}
+        }}
+    ]
+    ops = []
+    total = 0
+    async for row in db.messages.aggregate(pipeline, allowDiskUse=True):
+        first, second = row["_id"]["first"], row["_id"]["second"]
+        unread = {}
+        for receiver_id in row["unread"]:
+            unread[receiver_id] = unread.get(receiver_id, 0) + 1
+        ops.append(UpdateOne(
+            {"conversation_id": conversation_id_for(first, second)},
+            {"$set": {
+                "participants": sorted({first, second}),
+                "last_message": row["last_message"],
+                "last_message_id": row["last_message_id"],
+                "last_sender_id": row["last_sender_id"],
+                "last_date": row["last_date"],
+                "created_at": row["created_at"],
+                "unread": unread
+            }},
+            upsert=True
+        ))
+        if len(ops) >= CONVERSATION_BACKFILL_BATCH:
+            await db.conversations.bulk_write(ops, ordered=False)
+            total += len(ops)
+            ops = []
+    if ops:
+        await db.conversations.bulk_write(ops, ordered=False)
+        total += len(ops)
+    # Per-user unread badges are derived from the same history
+    await _seed_unread_counter("messages", db.messages, [
+        {"$match": {"read": False}},
+        {"$group": {"_id": "$receiver_id", "count": {"$sum": 1}}}
+    ])
+    logger.info(f"Conversations backfill finished: {total} conversations")
+    return total
+
+async def _seed_unread_counter(field: str, collection, pipeline: list):
+    """Overwrite one counter for every owner with the count from history; owners with none drop to zero"""
+    await db.unread_counters.update_many({field: {"$ne": 0}}, {"$set": {field: 0}})
+    ops = []
+    async for row in collection.aggregate(pipeline, allowDiskUse=True):
+        ops.append(UpdateOne({"owner": row["_id"]}, {"$set": {field: row["count"]}}, upsert=True))
+        if len(ops) >= CONVERSATION_BACKFILL_BATCH:
+            await db.unread_counters.bulk_write(ops, ordered=False)
+            ops = []
+    if ops:
+        await db.unread_counters.bulk_write(ops, ordered=False)
+
+async def seed_unread_counters():
+    """Recount both unread badges from history so the maintained counters start out correct"""
+    await _seed_unread_counter("messages", db.messages, [
+        {"$match": {"read": False}},
+        {"$group": {"_id": "$receiver_id", "count": {"$sum": 1}}}
+    ])
+    # Admin replies count against their thread's user, everything else against the shared admin inbox;
+    # legacy rows without thread_user_id fall back to their recipient_id
+    await _seed_unread_counter("admin_chat", db.admin_chat, [
+        {"$match": {"read": False}},
+        {"$project": {"owner": {"$cond": [
+            {"$eq": ["$sender_role", "admin"]},
+            {"$ifNull": ["$thread_user_id", "$recipient_id"]},
+            ADMIN_INBOX_OWNER
+        ]}}},
+        {"$match": {"owner": {"$nin": [None, ADMIN_CHAT_ANNOUNCEMENTS]}}},
+        {"$group": {"_id": "$owner", "count": {"$sum": 1}}}
+    ])
+    logger.info("Unread counters seeded")
+
+@api_router.post("/admin/conversations/backfill")
+async def admin_backfill_conversations(background_tasks: BackgroundTasks, user: dict = Depends(get_current_user)):
+    if user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Admin only")
+    background_tasks.add_task(backfill_conversations)
+    return {"message": "Conversations backfill started"}
+
+# ============ BROADCASTS ============
+
+BROADCAST_BATCH_SIZE = 500
+
+async def _broadcast_recipients(data: BroadcastCreate, sender_id: str):
+    """Stream recipient ids from a cursor; never materializes the whole audience"""
+    if data.registry_status:
+        # One shareholder can own several registry entries; group so each user is messaged once
+        cursor = db.registry.aggregate([
+            {"$match": {"status": data.registry_status, "user_id": {"$nin": [None, sender_id]}}},
+            {"$group": {"_id": "$user_id"}},
+            # Same rule as the role audience: blocked or deleted accounts are skipped
+            {"$lookup": {"from": "users", "localField": "_id", "foreignField": "user_id", "as": "user"}},
+            {"$match": {"user": {"$elemMatch": {"is_blocked": {"$ne": True}}}}},
+            {"$project": {"_id": 1}}
+        ], allowDiskUse=True, batchSize=BROADCAST_BATCH_SIZE)
+        async for entry in cursor:
+            yield entry["_id"]
+        return
+    query = {"is_blocked": {"$ne": True}, "user_id": {"$ne": sender_id}}
+    if data.role:
+        query["role"] = data.role
+    cursor = db.users.find(query, {"_id": 0, "user_id": 1}).batch_size(BROADCAST_BATCH_SIZE)
+    async for u in cursor:
+        yield u["user_id"]
+
+async def _write_broadcast_batch(sender: dict, content: str, receiver_ids: List[str]):
+    docs = [_new_message_doc(sender, rid, content) for rid in receiver_ids]
+    await db.messages.insert_many(docs, ordered=False)
+    await db.conversations.bulk_write([
+        UpdateOne({"conversation_id": d["conversation_id"]}, _conversation_update(d), upsert=True)
+        for d in docs
+    ], ordered=False)
+    await db.unread_counters.bulk_write([
+        UpdateOne({"owner": rid}, {"$inc": {"messages": 1}}, upsert=True)
+        for rid in receiver_ids
+    ], ordered=False)
+    for d in docs:
+        d.pop("_id", None)
+        await realtime.publish("messages", d)
+
+async def run_broadcast(broadcast_id: str, data: BroadcastCreate, sender: dict):
+    await db.broadcasts.update_one(
+        {"broadcast_id": broadcast_id},
+        {"$set": {"status": "running", "started_at": datetime.now(timezone.utc).isoformat()}}
+    )
+    sent = 0
+    batch = []
+    try:
+        async for receiver_id in _broadcast_recipients(data, sender["user_id"]):
+            batch.append(receiver_id)
+            if len(batch) >= BROADCAST_BATCH_SIZE:
+                await _write_broadcast_batch(sender, data.content, batch)
+                sent += len(batch)
+                batch = []
+                await db.broadcasts.update_one({"broadcast_id": broadcast_id}, {"$set": {"sent": sent}})
+        if batch:
+            await _write_broadcast_batch(sender, data.content, batch)
+            sent += len(batch)
+        await db.broadcasts.update_one(
+            {"broadcast_id": broadcast_id},
+            {"$set": {"status": "completed", "sent": sent, "finished_at": datetime.now(timezone.utc).isoformat()}}
+        )
+    except Exception as e:
+        logger.error(f"Broadcast {broadcast_id} failed after {sent} messages: {e}")
+        await db.broadcasts.update_one(
+            {"broadcast_id": broadcast_id},
+            {"$set": {"status": "failed", "sent": sent, "error": str(e), "finished_at": datetime.now(timezone.utc).isoformat()}}
+        )
+
+@api_router.post("/admin/broadcasts")
+async def create_broadcast(data: BroadcastCreate, background_tasks: BackgroundTasks, user: dict = Depends(get_current_user)):
+    if user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Admin only")
+    if not data.content.strip():
+        raise HTTPException(status_code=400, detail="content required")
+    if data.role and data.role not in ("client", "shareholder", "representative", "admin"):
+        raise HTTPException(status_code=400, detail="Invalid role")
+    broadcast_id = f"bcast_{uuid.uuid4().hex[:12]}"
+    doc = {
+        "broadcast_id": broadcast_id,
+        "sender_id": user["user_id"],
+        "content": data.content,
+        "filter": {"role": data.role, "registry_status": data.registry_status},
+        "status": "queued",
+        "sent": 0,
+        "created_at": datetime.now(timezone.utc).isoformat()
+    }
+    await db.broadcasts.insert_one(doc)
+    doc.pop("_id", None)
+    background_tasks.add_task(run_broadcast, broadcast_id, data, user)
+    return doc
+
+@api_router.get("/admin/broadcasts/{broadcast_id}")
+async def get_broadcast(broadcast_id: str, user: dict = Depends(get_current_user)):
+    if user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Admin only")
+    doc = await db.broadcasts.find_one({"broadcast_id": broadcast_id}, {"_id": 0})
+    if not doc:
+        raise HTTPException(status_code=404, detail="Broadcast not found")
+    return doc
+
 # ============ ADMIN ENDPOINTS ============
 
 @api_router.get("/admin/users")
@@ -730,6 +1850,96 @@ async def admin_list_users(user: dict = Depends(get_current_user), role: Optiona
     users = await db.users.find(query, {"_id": 0, "password_hash": 0}).to_list(1000)
     return users
 
+USER_DIRECTORY_FIELDS = ("user_id", "name", "email", "phone", "inn", "role", "shareholder_number", "is_blocked", "is_verified", "created_at")
+USER_EXPORT_CHUNK = 500
+
+def _user_directory_query(
+    search: Optional[str], role: Optional[str], is_blocked: Optional[bool], is_verified: Optional[bool]
+) -> dict:
+    clauses = []
+    if role:
+        clauses.append({"role": role})
+    if is_blocked is not None:
+        clauses.append({"is_blocked": True} if is_blocked else {"is_blocked": {"$ne": True}})
+    if is_verified is not None:
+        clauses.append({"is_verified": True} if is_verified else {"is_verified": {"$ne": True}})
+    if search:
+        # Anchored, case-sensitive prefixes so each branch can use its index
+        prefix = re.escape(search.strip())
+        clauses.append({"$or": [
+            {"name_lower": {"$regex": f"^{prefix.lower()}"}},
+            {"email_lower": {"$regex": f"^{prefix.lower()}"}},
+            {"phone": {"$regex": f"^{prefix}"}},
+            {"inn": {"$regex": f"^{prefix}"}}
+        ]})
+    return {"$and": clauses} if clauses else {}
+
+@api_router.get("/admin/users/directory")
+async def admin_user_directory(
+    user: dict = Depends(get_current_user),
+    search: Optional[str] = None,
+    role: Optional[str] = None,
+    is_blocked: Optional[bool] = None,
+    is_verified: Optional[bool] = None,
+    cursor: Optional[str] = None,
+    limit: int = 50
+):
+    if user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Admin only")
+    limit = min(max(limit, 1), 200)
+    query = _user_directory_query(search, role, is_blocked, is_verified)
+    if cursor:
+        created_at, user_id = decode_cursor(cursor)
+        query = {"$and": [query, keyset_after("created_at", created_at, "user_id", user_id)]}
+    users = await db.users.find(
+        query, {"_id": 0, "password_hash": 0, "name_lower": 0, "email_lower": 0}
+    ).sort([("created_at", -1), ("user_id", -1)]).limit(limit + 1).to_list(limit + 1)
+    next_cursor = None
+    if len(users) > limit:
+        users = users[:limit]
+        next_cursor = encode_cursor([users[-1]["created_at"], users[-1]["user_id"]])
+    return {"users": users, "next_cursor": next_cursor}
+
+@api_router.get("/admin/users/export")
+async def admin_export_users(
+    user: dict = Depends(get_current_user),
+    format: str = "csv",
+    search: Optional[str] = None,
+    role: Optional[str] = None,
+    is_blocked: Optional[bool] = None,
+    is_verified: Optional[bool] = None
+):
+    """Stream the filtered directory straight off the cursor, in constant memory"""
+    if user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Admin only")
+    if format not in ("csv", "ndjson"):
+        raise HTTPException(status_code=400, detail="Invalid format")
+    query = _user_directory_query(search, role, is_blocked, is_verified)
+    projection = {"_id": 0, **{f: 1 for f in USER_DIRECTORY_FIELDS}}
+
+    async def rows():
+        cursor = db.users.find(query, projection).sort([("created_at", -1), ("user_id", -1)]).batch_size(USER_EXPORT_CHUNK)
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=USER_DIRECTORY_FIELDS, extrasaction="ignore")
+        if format == "csv":
+            writer.writeheader()
+        count = 0
+        async for u in cursor:
+            if format == "csv":
+                writer.writerow(u)
+            else:
+                buffer.write(json.dumps(u, ensure_ascii=False, default=str) + "\n")
+            count += 1
+            if count % USER_EXPORT_CHUNK == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate(0)
+        yield buffer.getvalue()
+
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    filename = f"users-{datetime.now(timezone.utc).strftime('%Y%m%d')}.{format}"
+    return StreamingResponse(rows(), media_type=media_type, headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
 @api_router.put("/admin/users/{user_id}/block")
 async def admin_block_user(user_id: str, user: dict = Depends(get_current_user)):
     if user["role"] != "admin":
@@ -746,6 +1956,7 @@ async def admin_verify_user(user_id: str, user: dict = Depends(get_current_user)
     if user["role"] != "admin":
         raise HTTPException(status_code=403, detail="Admin only")
     await db.users.update_one({"user_id": user_id}, {"$set": {"is_verified": True}})
+    product_ranker.schedule_sellers([user_id])
     return {"message": "User verified"}
 
 @api_router.put("/admin/users/{user_id}/role")
@@ -759,6 +1970,54 @@ async def admin_change_role(user_id: str, request: Request, user: dict = Depends
     await db.users.update_one({"user_id": user_id}, {"$set": {"role": new_role}})
     return {"message": f"Role changed to {new_role}"}
 
+BULK_MODERATION_MAX_IDS = 1000
+
+def _bulk_outcomes(ids: List[str], current: dict, target: dict, skipped: set = frozenset()) -> dict:
+    """Per-id result: not_found, skipped, unchanged or updated"""
+    outcomes = {}
+    for item_id in ids:
+        doc = current.get(item_id)
+        if doc is None:
+            outcomes[item_id] = "not_found"
+        elif item_id in skipped:
+            outcomes[item_id] = "skipped"
+        elif all(doc.get(k) == v for k, v in target.items()):
+            outcomes[item_id] = "unchanged"
+        else:
+            outcomes[item_id] = "updated"
+    return outcomes
+
+@api_router.put("/admin/users/bulk")
+async def admin_bulk_users(data: BulkUserModeration, user: dict = Depends(get_current_user)):
+    """Apply an explicit target state to many users with one read and one update_many"""
+    if user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Admin only")
+    ids = list(dict.fromkeys(data.user_ids))
+    if not ids or len(ids) > BULK_MODERATION_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"Provide 1-{BULK_MODERATION_MAX_IDS} user ids")
+    target = {k: v for k, v in (("is_blocked", data.is_blocked), ("is_verified", data.is_verified), ("role", data.role)) if v is not None}
+    if not target:
+        raise HTTPException(status_code=400, detail="Nothing to change")
+    if "role" in target and target["role"] not in ("client", "shareholder", "representative", "admin"):
+        raise HTTPException(status_code=400, detail="Invalid role")
+
+    current_list = await db.users.find(
+        {"user_id": {"$in": ids}}, {"_id": 0, "user_id": 1, **{k: 1 for k in target}}
+    ).to_list(len(ids))
+    current = {u["user_id"]: u for u in current_list}
+    # Admins can't lock themselves out or drop their own admin role in a sweep
+    skipped = {user["user_id"]} if target.get("is_blocked") or target.get("role", "admin") != "admin" else set()
+    outcomes = _bulk_outcomes(ids, current, target, skipped)
+    to_update = [i for i, o in outcomes.items() if o == "updated"]
+    if to_update:
+        await db.users.update_many({"user_id": {"$in": to_update}}, {"$set": target})
+        if target.get("is_blocked"):
+            # Drop the blocked users' sessions in one go
+            await db.user_sessions.delete_many({"user_id": {"$in": to_update}})
+        if "is_verified" in target:
+            product_ranker.schedule_sellers(to_update)
+    return {"updated": len(to_update), "results": outcomes}
+
 @api_router.get("/admin/products")
 async def admin_list_products(user: dict = Depends(get_current_user), status: Optional[str] = None):
     if user["role"] != "admin":
@@ -769,6 +2028,128 @@ async def admin_list_products(user: dict = Depends(get_current_user), status: Op
     products = await db.products.find(query, {"_id": 0}).sort("created_at", -1).to_list(1000)
     return products
 
+PRODUCT_STATUSES = ("active", "pending", "rejected")
+PRODUCT_STATUS_COUNTS_TTL = 30  # seconds
+PRODUCT_REVIEW_CLAIM_MINUTES = 15
+
+# Per-status counts rollup, cached in memory and dropped on every status change
+_product_status_counts = {"value": None, "expires": 0.0}
+
+def invalidate_product_status_counts():
+    _product_status_counts["value"] = None
+
+async def product_status_counts() -> dict:
+    if _product_status_counts["value"] is None or _product_status_counts["expires"] < time.monotonic():
+        rows = await db.products.aggregate([{"$group": {"_id": "$status", "count": {"$sum": 1}}}]).to_list(20)
+        _product_status_counts["value"] = {row["_id"]: row["count"] for row in rows}
+        _product_status_counts["expires"] = time.monotonic() + PRODUCT_STATUS_COUNTS_TTL
+    return {status: _product_status_counts["value"].get(status, 0) for status in PRODUCT_STATUSES}
+
+def _review_claim_free(now: datetime) -> dict:
+    """Unclaimed, or claimed so long ago that the claim has lapsed"""
+    expired = (now - timedelta(minutes=PRODUCT_REVIEW_CLAIM_MINUTES)).isoformat()
+    return {"$or": [{"review_claimed_by": None}, {"review_claimed_at": {"$lt": expired}}]}
+
+@api_router.get("/admin/products/queue")
+async def admin_products_queue(
+    user: dict = Depends(get_current_user),
+    status: str = "pending",
+    category: Optional[str] = None,
+    seller_id: Optional[str] = None,
+    unclaimed: bool = False,
+    cursor: Optional[str] = None,
+    limit: int = 50
+):
+    """Moderation queue, oldest first, with keyset pagination and per-status counts"""
+    if user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Admin only")
+    if status not in PRODUCT_STATUSES:
+        raise HTTPException(status_code=400, detail="Invalid status")
+    limit = min(max(limit, 1), 200)
+    clauses = [{"status": status}]
+    if category:
+        clauses.append({"category": category})
+    if seller_id:
+        clauses.append({"seller_id": seller_id})
+    if unclaimed:
+        clauses.append(_review_claim_free(datetime.now(timezone.utc)))
+    if cursor:
+        created_at, product_id = decode_cursor(cursor)
+        clauses.append(keyset_after("created_at", created_at, "product_id", product_id, descending=False))
+    products = await db.products.find(
+        {"$and": clauses}, {"_id": 0}
+    ).sort([("created_at", 1), ("product_id", 1)]).limit(limit + 1).to_list(limit + 1)
+    next_cursor = None
+    if len(products) > limit:
+        products = products[:limit]
+        next_cursor = encode_cursor([products[-1]["created_at"], products[-1]["product_id"]])
+    return {"products": products, "next_cursor": next_cursor, "counts": await product_status_counts()}
+
+async def _claim_product_review(query: dict, admin_id: str) -> Optional[dict]:
+    now = datetime.now(timezone.utc)
+    return await db.products.find_one_and_update(
+        {"$and": [query, {"status": "pending"}, _review_claim_free(now)]},
+        {"$set": {"review_claimed_by": admin_id, "review_claimed_at": now.isoformat()}},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
+    )
+
+@api_router.post("/admin/products/queue/claim-next")
+async def admin_claim_next_product(user: dict = Depends(get_current_user)):
+    if user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Admin only")
+    candidates = await db.products.find(
+        {"$and": [{"status": "pending"}, _review_claim_free(datetime.now(timezone.utc))]},
+        {"_id": 0, "product_id": 1}
+    ).sort([("created_at", 1), ("product_id", 1)]).limit(10).to_list(10)
+    for candidate in candidates:
+        # Another moderator may win the race for a candidate; move on to the next one
+        product = await _claim_product_review({"product_id": candidate["product_id"]}, user["user_id"])
+        if product:
+            return product
+    raise HTTPException(status_code=404, detail="No products awaiting review")
+
+@api_router.put("/admin/products/{product_id}/claim")
+async def admin_claim_product(product_id: str, user: dict = Depends(get_current_user)):
+    if user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Admin only")
+    product = await _claim_product_review({"product_id": product_id}, user["user_id"])
+    if not product:
+        existing = await db.products.find_one({"product_id": product_id}, {"_id": 0, "status": 1, "review_claimed_by": 1})
+        if not existing:
+            raise HTTPException(status_code=404, detail="Product not found")
+        if existing.get("status") != "pending":
+            raise HTTPException(status_code=409, detail=f"Product is {existing.get('status')}")
+        raise HTTPException(status_code=409, detail="Product is already being reviewed")
+    return product
+
+@api_router.put("/admin/products/bulk/status")
+async def admin_bulk_product_status(data: BulkProductStatus, user: dict = Depends(get_current_user)):
+    if user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Admin only")
+    if data.status not in ("active", "pending", "rejected"):
+        raise HTTPException(status_code=400, detail="Invalid status")
+    ids = list(dict.fromkeys(data.product_ids))
+    if not ids or len(ids) > BULK_MODERATION_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"Provide 1-{BULK_MODERATION_MAX_IDS} product ids")
+    current_list = await db.products.find(
+        {"product_id": {"$in": ids}}, {"_id": 0, "product_id": 1, "status": 1}
+    ).to_list(len(ids))
+    current = {p["product_id"]: p for p in current_list}
+    outcomes = _bulk_outcomes(ids, current, {"status": data.status})
+    to_update = [i for i, o in outcomes.items() if o == "updated"]
+    if to_update:
+        await db.products.update_many(
+            {"product_id": {"$in": to_update}},
+            {
+                "$set": {"status": data.status, "updated_at": datetime.now(timezone.utc).isoformat()},
+                "$unset": {"review_claimed_by": "", "review_claimed_at": ""}
+            }
+        )
+        invalidate_product_status_counts()
+        exchange_graph.schedule_products(to_update)
+    return {"updated": len(to_update), "results": outcomes}
+
 @api_router.put("/admin/products/{product_id}/status")
 async def admin_product_status(product_id: str, request: Request, user: dict = Depends(get_current_user)):
     if user["role"] != "admin":
@@ -777,7 +2158,12 @@ async def admin_product_status(product_id: str, request: Request, user: dict = D
     new_status = body.get("status")
     if new_status not in ("active", "pending", "rejected"):
         raise HTTPException(status_code=400, detail="Invalid status")
-    await db.products.update_one({"product_id": product_id}, {"$set": {"status": new_status}})
+    await db.products.update_one(
+        {"product_id": product_id},
+        {"$set": {"status": new_status}, "$unset": {"review_claimed_by": "", "review_claimed_at": ""}}
+    )
+    invalidate_product_status_counts()
+    exchange_graph.schedule_products([product_id])
     return {"message": f"Product status changed to {new_status}"}
 
 @api_router.get("/admin/stats")
@@ -829,9 +2215,13 @@ async def admin_list_deals(user: dict = Depends(get_current_user)):
 @api_router.put("/users/profile")
 async def update_profile(data: UserUpdate, user: dict = Depends(get_current_user)):
     update_data = {k: v for k, v in data.model_dump().items() if v is not None}
+    if "name" in update_data:
+        update_data["name_lower"] = update_data["name"].lower()
     if update_data:
         await db.users.update_one({"user_id": user["user_id"]}, {"$set": update_data})
     updated = await db.users.find_one({"user_id": user["user_id"]}, {"_id": 0, "password_hash": 0})
+    if "shareholder_number" in update_data:
+        await link_registry_entries(updated)
     return updated
 
 @api_router.get("/users/{user_id}/public")
@@ -879,9 +2269,698 @@ async def shareholder_stats(user: dict = Depends(get_current_user)):
         "meetings": meetings_count
     }
 
+# ============ DASHBOARDS ============
+
+DASHBOARD_MAX_LIMIT = 100
+
+async def _dashboard_page(collection, query: dict, limit: int, page: int = 1) -> dict:
+    items, total = await asyncio.gather(
+        collection.find(query, {"_id": 0}).sort("created_at", -1).skip((page - 1) * limit).limit(limit).to_list(limit),
+        collection.count_documents(query)
+    )
+    return {"items": items, "total": total, "page": page}
+
+async def _favorites_page(user: dict, limit: int, page: int = 1) -> dict:
+    items, total = await asyncio.gather(get_favorites(user, page, limit), db.favorites.count_documents({"user_id": user["user_id"]}))
+    return {"items": items, "total": total, "page": page}
+
+async def _dashboard_section(pagers: dict, section: str, limit: int, page: int) -> dict:
+    """One further page of a single list section, for "load more" after the initial dashboard"""
+    if section not in pagers:
+        raise HTTPException(status_code=400, detail="Invalid section")
+    return {section: await pagers[section](limit, max(page, 1))}
+
+@api_router.get("/dashboard/shareholder")
+async def shareholder_dashboard(
+    user: dict = Depends(get_current_user),
+    limit: int = 50,
+    section: Optional[str] = None,
+    page: int = 1
+):
+    """Everything the shareholder dashboard shows, authenticated once and queried concurrently"""
+    if user["role"] not in ("shareholder", "admin"):
+        raise HTTPException(status_code=403, detail="Shareholder only")
+    limit = min(max(limit, 1), DASHBOARD_MAX_LIMIT)
+    pagers = {
+        "products": lambda limit, page: _dashboard_page(db.products, {"seller_id": user["user_id"]}, limit, page),
+        "deals": lambda limit, page: _dashboard_page(db.deals, _deals_query(user), limit, page),
+        "meetings": lambda limit, page: _dashboard_page(db.meetings, _meetings_query(user), limit, page)
+    }
+    if section:
+        return await _dashboard_section(pagers, section, limit, page)
+    products, deals, meetings, stats, registry, conversations = await asyncio.gather(
+        pagers["products"](limit, 1),
+        pagers["deals"](limit, 1),
+        pagers["meetings"](limit, 1),
+        shareholder_stats(user),
+        own_registry_entries(user),
+        get_conversations(user, 1, limit)
+    )
+    return {
+        "products": products,
+        "deals": deals,
+        "meetings": meetings,
+        "stats": stats,
+        "registry": registry,
+        "conversations": conversations
+    }
+
+@api_router.get("/dashboard/client")
+async def client_dashboard(
+    user: dict = Depends(get_current_user),
+    limit: int = 50,
+    section: Optional[str] = None,
+    page: int = 1
+):
+    limit = min(max(limit, 1), DASHBOARD_MAX_LIMIT)
+    pagers = {
+        "favorites": lambda limit, page: _favorites_page(user, limit, page),
+        "deals": lambda limit, page: _dashboard_page(db.deals, _deals_query(user), limit, page),
+        "meetings": lambda limit, page: _dashboard_page(db.meetings, _meetings_query(user), limit, page)
+    }
+    if section:
+        return await _dashboard_section(pagers, section, limit, page)
+    favorites, deals, meetings, conversations = await asyncio.gather(
+        pagers["favorites"](limit, 1),
+        pagers["deals"](limit, 1),
+        pagers["meetings"](limit, 1),
+        get_conversations(user, 1, limit)
+    )
+    return {"favorites": favorites, "deals": deals, "meetings": meetings, "conversations": conversations}
+
+# ============ EXCHANGE MATCHING ============
+
+EXCHANGE_REBUILD_SECONDS = int(os.environ.get('EXCHANGE_REBUILD_SECONDS', '600'))
+EXCHANGE_MAX_PARTNERS = 50
+EXCHANGE_INTEREST_WEIGHT = 0.5
+EXCHANGE_GIVE_OPTIONS = 3
+EXCHANGE_OFFER_PROJECTION = {"_id": 0, "product_id": 1, "seller_id": 1, "title": 1, "category": 1, "tags": 1, "price": 1, "currency": 1, "images": 1, "exchange_available": 1, "status": 1}
+
+def price_band(price) -> Optional[int]:
+    """Powers-of-two price bands; neighbouring bands are close enough to swap"""
+    if not price or price <= 0:
+        return None
+    return int(math.floor(math.log2(price)))
+
+class ExchangeGraph:
+    """Barter graph between shareholders, kept in memory and updated per product/user.
+
+    Offers are active exchange-available products, indexed by category, tag, price band
+    and seller. A user wants an offer they favorited (weight 1) or one in a category/tag
+    they have favorited before (EXCHANGE_INTEREST_WEIGHT). Edge u -> v exists when u wants
+    an offer of v and has an offer of their own in a compatible price band. Adjacency is
+    computed lazily per user and dropped only for users a change can affect.
+    """
+
+    def __init__(self):
+        self._clear()
+        self._task = None
+        self._pending = set()
+
+    def _clear(self):
+        self.offers = {}
+        self.by_category = defaultdict(set)
+        self.by_tag = defaultdict(set)
+        self.by_band = defaultdict(set)
+        self.by_seller = defaultdict(set)
+        self.favorites = defaultdict(set)
+        self.wanters = defaultdict(set)
+        self.interest_categories = defaultdict(Counter)
+        self.interest_tags = defaultdict(Counter)
+        self.category_fans = defaultdict(set)
+        self.tag_fans = defaultdict(set)
+        self._out = {}
+
+    # ----- incremental maintenance -----
+
+    def _affected_by_offer(self, offer: dict) -> set:
+        users = {offer["seller_id"]} | self.wanters.get(offer["product_id"], set()) | self.category_fans.get(offer["category"], set())
+        for tag in offer["tags"]:
+            users |= self.tag_fans.get(tag, set())
+        return users
+
+    def _invalidate(self, users):
+        for u in users:
+            self._out.pop(u, None)
+
+    def remove_offer(self, product_id: str):
+        offer = self.offers.pop(product_id, None)
+        if not offer:
+            return
+        self.by_category[offer["category"]].discard(product_id)
+        for tag in offer["tags"]:
+            self.by_tag[tag].discard(product_id)
+        self.by_band[offer["band"]].discard(product_id)
+        self.by_seller[offer["seller_id"]].discard(product_id)
+        self._invalidate(self._affected_by_offer(offer))
+
+    def upsert_offer(self, product: dict):
+        self.remove_offer(product["product_id"])
+        if not product.get("exchange_available") or product.get("status") != "active":
+            return
+        offer = {
+            "product_id": product["product_id"],
+            "seller_id": product["seller_id"],
+            "title": product.get("title"),
+            "category": product.get("category"),
+            "tags": [t.lower() for t in product.get("tags") or []],
+            "price": product.get("price"),
+            "currency": product.get("currency"),
+            "image": (product.get("images") or [None])[0],
+            "band": price_band(product.get("price"))
+        }
+        self.offers[offer["product_id"]] = offer
+        self.by_category[offer["category"]].add(offer["product_id"])
+        for tag in offer["tags"]:
+            self.by_tag[tag].add(offer["product_id"])
+        self.by_band[offer["band"]].add(offer["product_id"])
+        self.by_seller[offer["seller_id"]].add(offer["product_id"])
+        self._invalidate(self._affected_by_offer(offer))
+
+    def set_favorites(self, user_id: str, favorited: List[dict]):
+        """Replace a user's favorites and the category/tag interests derived from them"""
+        for product_id in self.favorites.pop(user_id, set()):
+            self.wanters[product_id].discard(user_id)
+        for category in self.interest_categories.pop(user_id, Counter()):
+            self.category_fans[category].discard(user_id)
+        for tag in self.interest_tags.pop(user_id, Counter()):
+            self.tag_fans[tag].discard(user_id)
+        for product in favorited:
+            self.favorites[user_id].add(product["product_id"])
+            self.wanters[product["product_id"]].add(user_id)
+            if product.get("category"):
+                self.interest_categories[user_id][product["category"]] += 1
+                self.category_fans[product["category"]].add(user_id)
+            for tag in product.get("tags") or []:
+                self.interest_tags[user_id][tag.lower()] += 1
+                self.tag_fans[tag.lower()].add(user_id)
+        self._invalidate([user_id])
+
+    async def _favorited_products(self, user_ids: List[str]) -> dict:
+        favorites = await db.favorites.find({"user_id": {"$in": user_ids}}, {"_id": 0, "user_id": 1, "product_id": 1}).to_list(None)
+        product_ids = list({f["product_id"] for f in favorites})
+        products = await db.products.find(
+            {"product_id": {"$in": product_ids}}, {"_id": 0, "product_id": 1, "category": 1, "tags": 1}
+        ).to_list(len(product_ids))
+        by_id = {p["product_id"]: p for p in products}
+        result = defaultdict(list)
+        for f in favorites:
+            if f["product_id"] in by_id:
+                result[f["user_id"]].append(by_id[f["product_id"]])
+        return result
+
+    async def refresh_products(self, product_ids: List[str]):
+        products = await db.products.find({"product_id": {"$in": product_ids}}, EXCHANGE_OFFER_PROJECTION).to_list(len(product_ids))
+        found = {p["product_id"]: p for p in products}
+        for product_id in product_ids:
+            if product_id in found:
+                self.upsert_offer(found[product_id])
+            else:
+                self.remove_offer(product_id)
+
+    async def refresh_user(self, user_id: str):
+        favorited = await self._favorited_products([user_id])
+        self.set_favorites(user_id, favorited.get(user_id, []))
+
+    def _schedule(self, coro):
+        task = asyncio.create_task(coro)
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    def schedule_products(self, product_ids: List[str]):
+        self._schedule(self.refresh_products(list(product_ids)))
+
+    def schedule_user(self, user_id: str):
+        self._schedule(self.refresh_user(user_id))
+
+    async def rebuild(self):
+        """Full reload; also picks up writes made by other workers"""
+        offers = await db.products.find({"exchange_available": True, "status": "active"}, EXCHANGE_OFFER_PROJECTION).to_list(None)
+        fan_ids = await db.favorites.distinct("user_id")
+        favorited = await self._favorited_products(fan_ids) if fan_ids else {}
+        self._clear()
+        for product in offers:
+            self.upsert_offer(product)
+        for user_id, products in favorited.items():
+            self.set_favorites(user_id, products)
+        logger.info(f"Exchange graph rebuilt: {len(self.offers)} offers, {len(favorited)} users with favorites")
+
+    async def start(self):
+        self._task = asyncio.create_task(self._rebuild_loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _rebuild_loop(self):
+        while True:
+            try:
+                await self.rebuild()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Exchange graph rebuild failed: {e}")
+            await asyncio.sleep(EXCHANGE_REBUILD_SECONDS)
+
+    # ----- matching -----
+
+    def _give_options(self, user_id: str, band: Optional[int]) -> List[str]:
+        mine = self.by_seller.get(user_id, set())
+        if band is None:
+            candidates = mine
+        else:
+            candidates = mine & (self.by_band.get(band - 1, set()) | self.by_band.get(band, set()) | self.by_band.get(band + 1, set()) | self.by_band.get(None, set()))
+        return sorted(candidates)[:EXCHANGE_GIVE_OPTIONS]
+
+    def out(self, user_id: str) -> dict:
+        """{partner_id: [{"get", "give", "weight"}]} for everything user_id could swap for"""
+        if user_id in self._out:
+            return self._out[user_id]
+        edges = defaultdict(list)
+        if self.by_seller.get(user_id):
+            targets = {}
+            for category in self.interest_categories.get(user_id, ()):
+                for product_id in self.by_category.get(category, ()):
+                    targets[product_id] = EXCHANGE_INTEREST_WEIGHT
+            for tag in self.interest_tags.get(user_id, ()):
+                for product_id in self.by_tag.get(tag, ()):
+                    targets[product_id] = EXCHANGE_INTEREST_WEIGHT
+            for product_id in self.favorites.get(user_id, ()):
+                if product_id in self.offers:
+                    targets[product_id] = 1.0
+            for product_id, weight in targets.items():
+                offer = self.offers[product_id]
+                if offer["seller_id"] == user_id:
+                    continue
+                give = self._give_options(user_id, offer["band"])
+                if give:
+                    edges[offer["seller_id"]].append({"get": product_id, "give": give, "weight": weight})
+            for legs in edges.values():
+                legs.sort(key=lambda leg: -leg["weight"])
+        self._out[user_id] = dict(edges)
+        return self._out[user_id]
+
+    def _weight(self, a: str, b: str) -> float:
+        legs = self.out(a).get(b)
+        return legs[0]["weight"] if legs else 0.0
+
+    def matches(self, user_id: str, limit: int = 20) -> dict:
+        mine = self.out(user_id)
+        direct = []
+        for partner, legs in mine.items():
+            back = self.out(partner).get(user_id)
+            if back:
+                direct.append({"partner_id": partner, "you_get": legs, "they_get": back, "score": legs[0]["weight"] + back[0]["weight"]})
+        direct.sort(key=lambda m: -m["score"])
+
+        cycles = []
+        partners = sorted(mine, key=lambda v: -self._weight(user_id, v))[:EXCHANGE_MAX_PARTNERS]
+        for second in partners:
+            for third in list(self.out(second))[:EXCHANGE_MAX_PARTNERS]:
+                if third in (user_id, second) or user_id not in self.out(third):
+                    continue
+                path = [user_id, second, third, user_id]
+                legs = [{"from": a, "to": b, **self.out(a)[b][0]} for a, b in zip(path, path[1:])]
+                cycles.append({"participants": path[:3], "legs": legs, "score": min(leg["weight"] for leg in legs)})
+        cycles.sort(key=lambda c: -c["score"])
+        return {"direct": direct[:limit], "cycles": cycles[:limit]}
+
+    def offer_summary(self, product_id: str) -> Optional[dict]:
+        offer = self.offers.get(product_id)
+        if not offer:
+            return None
+        return {k: offer[k] for k in ("product_id", "seller_id", "title", "category", "price", "currency", "image")}
+
+exchange_graph = ExchangeGraph()
+
+@api_router.get("/exchange/matches")
+async def exchange_matches(user: dict = Depends(get_current_user), limit: int = 20):
+    """Direct swaps and three-way barter cycles for the current shareholder's exchange offers"""
+    if user["role"] not in ("shareholder", "admin"):
+        raise HTTPException(status_code=403, detail="Shareholder only")
+    limit = min(max(limit, 1), 50)
+    found = exchange_graph.matches(user["user_id"], limit)
+
+    user_ids = {m["partner_id"] for m in found["direct"]}
+    for cycle in found["cycles"]:
+        user_ids.update(cycle["participants"])
+    users = await db.users.find({"user_id": {"$in": list(user_ids)}}, SELLER_SUMMARY_PROJECTION).to_list(len(user_ids))
+    users_map = {u["user_id"]: u for u in users}
+
+    def expand(leg: dict) -> dict:
+        return {
+            "get": exchange_graph.offer_summary(leg["get"]),
+            "give": [exchange_graph.offer_summary(p) for p in leg["give"]],
+            "weight": leg["weight"]
+        }
+
+    direct = [{
+        "partner": users_map.get(m["partner_id"]),
+        "you_get": [expand(leg) for leg in m["you_get"]],
+        "they_get": [expand(leg) for leg in m["they_get"]],
+        "score": m["score"]
+    } for m in found["direct"]]
+    cycles = [{
+        "participants": [users_map.get(u) for u in c["participants"]],
+        "legs": [{"from": leg["from"], "to": leg["to"], **expand(leg)} for leg in c["legs"]],
+        "score": c["score"]
+    } for c in found["cycles"]]
+    return {"direct": direct, "cycles": cycles}
+
+# ============ FILE STORAGE ============
+
+FILE_STORAGE = os.environ.get('FILE_STORAGE', 'gridfs')  # gridfs, local
+FILE_STORAGE_DIR = Path(os.environ.get('FILE_STORAGE_DIR', str(ROOT_DIR / "uploads")))
+FILE_CHUNK_SIZE = 255 * 1024
+FILE_MAX_BYTES = 200 * 1024 * 1024
+FILE_OWNER_TYPES = ("kb", "news")
+FILE_SNIFF_BYTES = 512
+
+class GridFSFileStore:
+    """Attachments as GridFS chunks in the main database; shared by every worker"""
+
+    def __init__(self, database):
+        self.bucket = AsyncIOMotorGridFSBucket(database, bucket_name="attachments", chunk_size_bytes=FILE_CHUNK_SIZE)
+
+    async def save(self, file_id: str, filename: str, chunks):
+        stream = self.bucket.open_upload_stream_with_id(file_id, filename)
+        try:
+            async for chunk in chunks:
+                await stream.write(chunk)
+        except BaseException:
+            await stream.abort()
+            raise
+        await stream.close()
+
+    async def read(self, file_id: str, start: int, length: int):
+        stream = await self.bucket.open_download_stream(file_id)
+        stream.seek(start)
+        while length > 0:
+            chunk = await stream.read(min(FILE_CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+    async def delete(self, file_id: str):
+        try:
+            await self.bucket.delete(file_id)
+        except Exception as e:
+            logger.warning(f"GridFS delete {file_id}: {e}")
+
+class LocalFileStore:
+    """Attachments as plain files under FILE_STORAGE_DIR (single host or shared volume)"""
+
+    def __init__(self, root: Path):
+        self.root = root
+
+    def _path(self, file_id: str) -> Path:
+        return self.root / file_id
+
+    async def save(self, file_id: str, filename: str, chunks):
+        await asyncio.to_thread(self.root.mkdir, parents=True, exist_ok=True)
+        partial = self.root / f"{file_id}.part"
+        handle = await asyncio.to_thread(open, partial, "wb")
+        try:
+            async for chunk in chunks:
+                await asyncio.to_thread(handle.write, chunk)
+        except BaseException:
+            await asyncio.to_thread(handle.close)
+            await asyncio.to_thread(partial.unlink, True)
+            raise
+        await asyncio.to_thread(handle.close)
+        await asyncio.to_thread(partial.replace, self._path(file_id))
+
+    async def read(self, file_id: str, start: int, length: int):
+        handle = await asyncio.to_thread(open, self._path(file_id), "rb")
+        try:
+            await asyncio.to_thread(handle.seek, start)
+            while length > 0:
+                chunk = await asyncio.to_thread(handle.read, min(FILE_CHUNK_SIZE, length))
+                if not chunk:
+                    break
+                length -= len(chunk)
+                yield chunk
+        finally:
+            await asyncio.to_thread(handle.close)
+
+    async def delete(self, file_id: str):
+        await asyncio.to_thread(self._path(file_id).unlink, True)
+
+file_store = LocalFileStore(FILE_STORAGE_DIR) if FILE_STORAGE == "local" else GridFSFileStore(db)
+
+def sniff_content_type(head: bytes, filename: str, declared: Optional[str] = None) -> str:
+    """Content type from magic bytes, then the file extension, then what the client declared"""
+    guessed = mimetypes.guess_type(filename)[0]
+    if head.startswith(b"%PDF-"):
+        return "application/pdf"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith((b"GIF87a", b"GIF89a")):
+        return "image/gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head[:4] == b"RIFF" and head[8:12] == b"WAVE":
+        return "audio/wav"
+    if head.startswith(b"ID3") or head[:2] in (b"\xff\xfb", b"\xff\xf3", b"\xff\xf2"):
+        return "audio/mpeg"
+    if head.startswith(b"OggS"):
+        return "audio/ogg"
+    if head[4:8] == b"ftyp":
+        return "audio/mp4" if head[8:11] == b"M4A" else "video/mp4"
+    if head.startswith(b"PK\x03\x04"):
+        # docx/xlsx/pptx are zip containers; trust the extension for which one
+        return guessed if guessed and "officedocument" in guessed else "application/zip"
+    if guessed:
+        return guessed
+    if declared and declared not in ("application/octet-stream", "application/x-www-form-urlencoded"):
+        return declared.split(";")[0].strip()
+    return "application/octet-stream"
+
+def is_inline_safe(content_type: str) -> bool:
+    """Types the browser may render in place; anything else (HTML, SVG, scripts) is forced to download"""
+    if content_type.startswith("image/"):
+        return content_type != "image/svg+xml"
+    return content_type == "application/pdf" or content_type.startswith("audio/")
+
+FILE_URL_PATTERN = re.compile(r"/api/files/(file_[0-9a-f]{12})")
+
+def attached_file_ids(doc: Optional[dict], fields) -> set:
+    """Stored file ids referenced by a KB document's or news item's URL fields"""
+    ids = set()
+    for field in fields:
+        match = FILE_URL_PATTERN.search((doc or {}).get(field) or "")
+        if match:
+            ids.add(match.group(1))
+    return ids
+
+async def release_attachments(file_ids):
+    """Delete stored files that no KB document or news item points at any more"""
+    for file_id in file_ids:
+        url = {"$regex": re.escape(f"/api/files/{file_id}")}
+        if await db.knowledge_base.find_one({"file_url": url}, {"_id": 1}):
+            continue
+        if await db.news.find_one({"$or": [{"image_url": url}, {"audio_url": url}]}, {"_id": 1}):
+            continue
+        if (await db.files.delete_one({"file_id": file_id})).deleted_count:
+            await file_store.delete(file_id)
+
+def parse_byte_range(header: Optional[str], size: int):
+    """Single 'bytes=' range as (start, end) inclusive; None serves the whole file"""
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start_s, _, end_s = header[6:].strip().partition("-")
+    try:
+        if start_s == "":
+            suffix = int(end_s)
+            if suffix <= 0:
+                raise ValueError
+            start, end = max(0, size - suffix), size - 1
+        else:
+            start = int(start_s)
+            end = min(int(end_s), size - 1) if end_s else size - 1
+    except ValueError:
+        raise HTTPException(status_code=416, detail="Invalid range", headers={"Content-Range": f"bytes */{size}"})
+    if start >= size or start > end:
+        raise HTTPException(status_code=416, detail="Range not satisfiable", headers={"Content-Range": f"bytes */{size}"})
+    return start, end
+
+@api_router.post("/files")
+async def upload_file(request: Request, filename: str, owner_type: str = "kb", user: dict = Depends(get_current_user)):
+    """Raw request body streamed into storage chunk by chunk; nothing is buffered whole"""
+    if user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Admin only")
+    if owner_type not in FILE_OWNER_TYPES:
+        raise HTTPException(status_code=400, detail="Invalid owner type")
+    filename = Path(filename).name or "file"
+    file_id = f"file_{uuid.uuid4().hex[:12]}"
+    digest = hashlib.sha256()
+    state = {"size": 0, "head": b""}
+
+    async def body_chunks():
+        async for chunk in request.stream():
+            if not chunk:
+                continue
+            state["size"] += len(chunk)
+            if state["size"] > FILE_MAX_BYTES:
+                raise HTTPException(status_code=413, detail="File too large")
+            if len(state["head"]) < FILE_SNIFF_BYTES:
+                state["head"] += chunk[:FILE_SNIFF_BYTES - len(state["head"])]
+            digest.update(chunk)
+            yield chunk
+
+    await file_store.save(file_id, filename, body_chunks())
+    if state["size"] == 0:
+        await file_store.delete(file_id)
+        raise HTTPException(status_code=400, detail="Empty file")
+    doc = {
+        "file_id": file_id,
+        "filename": filename,
+        "content_type": sniff_content_type(state["head"], filename, request.headers.get("content-type")),
+        "size": state["size"],
+        "sha256": digest.hexdigest(),
+        "owner_type": owner_type,
+        "storage": FILE_STORAGE,
+        "created_by": user["user_id"],
+        "created_at": datetime.now(timezone.utc).isoformat()
+    }
+    await db.files.insert_one(doc)
+    doc.pop("_id", None)
+    doc["url"] = f"/api/files/{file_id}"
+    return doc
+
+@api_router.get("/files/{file_id}")
+async def download_file(file_id: str, request: Request):
+    meta = await db.files.find_one({"file_id": file_id}, {"_id": 0})
+    if not meta:
+        raise HTTPException(status_code=404, detail="File not found")
+    size = meta["size"]
+    etag = f'"{meta["sha256"][:32]}"'
+    disposition = "inline" if is_inline_safe(meta["content_type"]) else "attachment"
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "public, max-age=86400",
+        "Content-Disposition": f"{disposition}; filename*=UTF-8''{quote(meta['filename'])}",
+        "X-Content-Type-Options": "nosniff"
+    }
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [t.strip() for t in if_none_match.split(",")] or if_none_match.strip() == "*":
+        return Response(status_code=304, headers=headers)
+    byte_range = None
+    if_range = request.headers.get("if-range")
+    if not if_range or if_range == etag:
+        byte_range = parse_byte_range(request.headers.get("range"), size)
+    if byte_range:
+        start, end = byte_range
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        status_code = 206
+    else:
+        start, end = 0, size - 1
+        status_code = 200
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        file_store.read(file_id, start, end - start + 1),
+        status_code=status_code,
+        media_type=meta["content_type"],
+        headers=headers
+    )
+
+@api_router.delete("/files/{file_id}")
+async def delete_file(file_id: str, user: dict = Depends(get_current_user)):
+    if user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Admin only")
+    result = await db.files.delete_one({"file_id": file_id})
+    if result.deleted_count == 0:
+        raise HTTPException(status_code=404, detail="File not found")
+    await file_store.delete(file_id)
+    return {"message": "File deleted"}
+
+# ============ CONTENT SNAPSHOTS ============
+
+SNAPSHOT_POLL_SECONDS = float(os.environ.get('SNAPSHOT_POLL_SECONDS', '2'))
+NEWS_SNAPSHOT_LIMIT = 100
+
+class SnapshotStore:
+    """Read-mostly listings held in memory as pre-serialized JSON.
+
+    Admin writes call refresh(), which bumps a per-listing version document and reloads
+    locally; other workers notice the new version on their next poll and reload too.
+    """
+
+    def __init__(self):
+        self._loaders = {}
+        self._data = {}
+        self._encoded = {}
+        self._versions = {}
+        self._task = None
+
+    def register(self, name: str, loader):
+        self._loaders[name] = loader
+
+    async def _load(self, name: str, version: Optional[int] = None):
+        data = await self._loaders[name]()
+        self._data[name] = data
+        self._encoded[name] = {}
+        self._versions[name] = version
+
+    async def response(self, name: str, key, build) -> Response:
+        """JSON for one variant of a listing; build(data) runs once per variant per reload"""
+        if name not in self._data:
+            await self._load(name, self._versions.get(name))
+        encoded = self._encoded[name]
+        if key not in encoded:
+            encoded[key] = json.dumps(build(self._data[name]), ensure_ascii=False).encode()
+        return Response(content=encoded[key], media_type="application/json")
+
+    async def refresh(self, name: str):
+        doc = await db.snapshot_versions.find_one_and_update(
+            {"_id": name}, {"$inc": {"version": 1}}, upsert=True, return_document=ReturnDocument.AFTER
+        )
+        await self._load(name, doc["version"])
+
+    async def _current_versions(self) -> dict:
+        docs = await db.snapshot_versions.find({"_id": {"$in": list(self._loaders)}}).to_list(len(self._loaders))
+        return {doc["_id"]: doc["version"] for doc in docs}
+
+    async def start(self):
+        try:
+            versions = await self._current_versions()
+            for name in self._loaders:
+                await self._load(name, versions.get(name))
+        except Exception as e:
+            logger.error(f"Snapshot load failed, will load on first request: {e}")
+        self._task = asyncio.create_task(self._poll())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(SNAPSHOT_POLL_SECONDS)
+            try:
+                for name, version in (await self._current_versions()).items():
+                    if version != self._versions.get(name):
+                        await self._load(name, version)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Snapshot version poll failed: {e}")
+
+snapshots = SnapshotStore()
+snapshots.register("news", lambda: db.news.find({}, {"_id": 0}).sort("created_at", -1).to_list(NEWS_SNAPSHOT_LIMIT))
+snapshots.register("ticker", lambda: db.ticker.find({}, {"_id": 0}).sort("created_at", -1).to_list(50))
+snapshots.register("kb", lambda: db.knowledge_base.find({}, {"_id": 0, "content": 0}).sort("created_at", -1).to_list(1000))
+
 # ============ KNOWLEDGE BASE ENDPOINTS ============
 
 KB_CATEGORIES = ["catalogs", "documents", "council_decisions", "meetings", "contracts"]
+KB_FILE_FIELDS = ("file_url",)
 
 class KBDocCreate(BaseModel):
     title: str
@@ -890,14 +2969,80 @@ class KBDocCreate(BaseModel):
     file_url: Optional[str] = None
     content: Optional[str] = None
 
+KB_SEARCH_MAX_RESULTS = 50
+KB_SNIPPET_CHARS = 200
+
+def _kb_term_pattern(q: str):
+    """Match query words and their inflections (Russian endings) by shared stem prefix"""
+    terms = [t for t in re.findall(r"\w+", q.lower()) if len(t) > 1]
+    if not terms:
+        return None
+    stems = sorted({t[:max(4, len(t) - 2)] if len(t) > 4 else t for t in terms}, key=len, reverse=True)
+    return re.compile(r"\b(?:" + "|".join(re.escape(stem) for stem in stems) + r")\w*", re.IGNORECASE)
+
+def _highlight(text: str, pattern) -> str:
+    """HTML-escape text and wrap every match in <mark>"""
+    parts, last = [], 0
+    for m in pattern.finditer(text):
+        parts.append(html.escape(text[last:m.start()]))
+        parts.append(f"<mark>{html.escape(m.group(0))}</mark>")
+        last = m.end()
+    parts.append(html.escape(text[last:]))
+    return "".join(parts)
+
+def _kb_snippet(doc: dict, pattern) -> str:
+    """Window of the content (or description) around the first match"""
+    for field in ("content", "description"):
+        text = doc.get(field) or ""
+        m = pattern.search(text)
+        if m:
+            start = max(0, m.start() - KB_SNIPPET_CHARS // 3)
+            end = min(len(text), start + KB_SNIPPET_CHARS)
+            snippet = _highlight(text[start:end], pattern)
+            return ("…" if start else "") + snippet + ("…" if end < len(text) else "")
+    text = doc.get("description") or doc.get("content") or ""
+    return html.escape(text[:KB_SNIPPET_CHARS]) + ("…" if len(text) > KB_SNIPPET_CHARS else "")
+
 @api_router.get("/knowledge-base")
-async def list_kb_docs(category: Optional[str] = None):
+async def list_kb_docs(category: Optional[str] = None, include_content: bool = False):
     query = {}
     if category and category in KB_CATEGORIES:
         query["category"] = category
+    if not include_content:
+        key = query.get("category", "")
+        return await snapshots.response("kb", key, lambda docs: [d for d in docs if not key or d["category"] == key])
     docs = await db.knowledge_base.find(query, {"_id": 0}).sort("created_at", -1).to_list(1000)
     return docs
 
+@api_router.get("/knowledge-base/search")
+async def search_kb_docs(q: str, category: Optional[str] = None, limit: int = 20):
+    """Full-text search over title, description and content, best matches first"""
+    q = q.strip()
+    pattern = _kb_term_pattern(q)
+    if not pattern:
+        raise HTTPException(status_code=400, detail="Query is empty")
+    limit = min(max(limit, 1), KB_SEARCH_MAX_RESULTS)
+    query = {"$text": {"$search": q}}
+    if category and category in KB_CATEGORIES:
+        query["category"] = category
+    docs = await db.knowledge_base.find(
+        query, {"_id": 0, "score": {"$meta": "textScore"}}
+    ).sort([("score", {"$meta": "textScore"})]).limit(limit).to_list(limit)
+    results = []
+    for doc in docs:
+        results.append({
+            "doc_id": doc["doc_id"],
+            "title": doc["title"],
+            "category": doc["category"],
+            "description": doc.get("description"),
+            "file_url": doc.get("file_url"),
+            "created_at": doc.get("created_at"),
+            "score": round(doc.get("score", 0), 3),
+            "title_highlight": _highlight(doc["title"], pattern),
+            "snippet": _kb_snippet(doc, pattern)
+        })
+    return {"query": q, "results": results}
+
 @api_router.get("/knowledge-base/{doc_id}")
 async def get_kb_doc(doc_id: str):
     doc = await db.knowledge_base.find_one({"doc_id": doc_id}, {"_id": 0})
@@ -923,6 +3068,7 @@ async def create_kb_doc(data: KBDocCreate, user: dict = Depends(get_current_user
         "created_at": datetime.now(timezone.utc).isoformat()
     }
     await db.knowledge_base.insert_one(doc)
+    await snapshots.refresh("kb")
     doc.pop("_id", None)
     return doc
 
@@ -933,7 +3079,13 @@ async def update_kb_doc(doc_id: str, request: Request, user: dict = Depends(get_
     body = await request.json()
     update_data = {k: v for k, v in body.items() if k in ("title", "description", "file_url", "content", "category")}
     if update_data:
-        await db.knowledge_base.update_one({"doc_id": doc_id}, {"$set": update_data})
+        previous = await db.knowledge_base.find_one_and_update(
+            {"doc_id": doc_id}, {"$set": update_data}, projection={"_id": 0, "file_url": 1}
+        )
+        await snapshots.refresh("kb")
+        if "file_url" in update_data:
+            # Still-referenced files (including an unchanged URL) are kept by release_attachments
+            await release_attachments(attached_file_ids(previous, KB_FILE_FIELDS))
     updated = await db.knowledge_base.find_one({"doc_id": doc_id}, {"_id": 0})
     return updated
 
@@ -941,11 +3093,15 @@ async def update_kb_doc(doc_id: str, request: Request, user: dict = Depends(get_
 async def delete_kb_doc(doc_id: str, user: dict = Depends(get_current_user)):
     if user["role"] != "admin":
         raise HTTPException(status_code=403, detail="Admin only")
-    await db.knowledge_base.delete_one({"doc_id": doc_id})
+    deleted = await db.knowledge_base.find_one_and_delete({"doc_id": doc_id}, projection={"_id": 0, "file_url": 1})
+    await snapshots.refresh("kb")
+    await release_attachments(attached_file_ids(deleted, KB_FILE_FIELDS))
     return {"message": "Document deleted"}
 
 # ============ NEWS ENDPOINTS ============
 
+NEWS_FILE_FIELDS = ("image_url", "audio_url")
+
 class NewsCreate(BaseModel):
     title: str
     description: str
@@ -955,6 +3111,8 @@ class NewsCreate(BaseModel):
 
 @api_router.get("/news")
 async def list_news(limit: int = 20):
+    if 0 < limit <= NEWS_SNAPSHOT_LIMIT:
+        return await snapshots.response("news", limit, lambda items: items[:limit])
     news = await db.news.find({}, {"_id": 0}).sort("created_at", -1).limit(limit).to_list(limit)
     return news
 
@@ -981,6 +3139,7 @@ async def create_news(data: NewsCreate, user: dict = Depends(get_current_user)):
         "created_at": datetime.now(timezone.utc).isoformat()
     }
     await db.news.insert_one(item)
+    await snapshots.refresh("news")
     item.pop("_id", None)
     return item
 
@@ -991,7 +3150,11 @@ async def update_news(news_id: str, request: Request, user: dict = Depends(get_c
     body = await request.json()
     update_data = {k: v for k, v in body.items() if k in ("title", "description", "image_url", "audio_url", "content")}
     if update_data:
-        await db.news.update_one({"news_id": news_id}, {"$set": update_data})
+        previous = await db.news.find_one_and_update(
+            {"news_id": news_id}, {"$set": update_data}, projection={"_id": 0, "image_url": 1, "audio_url": 1}
+        )
+        await snapshots.refresh("news")
+        await release_attachments(attached_file_ids(previous, [f for f in NEWS_FILE_FIELDS if f in update_data]))
     updated = await db.news.find_one({"news_id": news_id}, {"_id": 0})
     return updated
 
@@ -999,7 +3162,9 @@ async def update_news(news_id: str, request: Request, user: dict = Depends(get_c
 async def delete_news(news_id: str, user: dict = Depends(get_current_user)):
     if user["role"] != "admin":
         raise HTTPException(status_code=403, detail="Admin only")
-    await db.news.delete_one({"news_id": news_id})
+    deleted = await db.news.find_one_and_delete({"news_id": news_id}, projection={"_id": 0, "image_url": 1, "audio_url": 1})
+    await snapshots.refresh("news")
+    await release_attachments(attached_file_ids(deleted, NEWS_FILE_FIELDS))
     return {"message": "News deleted"}
 
 # ============ TICKER ENDPOINTS ============
@@ -1009,8 +3174,7 @@ class TickerCreate(BaseModel):
 
 @api_router.get("/ticker")
 async def get_ticker():
-    items = await db.ticker.find({}, {"_id": 0}).sort("created_at", -1).to_list(50)
-    return items
+    return await snapshots.response("ticker", "all", lambda items: items)
 
 @api_router.post("/ticker")
 async def create_ticker(data: TickerCreate, user: dict = Depends(get_current_user)):
@@ -1023,6 +3187,7 @@ async def create_ticker(data: TickerCreate, user: dict = Depends(get_current_use
         "created_at": datetime.now(timezone.utc).isoformat()
     }
     await db.ticker.insert_one(item)
+    await snapshots.refresh("ticker")
     item.pop("_id", None)
     return item
 
@@ -1031,6 +3196,7 @@ async def delete_ticker(ticker_id: str, user: dict = Depends(get_current_user)):
     if user["role"] != "admin":
         raise HTTPException(status_code=403, detail="Admin only")
     await db.ticker.delete_one({"ticker_id": ticker_id})
+    await snapshots.refresh("ticker")
     return {"message": "Ticker deleted"}
 
 # ============ SHAREHOLDER REGISTRY ENDPOINTS ============
@@ -1047,23 +3213,504 @@ class RegistryEntryCreate(BaseModel):
     join_date: Optional[str] = None
     notes: Optional[str] = None
 
+REGISTRY_SORT_FIELDS = ("created_at", "join_date", "pai_amount", "name_lower", "shareholder_number")
+REGISTRY_EXPORT_FIELDS = ("entry_id", "shareholder_number", "name", "inn", "phone", "email", "pai_amount", "status", "join_date", "user_id", "notes", "created_at", "updated_at")
+REGISTRY_STREAM_CHUNK = 500
+
+def _registry_query(
+    status: Optional[str] = None,
+    join_date_from: Optional[str] = None,
+    join_date_to: Optional[str] = None,
+    pai_min: Optional[float] = None,
+    pai_max: Optional[float] = None,
+    search: Optional[str] = None
+) -> dict:
+    clauses = []
+    if status:
+        clauses.append({"status": status})
+    if join_date_from or join_date_to:
+        join_range = {}
+        if join_date_from:
+            join_range["$gte"] = join_date_from
+        if join_date_to:
+            join_range["$lte"] = join_date_to
+        clauses.append({"join_date": join_range})
+    if pai_min is not None or pai_max is not None:
+        pai_range = {}
+        if pai_min is not None:
+            pai_range["$gte"] = pai_min
+        if pai_max is not None:
+            pai_range["$lte"] = pai_max
+        clauses.append({"pai_amount": pai_range})
+    if search:
+        prefix = re.escape(search.strip())
+        clauses.append({"$or": [
+            {"name_lower": {"$regex": f"^{prefix.lower()}"}},
+            {"shareholder_number": {"$regex": f"^{prefix}"}}
+        ]})
+    return {"$and": clauses} if clauses else {}
+
+def _stream_registry_rows(cursor, format: str):
+    """Serialize rows as they come off the cursor, flushing every REGISTRY_STREAM_CHUNK rows"""
+    async def rows():
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=REGISTRY_EXPORT_FIELDS, extrasaction="ignore")
+        if format == "csv":
+            writer.writeheader()
+        elif format == "json":
+            buffer.write("[")
+        count = 0
+        async for entry in cursor:
+            if format == "csv":
+                writer.writerow(entry)
+            elif format == "ndjson":
+                buffer.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+            else:
+                buffer.write(("," if count else "") + json.dumps(entry, ensure_ascii=False, default=str))
+            count += 1
+            if count % REGISTRY_STREAM_CHUNK == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate(0)
+        if format == "json":
+            buffer.write("]")
+        yield buffer.getvalue()
+    return rows()
+
 @api_router.get("/registry")
 async def list_registry(user: dict = Depends(get_current_user)):
     if user["role"] == "admin":
-        entries = await db.registry.find({}, {"_id": 0}).sort("created_at", -1).to_list(10000)
+        # Streamed as a JSON array so the full registry is never built in memory
+        cursor = db.registry.find({}, {"_id": 0, "name_lower": 0}).sort("created_at", -1).batch_size(REGISTRY_STREAM_CHUNK)
+        return StreamingResponse(_stream_registry_rows(cursor, "json"), media_type="application/json")
     elif user["role"] == "shareholder":
-        # Shareholder sees only their own entry
-        entries = await db.registry.find(
-            {"$or": [{"user_id": user["user_id"]}, {"email": user.get("email")}, {"shareholder_number": user.get("shareholder_number", "")}]},
-            {"_id": 0}
-        ).to_list(100)
+        # Shareholder sees only their own entry; entries are linked to user ids on write
+        entries = await own_registry_entries(user)
     else:
         raise HTTPException(status_code=403, detail="Not authorized")
     return entries
 
+@api_router.get("/registry/page")
+async def registry_page(
+    user: dict = Depends(get_current_user),
+    status: Optional[str] = None,
+    join_date_from: Optional[str] = None,
+    join_date_to: Optional[str] = None,
+    pai_min: Optional[float] = None,
+    pai_max: Optional[float] = None,
+    search: Optional[str] = None,
+    sort: str = "created_at",
+    order: str = "desc",
+    cursor: Optional[str] = None,
+    limit: int = 50
+):
+    if user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Admin only")
+    if sort not in REGISTRY_SORT_FIELDS or order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="Invalid sort")
+    limit = min(max(limit, 1), 500)
+    descending = order == "desc"
+    query = _registry_query(status, join_date_from, join_date_to, pai_min, pai_max, search)
+    if cursor:
+        sort_value, entry_id = decode_cursor(cursor)
+        query = {"$and": [query, keyset_after(sort, sort_value, "entry_id", entry_id, descending, nullable=True)]}
+    direction = DESCENDING if descending else ASCENDING
+    entries = await db.registry.find(
+        query, {"_id": 0}
+    ).sort([(sort, direction), ("entry_id", direction)]).limit(limit + 1).to_list(limit + 1)
+    next_cursor = None
+    if len(entries) > limit:
+        entries = entries[:limit]
+        next_cursor = encode_cursor([entries[-1].get(sort), entries[-1]["entry_id"]])
+    for entry in entries:
+        entry.pop("name_lower", None)
+    return {"entries": entries, "next_cursor": next_cursor}
+
+@api_router.get("/registry/export")
+async def registry_export(
+    user: dict = Depends(get_current_user),
+    format: str = "csv",
+    status: Optional[str] = None,
+    join_date_from: Optional[str] = None,
+    join_date_to: Optional[str] = None,
+    pai_min: Optional[float] = None,
+    pai_max: Optional[float] = None,
+    search: Optional[str] = None
+):
+    if user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Admin only")
+    if format not in ("csv", "ndjson"):
+        raise HTTPException(status_code=400, detail="Invalid format")
+    query = _registry_query(status, join_date_from, join_date_to, pai_min, pai_max, search)
+    cursor = db.registry.find(query, {"_id": 0, "name_lower": 0}).sort("shareholder_number", 1).batch_size(REGISTRY_STREAM_CHUNK)
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    filename = f"registry-{datetime.now(timezone.utc).strftime('%Y%m%d')}.{format}"
+    return StreamingResponse(
+        _stream_registry_rows(cursor, format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+# ============ REGISTRY LINKS ============
+
+REGISTRY_LINK_BATCH = 500
+
+def _registry_match_clauses(email: Optional[str], shareholder_number: Optional[str]) -> list:
+    clauses = []
+    if email:
+        clauses.append({"email": email})
+    if shareholder_number:
+        clauses.append({"shareholder_number": shareholder_number})
+    return clauses
+
+async def _registry_owner_id(email: Optional[str], shareholder_number: Optional[str]) -> Optional[str]:
+    """User an unlinked registry entry belongs to; an email match wins over a shareholder number"""
+    clauses = _registry_match_clauses(email, shareholder_number)
+    if not clauses:
+        return None
+    users = await db.users.find({"$or": clauses}, {"_id": 0, "user_id": 1, "email": 1}).to_list(2)
+    users.sort(key=lambda u: u.get("email") != email)
+    return users[0]["user_id"] if users else None
+
+async def link_registry_entries(user_doc: dict) -> int:
+    """Claim unlinked registry entries matching a user's email or shareholder number"""
+    clauses = _registry_match_clauses(user_doc.get("email"), user_doc.get("shareholder_number"))
+    if not clauses:
+        return 0
+    result = await db.registry.update_many(
+        {"user_id": None, "$or": clauses},
+        {"$set": {"user_id": user_doc["user_id"]}}
+    )
+    return result.modified_count
+
+async def own_registry_entries(user: dict) -> list:
+    """A user's linked registry entries; claims any still unlinked ones first when none are linked yet"""
+    projection = {"_id": 0, "name_lower": 0}
+    entries = await db.registry.find({"user_id": user["user_id"]}, projection).to_list(100)
+    if not entries and await link_registry_entries(user):
+        entries = await db.registry.find({"user_id": user["user_id"]}, projection).to_list(100)
+    return entries
+
+async def reconcile_registry_links(query: Optional[dict] = None) -> int:
+    """Link historical registry entries to users, a batch of entries and one user lookup at a time"""
+    linked = 0
+    cursor = db.registry.find(
+        {"user_id": None, **(query or {})}, {"_id": 0, "entry_id": 1, "email": 1, "shareholder_number": 1}
+    ).batch_size(REGISTRY_LINK_BATCH)
+    batch = []
+
+    async def flush(entries):
+        emails = [e["email"] for e in entries if e.get("email")]
+        numbers = [e["shareholder_number"] for e in entries if e.get("shareholder_number")]
+        by_email, by_number = {}, {}
+        async for u in db.users.find(
+            {"$or": [{"email": {"$in": emails}}, {"shareholder_number": {"$in": numbers}}]},
+            {"_id": 0, "user_id": 1, "email": 1, "shareholder_number": 1}
+        ):
+            if u.get("email"):
+                by_email[u["email"]] = u["user_id"]
+            if u.get("shareholder_number"):
+                by_number.setdefault(u["shareholder_number"], u["user_id"])
+        ops = []
+        for e in entries:
+            owner = by_email.get(e.get("email")) or by_number.get(e.get("shareholder_number"))
+            if owner:
+                ops.append(UpdateOne({"entry_id": e["entry_id"], "user_id": None}, {"$set": {"user_id": owner}}))
+        if ops:
+            result = await db.registry.bulk_write(ops, ordered=False)
+            return result.modified_count
+        return 0
+
+    async for entry in cursor:
+        batch.append(entry)
+        if len(batch) >= REGISTRY_LINK_BATCH:
+            linked += await flush(batch)
+            batch = []
+    if batch:
+        linked += await flush(batch)
+    return linked
+
+@api_router.post("/admin/registry/reconcile")
+async def admin_reconcile_registry(background_tasks: BackgroundTasks, user: dict = Depends(get_current_user)):
+    if user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Admin only")
+    background_tasks.add_task(reconcile_registry_links)
+    return {"message": "Registry reconciliation started"}
+
+# ============ REGISTRY SUMMARY ============
+
+REGISTRY_SUMMARY_TTL = 300  # seconds; writes on any worker invalidate immediately
+REGISTRY_SUMMARY_GROUPS = ("join_year", "status")
+REGISTRY_SUMMARY_VERSION_ID = "registry_summary"
+_registry_summary_cache = {}
+
+async def invalidate_registry_summary():
+    """Bump the shared write marker; every worker's cached summaries are keyed on it"""
+    await db.snapshot_versions.update_one({"_id": REGISTRY_SUMMARY_VERSION_ID}, {"$inc": {"version": 1}}, upsert=True)
+
+def _money(value) -> str:
+    """Decimal128 sums from Mongo rendered exactly, to kopecks"""
+    amount = value.to_decimal() if hasattr(value, "to_decimal") else Decimal(str(value or 0))
+    return str(amount.quantize(Decimal("0.01")))
+
+def _registry_summary_pipeline(group_by: List[str]) -> list:
+    pai = {"$sum": {"$toDecimal": {"$ifNull": ["$pai_amount", 0]}}}
+    facets = {
+        "totals": [{"$group": {"_id": None, "count": {"$sum": 1}, "pai_total": pai}}],
+        "by_status": [{"$group": {"_id": "$status", "count": {"$sum": 1}, "pai_total": pai}}, {"$sort": {"_id": 1}}],
+        "joins_by_month": [
+            {"$match": {"join_date": {"$nin": [None, ""]}}},
+            {"$group": {"_id": {"$substr": ["$join_date", 0, 7]}, "count": {"$sum": 1}}},
+            {"$sort": {"_id": 1}}
+        ],
+        # Entries that left before left_at was tracked fall back to their last update
+        "leaves_by_month": [
+            {"$match": {"status": {"$ne": "active"}}},
+            {"$group": {"_id": {"$substr": [{"$ifNull": ["$left_at", "$updated_at"]}, 0, 7]}, "count": {"$sum": 1}}},
+            {"$sort": {"_id": 1}}
+        ],
+    }
+    if group_by:
+        key = {}
+        if "join_year" in group_by:
+            key["join_year"] = {"$substr": [{"$ifNull": ["$join_date", ""]}, 0, 4]}
+        if "status" in group_by:
+            key["status"] = "$status"
+        facets["groups"] = [
+            {"$group": {"_id": key, "count": {"$sum": 1}, "pai_total": pai}},
+            {"$sort": {"_id": 1}}
+        ]
+    return [{"$facet": facets}]
+
+async def registry_summary(group_by: List[str]) -> dict:
+    doc = await db.snapshot_versions.find_one({"_id": REGISTRY_SUMMARY_VERSION_ID})
+    key = (doc["version"] if doc else 0, ",".join(group_by))
+    cached = _registry_summary_cache.get(key)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+    rows = await db.registry.aggregate(_registry_summary_pipeline(group_by)).to_list(1)
+    facets = rows[0] if rows else {}
+    totals = (facets.get("totals") or [{}])[0]
+    summary = {
+        "count": totals.get("count", 0),
+        "pai_total": _money(totals.get("pai_total")),
+        "by_status": {
+            (row["_id"] or "unknown"): {"count": row["count"], "pai_total": _money(row["pai_total"])}
+            for row in facets.get("by_status", [])
+        },
+        "joins_by_month": {row["_id"]: row["count"] for row in facets.get("joins_by_month", []) if row["_id"]},
+        "leaves_by_month": {row["_id"]: row["count"] for row in facets.get("leaves_by_month", []) if row["_id"]},
+        "computed_at": datetime.now(timezone.utc).isoformat()
+    }
+    if group_by:
+        summary["groups"] = [
+            {**row["_id"], "count": row["count"], "pai_total": _money(row["pai_total"])}
+            for row in facets.get("groups", [])
+        ]
+    # Entries for older versions can never be hit again
+    for stale in [k for k in _registry_summary_cache if k[0] != key[0]]:
+        del _registry_summary_cache[stale]
+    _registry_summary_cache[key] = (time.monotonic() + REGISTRY_SUMMARY_TTL, summary)
+    return summary
+
+@api_router.get("/registry/summary")
+async def get_registry_summary(user: dict = Depends(get_current_user), group_by: Optional[str] = None):
+    """Totals, per-status counts and monthly joins/leaves; group_by=join_year,status adds a breakdown"""
+    if user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Admin only")
+    groups = [g.strip() for g in group_by.split(",") if g.strip()] if group_by else []
+    if any(g not in REGISTRY_SUMMARY_GROUPS for g in groups):
+        raise HTTPException(status_code=400, detail="Invalid group_by")
+    return await registry_summary([g for g in REGISTRY_SUMMARY_GROUPS if g in groups])
+
+# ============ REGISTRY IMPORT ============
+
+REGISTRY_IMPORT_MAX_BYTES = 20 * 1024 * 1024
+REGISTRY_IMPORT_BATCH = 1000
+REGISTRY_IMPORT_REPORT_LIMIT = 200
+REGISTRY_STATUSES = ("active", "inactive", "suspended")
+REGISTRY_IMPORT_FIELDS = ("name", "shareholder_number", "inn", "phone", "email", "pai_amount", "status", "join_date", "notes")
+# Spreadsheet headers (lowercased) accepted for each registry field
+REGISTRY_IMPORT_COLUMNS = {
+    "name": "name", "фио": "name", "имя": "name", "пайщик": "name",
+    "shareholder_number": "shareholder_number", "номер": "shareholder_number", "номер пайщика": "shareholder_number", "№": "shareholder_number",
+    "inn": "inn", "инн": "inn",
+    "phone": "phone", "телефон": "phone",
+    "email": "email", "e-mail": "email", "почта": "email",
+    "pai_amount": "pai_amount", "пай": "pai_amount", "паевой взнос": "pai_amount", "сумма пая": "pai_amount",
+    "status": "status", "статус": "status",
+    "join_date": "join_date", "дата вступления": "join_date",
+    "notes": "notes", "примечание": "notes", "примечания": "notes",
+}
+REGISTRY_STATUS_ALIASES = {"активен": "active", "неактивен": "inactive", "приостановлен": "suspended"}
+EMAIL_PATTERN = r"^[^@\s]+@[^@\s]+\.[^@\s]+$"
+
+def _load_registry_frame(raw: bytes, filename: str) -> pd.DataFrame:
+    if filename.lower().endswith((".xlsx", ".xls")):
+        try:
+            import openpyxl  # noqa: F401
+        except ImportError:
+            raise HTTPException(status_code=400, detail="XLSX import requires openpyxl; upload CSV instead")
+        frame = pd.read_excel(io.BytesIO(raw), dtype=str)
+    else:
+        text = raw.decode("utf-8-sig", errors="replace")
+        frame = pd.read_csv(io.StringIO(text), dtype=str, sep=None, engine="python", keep_default_na=False)
+    frame = frame.rename(columns=lambda c: REGISTRY_IMPORT_COLUMNS.get(str(c).strip().lower(), str(c).strip().lower()))
+    frame = frame[[c for c in REGISTRY_IMPORT_FIELDS if c in frame.columns]]
+    frame = frame.loc[:, ~frame.columns.duplicated()]
+    if "name" not in frame.columns or "shareholder_number" not in frame.columns:
+        raise HTTPException(status_code=400, detail="File must contain name and shareholder_number columns")
+    return frame.fillna("").astype(str).apply(lambda col: col.str.strip())
+
+def _normalize_registry_frame(frame: pd.DataFrame):
+    """Validate and normalize every column at once; returns (valid records, row errors)"""
+    errors = pd.DataFrame(False, index=frame.index, columns=list(frame.columns))
+    messages = {
+        "name": "name is required",
+        "shareholder_number": "shareholder_number is required or duplicated in file",
+        "inn": "INN must have 10 or 12 digits",
+        "phone": "phone must be a Russian number",
+        "email": "invalid email",
+        "pai_amount": "pai_amount must be a non-negative number",
+        "status": f"status must be one of {', '.join(REGISTRY_STATUSES)}",
+        "join_date": "join_date is not a date",
+    }
+    errors["name"] = frame["name"] == ""
+    errors["shareholder_number"] = (frame["shareholder_number"] == "") | frame["shareholder_number"].duplicated(keep=False)
+    if "inn" in frame:
+        inn = frame["inn"].str.replace(r"\D", "", regex=True)
+        errors["inn"] = (inn != "") & ~inn.str.len().isin((10, 12))
+        frame["inn"] = inn
+    if "phone" in frame:
+        phone = frame["phone"].str.replace(r"\D", "", regex=True)
+        phone = phone.where(phone.str.len() != 10, "7" + phone)
+        phone = phone.where(~((phone.str.len() == 11) & phone.str.startswith("8")), "7" + phone.str[1:])
+        valid = (phone.str.len() == 11) & phone.str.startswith("7")
+        errors["phone"] = (phone != "") & ~valid
+        frame["phone"] = ("+" + phone).where(phone != "", "")
+    if "email" in frame:
+        email = frame["email"].str.lower()
+        errors["email"] = (email != "") & ~email.str.match(EMAIL_PATTERN)
+        frame["email"] = email
+    if "pai_amount" in frame:
+        cleaned = frame["pai_amount"].str.replace(r"[\s\u00a0₽]", "", regex=True).str.replace(",", ".", regex=False)
+        amount = pd.to_numeric(cleaned, errors="coerce")
+        errors["pai_amount"] = (cleaned != "") & (amount.isna() | (amount < 0))
+        frame["pai_amount"] = amount.round(2).astype(object).where(cleaned != "", None)
+    if "status" in frame:
+        status = frame["status"].str.lower().replace(REGISTRY_STATUS_ALIASES)
+        errors["status"] = (status != "") & ~status.isin(REGISTRY_STATUSES)
+        frame["status"] = status
+    if "join_date" in frame:
+        raw_dates = frame["join_date"].where(frame["join_date"] != "")
+        # ISO first, then day-first local formats (05.01.2024) for whatever is left
+        parsed = pd.to_datetime(raw_dates, format="%Y-%m-%d", errors="coerce")
+        parsed = parsed.fillna(pd.to_datetime(raw_dates.where(parsed.isna()), format="mixed", dayfirst=True, errors="coerce"))
+        errors["join_date"] = raw_dates.notna() & parsed.isna()
+        frame["join_date"] = parsed.dt.strftime("%Y-%m-%d").where(parsed.notna(), "")
+
+    bad_rows = errors.any(axis=1)
+    row_errors = []
+    for index in frame.index[bad_rows]:
+        row_errors.append({
+            "row": int(index) + 2,  # spreadsheet row: 1-based plus the header
+            "shareholder_number": frame.at[index, "shareholder_number"],
+            "errors": [messages[c] for c in errors.columns if errors.at[index, c]]
+        })
+    records = []
+    for row in frame[~bad_rows].to_dict("records"):
+        # Empty cells leave the stored value untouched
+        records.append({k: v for k, v in row.items() if v not in ("", None)})
+    return records, row_errors
+
+def _registry_changes(existing: Optional[dict], record: dict) -> dict:
+    if existing is None:
+        return record
+    return {k: v for k, v in record.items() if existing.get(k) != v}
+
+@api_router.post("/registry/import")
+async def import_registry(
+    user: dict = Depends(get_current_user),
+    file: UploadFile = File(...),
+    dry_run: bool = True
+):
+    if user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Admin only")
+    raw = await file.read(REGISTRY_IMPORT_MAX_BYTES + 1)
+    if len(raw) > REGISTRY_IMPORT_MAX_BYTES:
+        raise HTTPException(status_code=413, detail="File too large")
+    try:
+        frame = await asyncio.to_thread(_load_registry_frame, raw, file.filename or "")
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Could not read file: {e}")
+    records, row_errors = await asyncio.to_thread(_normalize_registry_frame, frame)
+
+    now = datetime.now(timezone.utc).isoformat()
+    created, updated, unchanged, written = [], [], 0, 0
+    for start in range(0, len(records), REGISTRY_IMPORT_BATCH):
+        batch = records[start:start + REGISTRY_IMPORT_BATCH]
+        numbers = [r["shareholder_number"] for r in batch]
+        existing = {
+            e["shareholder_number"]: e async for e in db.registry.find(
+                {"shareholder_number": {"$in": numbers}}, {"_id": 0, "name_lower": 0}
+            )
+        }
+        ops = []
+        for record in batch:
+            number = record["shareholder_number"]
+            current = existing.get(number)
+            changes = _registry_changes(current, record)
+            if not changes:
+                unchanged += 1
+                continue
+            if current is None:
+                created.append(number)
+            else:
+                updated.append({"shareholder_number": number, "changes": {k: [current.get(k), v] for k, v in changes.items()}})
+            if dry_run:
+                continue
+            update_set = dict(changes, updated_at=now)
+            if "name" in changes:
+                update_set["name_lower"] = changes["name"].lower()
+            if "status" in changes:
+                update_set["left_at"] = None if changes["status"] == "active" else now
+            on_insert = {
+                "entry_id": f"reg_{uuid.uuid4().hex[:12]}",
+                "user_id": None,
+                "created_at": now,
+                "pai_amount": 0,
+                "status": "active",
+                "join_date": datetime.now(timezone.utc).strftime("%Y-%m-%d"),
+                "notes": None,
+                "inn": None, "phone": None, "email": None
+            }
+            on_insert = {k: v for k, v in on_insert.items() if k not in update_set}
+            ops.append(UpdateOne({"shareholder_number": number}, {"$set": update_set, "$setOnInsert": on_insert}, upsert=True))
+        if ops:
+            result = await db.registry.bulk_write(ops, ordered=False)
+            written += result.upserted_count + result.modified_count
+            await reconcile_registry_links({"shareholder_number": {"$in": numbers}})
+    if written:
+        await invalidate_registry_summary()
+
+    return {
+        "dry_run": dry_run,
+        "total_rows": len(frame),
+        "created": len(created),
+        "updated": len(updated),
+        "unchanged": unchanged,
+        "invalid": len(row_errors),
+        "written": written,
+        "created_numbers": created[:REGISTRY_IMPORT_REPORT_LIMIT],
+        "updated_entries": updated[:REGISTRY_IMPORT_REPORT_LIMIT],
+        "errors": row_errors[:REGISTRY_IMPORT_REPORT_LIMIT]
+    }
+
 @api_router.get("/registry/{entry_id}")
 async def get_registry_entry(entry_id: str, user: dict = Depends(get_current_user)):
-    entry = await db.registry.find_one({"entry_id": entry_id}, {"_id": 0})
+    entry = await db.registry.find_one({"entry_id": entry_id}, {"_id": 0, "name_lower": 0})
     if not entry:
         raise HTTPException(status_code=404, detail="Entry not found")
     if user["role"] != "admin" and entry.get("user_id") != user["user_id"]:
@@ -1077,8 +3724,9 @@ async def create_registry_entry(data: RegistryEntryCreate, user: dict = Depends(
     entry_id = f"reg_{uuid.uuid4().hex[:12]}"
     entry = {
         "entry_id": entry_id,
-        "user_id": data.user_id,
+        "user_id": data.user_id or await _registry_owner_id(data.email, data.shareholder_number),
         "name": data.name,
+        "name_lower": data.name.lower(),
         "shareholder_number": data.shareholder_number,
         "inn": data.inn,
         "phone": data.phone,
@@ -1090,8 +3738,13 @@ async def create_registry_entry(data: RegistryEntryCreate, user: dict = Depends(
         "created_at": datetime.now(timezone.utc).isoformat(),
         "updated_at": datetime.now(timezone.utc).isoformat()
     }
-    await db.registry.insert_one(entry)
+    try:
+        await db.registry.insert_one(entry)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=409, detail="Shareholder number already exists")
+    await invalidate_registry_summary()
     entry.pop("_id", None)
+    entry.pop("name_lower", None)
     return entry
 
 @api_router.put("/registry/{entry_id}")
@@ -1101,9 +3754,29 @@ async def update_registry_entry(entry_id: str, request: Request, user: dict = De
     body = await request.json()
     allowed = ("name", "shareholder_number", "inn", "phone", "email", "pai_amount", "status", "join_date", "notes", "user_id")
     update_data = {k: v for k, v in body.items() if k in allowed}
+    if update_data.get("name"):
+        update_data["name_lower"] = update_data["name"].lower()
     update_data["updated_at"] = datetime.now(timezone.utc).isoformat()
-    await db.registry.update_one({"entry_id": entry_id}, {"$set": update_data})
-    updated = await db.registry.find_one({"entry_id": entry_id}, {"_id": 0})
+    try:
+        await db.registry.update_one({"entry_id": entry_id}, {"$set": update_data})
+        if "status" in update_data:
+            # Record when the shareholder left, once, for the monthly summary
+            if update_data["status"] == "active":
+                await db.registry.update_one({"entry_id": entry_id}, {"$set": {"left_at": None}})
+            else:
+                await db.registry.update_one(
+                    {"entry_id": entry_id, "left_at": None},
+                    {"$set": {"left_at": update_data["updated_at"]}}
+                )
+    except DuplicateKeyError:
+        raise HTTPException(status_code=409, detail="Shareholder number already exists")
+    await invalidate_registry_summary()
+    updated = await db.registry.find_one({"entry_id": entry_id}, {"_id": 0, "name_lower": 0})
+    if updated and not updated.get("user_id") and ("email" in update_data or "shareholder_number" in update_data):
+        owner = await _registry_owner_id(updated.get("email"), updated.get("shareholder_number"))
+        if owner:
+            await db.registry.update_one({"entry_id": entry_id, "user_id": None}, {"$set": {"user_id": owner}})
+            updated["user_id"] = owner
     return updated
 
 @api_router.delete("/registry/{entry_id}")
@@ -1111,16 +3784,54 @@ async def delete_registry_entry(entry_id: str, user: dict = Depends(get_current_
     if user["role"] != "admin":
         raise HTTPException(status_code=403, detail="Admin only")
     await db.registry.delete_one({"entry_id": entry_id})
+    await invalidate_registry_summary()
     return {"message": "Entry deleted"}
 
 # ============ ADMIN CHAT ENDPOINTS ============
 
+# Admin chat is partitioned into one thread per user; untargeted admin posts go to a shared announcements thread
+ADMIN_CHAT_ANNOUNCEMENTS = "all"
+ADMIN_CHAT_PAGE_ADMIN = 100
+ADMIN_CHAT_PAGE_USER = 50
+ADMIN_CHAT_BACKFILL_BATCH = 500
+
+async def _touch_admin_chat_thread(msg: dict):
+    """Keep the per-user thread summary (admin thread list) in step with the new message"""
+    if msg["thread_user_id"] == ADMIN_CHAT_ANNOUNCEMENTS:
+        return
+    from_admin = msg["sender_role"] == "admin"
+    await db.admin_chat_threads.update_one(
+        {"thread_user_id": msg["thread_user_id"]},
+        {
+            "$set": {
+                "last_message": msg["content"],
+                "last_sender_role": msg["sender_role"],
+                "last_date": msg["created_at"]
+            },
+            "$setOnInsert": {"created_at": msg["created_at"]},
+            "$inc": {"unread_user" if from_admin else "unread_admin": 1}
+        },
+        upsert=True
+    )
+
 @api_router.post("/admin-chat")
 async def send_admin_chat(request: Request, user: dict = Depends(get_current_user)):
     body = await request.json()
+    if user["role"] == "admin":
+        # Admin replies go to one user's thread; posting to everyone has to be asked for explicitly
+        thread_user_id = body.get("thread_user_id") or body.get("recipient_id")
+        if body.get("announcement"):
+            thread_user_id = ADMIN_CHAT_ANNOUNCEMENTS
+        elif not thread_user_id or thread_user_id == ADMIN_CHAT_ANNOUNCEMENTS:
+            raise HTTPException(status_code=400, detail="thread_user_id is required, or set announcement to post to everyone")
+        elif not await db.users.find_one({"user_id": thread_user_id}, {"_id": 1}):
+            raise HTTPException(status_code=404, detail="User not found")
+    else:
+        thread_user_id = user["user_id"]
     msg_id = f"achat_{uuid.uuid4().hex[:12]}"
     msg = {
         "message_id": msg_id,
+        "thread_user_id": thread_user_id,
         "sender_id": user["user_id"],
         "sender_name": user.get("name", ""),
         "sender_role": user["role"],
@@ -1130,19 +3841,147 @@ async def send_admin_chat(request: Request, user: dict = Depends(get_current_use
     }
     await db.admin_chat.insert_one(msg)
     msg.pop("_id", None)
+    await _bump_admin_chat_version()
+    await _touch_admin_chat_thread(msg)
+    if user["role"] != "admin":
+        await _bump_unread(ADMIN_INBOX_OWNER, "admin_chat", 1)
+    elif thread_user_id != ADMIN_CHAT_ANNOUNCEMENTS:
+        await _bump_unread(thread_user_id, "admin_chat", 1)
+    await realtime.publish("admin_chat", msg)
     return msg
 
+@api_router.put("/admin-chat/read")
+async def mark_admin_chat_read(request: Request, user: dict = Depends(get_current_user)):
+    body = await request.json()
+    if user["role"] == "admin":
+        thread_user_id = body.get("thread_user_id") or body.get("user_id")
+        query = {"sender_role": {"$ne": "admin"}, "read": False}
+        thread_query = {}
+        if thread_user_id:
+            query["thread_user_id"] = thread_user_id
+            thread_query["thread_user_id"] = thread_user_id
+        thread_update = {"$set": {"unread_admin": 0}}
+        owner = ADMIN_INBOX_OWNER
+    else:
+        query = {"thread_user_id": user["user_id"], "sender_role": "admin", "read": False}
+        thread_query = {"thread_user_id": user["user_id"]}
+        thread_update = {"$set": {"unread_user": 0}}
+        owner = user["user_id"]
+    result = await db.admin_chat.update_many(query, {"$set": {"read": True}})
+    if result.modified_count:
+        await db.admin_chat_threads.update_many(thread_query, thread_update)
+        await _bump_admin_chat_version()
+    await _bump_unread(owner, "admin_chat", -result.modified_count)
+    return {"marked_read": result.modified_count}
+
+@api_router.get("/admin-chat/threads")
+async def admin_chat_threads(user: dict = Depends(get_current_user), page: int = 1, limit: int = 50):
+    """Admin inbox: one row per user thread, most recent activity first"""
+    if user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Admin only")
+    page = max(page, 1)
+    limit = min(max(limit, 1), 100)
+    threads = await db.admin_chat_threads.find({}, {"_id": 0}).sort("last_date", -1).skip((page - 1) * limit).limit(limit).to_list(limit)
+    user_ids = [t["thread_user_id"] for t in threads]
+    users_list = await db.users.find({"user_id": {"$in": user_ids}}, {"_id": 0, "user_id": 1, "name": 1, "email": 1, "role": 1, "avatar": 1}).to_list(len(user_ids))
+    users_map = {u["user_id"]: u for u in users_list}
+    for t in threads:
+        t["user"] = users_map.get(t["thread_user_id"])
+        t["unread"] = t.pop("unread_admin", 0)
+        t.pop("unread_user", None)
+    return threads
+
+ADMIN_CHAT_VERSION_ID = "admin_chat"
+
+async def _bump_admin_chat_version():
+    """Shared last-write marker, so every worker agrees on when the admin chat changed"""
+    await db.snapshot_versions.update_one({"_id": ADMIN_CHAT_VERSION_ID}, {"$inc": {"version": 1}}, upsert=True)
+
+async def _admin_chat_etag(request: Request, user: dict) -> str:
+    """Derived from the shared write marker, the authenticated user and the query: one lookup by _id, no history query"""
+    doc = await db.snapshot_versions.find_one({"_id": ADMIN_CHAT_VERSION_ID})
+    digest = hashlib.sha1(f"{user['user_id']}?{request.url.query}".encode("utf-8")).hexdigest()[:12]
+    return f'W/"achat-{doc["version"] if doc else 0}-{digest}"'
+
 @api_router.get("/admin-chat")
-async def get_admin_chat(user: dict = Depends(get_current_user)):
+async def get_admin_chat(request: Request, since: Optional[str] = None, thread_user_id: Optional[str] = None):
+    # Authenticate before answering 304, so a revoked or expired credential can't keep polling
+    user = await get_current_user(request)
+    etag = await _admin_chat_etag(request, user)
+    if request.headers.get("If-None-Match") == etag:
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
     if user["role"] == "admin":
-        messages = await db.admin_chat.find({}, {"_id": 0}).sort("created_at", -1).limit(100).to_list(100)
+        # A single thread when asked for one, otherwise the latest activity across all threads
+        query = {"thread_user_id": thread_user_id} if thread_user_id else {}
+        limit = ADMIN_CHAT_PAGE_ADMIN
     else:
-        messages = await db.admin_chat.find(
-            {"$or": [{"sender_id": user["user_id"]}, {"sender_role": "admin"}]},
-            {"_id": 0}
-        ).sort("created_at", -1).limit(50).to_list(50)
-    messages.reverse()
-    return messages
+        query = {"thread_user_id": {"$in": [user["user_id"], ADMIN_CHAT_ANNOUNCEMENTS]}}
+        limit = ADMIN_CHAT_PAGE_USER
+
+    if since:
+        # Only messages newer than the client's last one, oldest first
+        if since.startswith("achat_"):
+            ref = await db.admin_chat.find_one({"message_id": since}, {"_id": 0, "created_at": 1})
+            if not ref:
+                raise HTTPException(status_code=400, detail="Unknown message cursor")
+            since = ref["created_at"]
+        query["created_at"] = {"$gt": since}
+        messages = await db.admin_chat.find(query, {"_id": 0}).sort("created_at", 1).limit(limit).to_list(limit)
+    else:
+        messages = await db.admin_chat.find(query, {"_id": 0}).sort("created_at", -1).limit(limit).to_list(limit)
+        messages.reverse()
+    return JSONResponse(content=messages, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+async def backfill_admin_chat_threads():
+    """Assign thread_user_id to legacy admin chat messages and rebuild the thread summaries"""
+    ops = []
+    cursor = db.admin_chat.find(
+        {"thread_user_id": {"$exists": False}},
+        {"_id": 1, "sender_id": 1, "sender_role": 1, "recipient_id": 1}
+    )
+    async for msg in cursor:
+        if msg.get("sender_role") == "admin":
+            thread_user_id = msg.get("recipient_id") or ADMIN_CHAT_ANNOUNCEMENTS
+        else:
+            thread_user_id = msg["sender_id"]
+        ops.append(UpdateOne({"_id": msg["_id"]}, {"$set": {"thread_user_id": thread_user_id}}))
+        if len(ops) >= ADMIN_CHAT_BACKFILL_BATCH:
+            await db.admin_chat.bulk_write(ops, ordered=False)
+            ops = []
+    if ops:
+        await db.admin_chat.bulk_write(ops, ordered=False)
+
+    pipeline = [
+        {"$match": {"thread_user_id": {"$ne": ADMIN_CHAT_ANNOUNCEMENTS}}},
+        {"$sort": {"created_at": 1}},
+        {"$group": {
+            "_id": "$thread_user_id",
+            "last_message": {"$last": "$content"},
+            "last_sender_role": {"$last": "$sender_role"},
+            "last_date": {"$last": "$created_at"},
+            "created_at": {"$first": "$created_at"},
+            "unread_admin": {"$sum": {"$cond": [{"$and": [{"$ne": ["$sender_role", "admin"]}, {"$eq": ["$read", False]}]}, 1, 0]}},
+            "unread_user": {"$sum": {"$cond": [{"$and": [{"$eq": ["$sender_role", "admin"]}, {"$eq": ["$read", False]}]}, 1, 0]}}
+        }}
+    ]
+    ops = []
+    async for row in db.admin_chat.aggregate(pipeline, allowDiskUse=True):
+        thread_user_id = row.pop("_id")
+        ops.append(UpdateOne({"thread_user_id": thread_user_id}, {"$set": row}, upsert=True))
+        if len(ops) >= ADMIN_CHAT_BACKFILL_BATCH:
+            await db.admin_chat_threads.bulk_write(ops, ordered=False)
+            ops = []
+    if ops:
+        await db.admin_chat_threads.bulk_write(ops, ordered=False)
+    logger.info("Admin chat threads backfill finished")
+
+@api_router.post("/admin/admin-chat/backfill")
+async def admin_backfill_admin_chat(background_tasks: BackgroundTasks, user: dict = Depends(get_current_user)):
+    if user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Admin only")
+    background_tasks.add_task(backfill_admin_chat_threads)
+    return {"message": "Admin chat backfill started"}
 
 # Include router
 app.include_router(api_router)
@@ -1156,6 +3995,163 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+async def _ensure_unique_index(collection, keys):
+    """Unique indexes fail on legacy duplicates; log it and keep creating the others"""
+    try:
+        await collection.create_index(keys, unique=True)
+    except Exception as e:
+        logger.error(f"Unique index {keys} on {collection.name} not created, resolve duplicates first: {e}")
+
+async def ensure_indexes():
+    # Admin user directory: keyset order plus one index per prefix-searchable field
+    await _ensure_unique_index(db.users, "user_id")
+    await db.users.create_index([("created_at", DESCENDING), ("user_id", DESCENDING)])
+    await db.users.create_index([("role", ASCENDING), ("created_at", DESCENDING)])
+    await db.users.create_index("email")
+    await db.users.create_index("name_lower")
+    await db.users.create_index("email_lower")
+    await db.users.create_index("phone")
+    await db.users.create_index("inn")
+    await db.users.create_index("shareholder_number")
+    # Registry listing: keyset order for every sortable field, plus filters
+    await _ensure_unique_index(db.registry, "entry_id")
+    await db.registry.create_index([("created_at", DESCENDING), ("entry_id", DESCENDING)])
+    await db.registry.create_index([("join_date", ASCENDING), ("entry_id", ASCENDING)])
+    await db.registry.create_index([("pai_amount", ASCENDING), ("entry_id", ASCENDING)])
+    await db.registry.create_index([("name_lower", ASCENDING), ("entry_id", ASCENDING)])
+    await db.registry.create_index([("shareholder_number", ASCENDING), ("entry_id", ASCENDING)])
+    await db.registry.create_index([("status", ASCENDING), ("created_at", DESCENDING)])
+    # Shareholders resolve their own entry by user id; email serves linking on register
+    await db.registry.create_index("user_id")
+    await db.registry.create_index("email")
+    await _ensure_unique_index(db.files, "file_id")
+    # Knowledge base: category listing and weighted full-text search (Russian stemming)
+    await db.knowledge_base.create_index([("category", ASCENDING), ("created_at", DESCENDING)])
+    await db.knowledge_base.create_index(
+        [("title", "text"), ("description", "text"), ("content", "text")],
+        weights={"title": 10, "description": 4, "content": 1},
+        default_language="russian",
+        name="kb_text"
+    )
+    # Import upserts are keyed on the shareholder number
+    await _ensure_unique_index(db.registry, "shareholder_number")
+    # Meetings work queue: pending (oldest first), per-representative and completed views
+    await _ensure_unique_index(db.meetings, "meeting_id")
+    await db.meetings.create_index([("status", ASCENDING), ("created_at", ASCENDING), ("meeting_id", ASCENDING)])
+    await db.meetings.create_index([("representative_id", ASCENDING), ("status", ASCENDING), ("created_at", DESCENDING)])
+    # Per-representative interval index for calendar conflict checks and availability
+    await db.meetings.create_index([("representative_id", ASCENDING), ("status", ASCENDING), ("start_at", ASCENDING), ("end_at", ASCENDING)])
+    # One favorite per (user, product); also serves the per-user listing
+    await _ensure_unique_index(db.favorites, [("user_id", ASCENDING), ("product_id", ASCENDING)])
+    await db.favorites.create_index([("user_id", ASCENDING), ("created_at", DESCENDING)])
+    await _ensure_unique_index(db.products, "product_id")
+    # Relevance sort: precomputed rank per status/category, text search over listings
+    await db.products.create_index([("status", ASCENDING), ("rank_score", DESCENDING), ("product_id", ASCENDING)])
+    await db.products.create_index([("status", ASCENDING), ("category", ASCENDING), ("rank_score", DESCENDING)])
+    await db.products.create_index(
+        [("title", "text"), ("tags", "text"), ("description", "text")],
+        weights={"title": 10, "tags": 5, "description": 1},
+        default_language="russian",
+        name="products_text"
+    )
+    # Exchange graph rebuild scans only exchange-available active products
+    await db.products.create_index([("exchange_available", ASCENDING), ("status", ASCENDING)])
+    # Product moderation queue filters, each in keyset order
+    await db.products.create_index([("status", ASCENDING), ("created_at", ASCENDING), ("product_id", ASCENDING)])
+    await db.products.create_index([("status", ASCENDING), ("category", ASCENDING), ("created_at", ASCENDING)])
+    await db.products.create_index([("seller_id", ASCENDING), ("status", ASCENDING), ("created_at", ASCENDING)])
+    # Message history pages per conversation, plus the all-messages view
+    await db.messages.create_index([("conversation_id", ASCENDING), ("created_at", ASCENDING), ("message_id", ASCENDING)])
+    await db.messages.create_index([("sender_id", ASCENDING), ("created_at", ASCENDING)])
+    await db.messages.create_index([("receiver_id", ASCENDING), ("created_at", ASCENDING)])
+    await db.messages.create_index([("conversation_id", ASCENDING), ("receiver_id", ASCENDING), ("read", ASCENDING)])
+    await _ensure_unique_index(db.unread_counters, "owner")
+    await _ensure_unique_index(db.broadcasts, "broadcast_id")
+    # Admin chat: per-user thread partitions plus the admin thread list
+    await db.admin_chat.create_index([("created_at", ASCENDING)])
+    await db.admin_chat.create_index([("thread_user_id", ASCENDING), ("created_at", ASCENDING)])
+    await _ensure_unique_index(db.admin_chat_threads, "thread_user_id")
+    await db.admin_chat_threads.create_index([("last_date", DESCENDING)])
+    # Materialized inbox: one row per participant pair, listed by latest activity
+    await _ensure_unique_index(db.conversations, "conversation_id")
+    await db.conversations.create_index([("participants", ASCENDING), ("last_date", DESCENDING)])
+
+async def run_migration(name: str, migration):
+    """Run a one-off data migration once per database; safe to race between workers (all are idempotent)"""
+    if await db.migrations.find_one({"_id": name}):
+        return
+    await migration()
+    await db.migrations.update_one(
+        {"_id": name}, {"$set": {"done_at": datetime.now(timezone.utc).isoformat()}}, upsert=True
+    )
+
+async def dedupe_favorites():
+    """Keep the oldest of each duplicated (user, product) favorite so the unique index can be built"""
+    pipeline = [
+        {"$sort": {"created_at": 1}},
+        {"$group": {"_id": {"user_id": "$user_id", "product_id": "$product_id"}, "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}}
+    ]
+    extra = []
+    async for group in db.favorites.aggregate(pipeline, allowDiskUse=True):
+        extra.extend(group["ids"][1:])
+        if len(extra) >= USER_EXPORT_CHUNK:
+            await db.favorites.delete_many({"_id": {"$in": extra}})
+            extra = []
+    if extra:
+        await db.favorites.delete_many({"_id": {"$in": extra}})
+
+async def backfill_favorites_count():
+    """Recount products.favorites_count from the favorites collection"""
+    counts = {}
+    async for row in db.favorites.aggregate([{"$group": {"_id": "$product_id", "count": {"$sum": 1}}}], allowDiskUse=True):
+        counts[row["_id"]] = row["count"]
+    ops = []
+    async for product in db.products.find({}, {"_id": 0, "product_id": 1, "favorites_count": 1}):
+        count = counts.get(product["product_id"], 0)
+        if product.get("favorites_count") != count:
+            ops.append(UpdateOne({"product_id": product["product_id"]}, {"$set": {"favorites_count": count}}))
+        if len(ops) >= USER_EXPORT_CHUNK:
+            await db.products.bulk_write(ops, ordered=False)
+            ops = []
+    if ops:
+        await db.products.bulk_write(ops, ordered=False)
+
+async def backfill_meeting_times():
+    """Derive start_at/end_at for meetings requested before they were stored, so conflicts and availability see them"""
+    ops = []
+    async for meeting in db.meetings.find(
+        {"start_at": {"$exists": False}}, {"_id": 1, "preferred_date": 1, "duration_minutes": 1}
+    ):
+        start_at = parse_preferred_date(meeting.get("preferred_date"))
+        duration = meeting.get("duration_minutes") or MEETING_DEFAULT_DURATION_MIN
+        ops.append(UpdateOne({"_id": meeting["_id"]}, {"$set": {
+            "start_at": _iso(start_at) if start_at else None,
+            "end_at": _iso(start_at + timedelta(minutes=duration)) if start_at else None,
+            "duration_minutes": duration
+        }}))
+        if len(ops) >= USER_EXPORT_CHUNK:
+            await db.meetings.bulk_write(ops, ordered=False)
+            ops = []
+    if ops:
+        await db.meetings.bulk_write(ops, ordered=False)
+
+async def migrate_search_fields():
+    """Fill the lowercased search fields on users and registry entries created before they were maintained"""
+    for collection, source, target in (
+        (db.users, "name", "name_lower"),
+        (db.users, "email", "email_lower"),
+        (db.registry, "name", "name_lower")
+    ):
+        ops = []
+        async for doc in collection.find({target: {"$exists": False}}, {"_id": 1, source: 1}):
+            ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": {target: (doc.get(source) or "").lower()}}))
+            if len(ops) >= USER_EXPORT_CHUNK:
+                await collection.bulk_write(ops, ordered=False)
+                ops = []
+        if ops:
+            await collection.bulk_write(ops, ordered=False)
+
 @app.on_event("startup")
 async def startup_db_client():
     try:
@@ -1163,7 +4159,55 @@ async def startup_db_client():
         logger.info("MongoDB connection established successfully")
     except Exception as e:
         logger.error(f"MongoDB connection failed: {e}")
+    try:
+        await run_migration("dedupe_favorites", dedupe_favorites)
+    except Exception as e:
+        logger.error(f"Favorites dedupe failed: {e}")
+    try:
+        await ensure_indexes()
+    except Exception as e:
+        logger.error(f"Index creation failed: {e}")
+    try:
+        await run_migration("backfill_favorites_count", backfill_favorites_count)
+    except Exception as e:
+        logger.error(f"Favorites count backfill failed: {e}")
+    try:
+        await migrate_search_fields()
+    except Exception as e:
+        logger.error(f"Search field migration failed: {e}")
+    try:
+        await run_migration("backfill_meeting_times", backfill_meeting_times)
+    except Exception as e:
+        logger.error(f"Meeting time backfill failed: {e}")
+    try:
+        await run_migration("reconcile_registry_links", reconcile_registry_links)
+    except Exception as e:
+        logger.error(f"Registry link reconciliation failed: {e}")
+    try:
+        await run_migration("backfill_message_conversation_ids", backfill_message_conversation_ids)
+    except Exception as e:
+        logger.error(f"Message conversation_id backfill failed: {e}")
+    try:
+        await run_migration("backfill_conversations", backfill_conversations)
+    except Exception as e:
+        logger.error(f"Conversations backfill failed: {e}")
+    try:
+        await run_migration("backfill_admin_chat_threads", backfill_admin_chat_threads)
+    except Exception as e:
+        logger.error(f"Admin chat threads backfill failed: {e}")
+    try:
+        await run_migration("seed_unread_counters", seed_unread_counters)
+    except Exception as e:
+        logger.error(f"Unread counter seeding failed: {e}")
+    await realtime.start()
+    await snapshots.start()
+    await exchange_graph.start()
+    await product_ranker.start()
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await product_ranker.stop()
+    await exchange_graph.stop()
+    await snapshots.stop()
+    await realtime.stop()
     client.close()
@@ -0,0 +1,8 @@
+import os
+import sys
+from pathlib import Path
+
+# Unit tests import server.py directly; the Mongo client connects lazily, so no database is needed
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "test_database")
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
@@ -0,0 +1,74 @@
+"""
+Unit tests for the in-memory barter graph: price bands, direct swaps and three-way cycles.
+"""
+import server
+
+
+def offer(product_id, seller_id, price, category="food", tags=()):
+    return {
+        "product_id": product_id, "seller_id": seller_id, "title": product_id, "category": category,
+        "tags": list(tags), "price": price, "currency": "RUB", "images": [],
+        "exchange_available": True, "status": "active"
+    }
+
+
+class TestExchangeGraph:
+    """Direct swaps and three-way cycles over the in-memory barter graph"""
+
+    def test_price_bands(self):
+        assert server.price_band(None) is None
+        assert server.price_band(0) is None
+        assert server.price_band(1000) == server.price_band(1023)
+        assert server.price_band(1024) == server.price_band(1000) + 1
+
+    def test_direct_swap_from_mutual_favorites(self):
+        graph = server.ExchangeGraph()
+        graph.upsert_offer(offer("honey", "alice", 1000))
+        graph.upsert_offer(offer("bread", "bob", 900))
+        graph.set_favorites("alice", [{"product_id": "bread", "category": "food"}])
+        graph.set_favorites("bob", [{"product_id": "honey", "category": "food"}])
+        found = graph.matches("alice")
+        assert [m["partner_id"] for m in found["direct"]] == ["bob"]
+        assert found["direct"][0]["you_get"][0] == {"get": "bread", "give": ["honey"], "weight": 1.0}
+        assert found["direct"][0]["score"] == 2.0
+
+    def test_distant_price_bands_do_not_match(self):
+        graph = server.ExchangeGraph()
+        graph.upsert_offer(offer("honey", "alice", 100))
+        graph.upsert_offer(offer("tractor", "bob", 100000))
+        graph.set_favorites("alice", [{"product_id": "tractor"}])
+        graph.set_favorites("bob", [{"product_id": "honey"}])
+        assert graph.matches("alice")["direct"] == []
+
+    def test_three_way_cycle(self):
+        graph = server.ExchangeGraph()
+        graph.upsert_offer(offer("a1", "alice", 500))
+        graph.upsert_offer(offer("b1", "bob", 500))
+        graph.upsert_offer(offer("c1", "carol", 500))
+        graph.set_favorites("alice", [{"product_id": "b1"}])
+        graph.set_favorites("bob", [{"product_id": "c1"}])
+        graph.set_favorites("carol", [{"product_id": "a1"}])
+        found = graph.matches("alice")
+        assert found["direct"] == []
+        assert [c["participants"] for c in found["cycles"]] == [["alice", "bob", "carol"]]
+        assert [leg["get"] for leg in found["cycles"][0]["legs"]] == ["b1", "c1", "a1"]
+
+    def test_removed_offer_invalidates_matches(self):
+        graph = server.ExchangeGraph()
+        graph.upsert_offer(offer("honey", "alice", 1000))
+        graph.upsert_offer(offer("bread", "bob", 1000))
+        graph.set_favorites("alice", [{"product_id": "bread"}])
+        graph.set_favorites("bob", [{"product_id": "honey"}])
+        assert graph.matches("alice")["direct"]
+        graph.remove_offer("bread")
+        assert graph.matches("alice")["direct"] == []
+
+    def test_category_interest_weighs_less_than_a_favorite(self):
+        graph = server.ExchangeGraph()
+        graph.upsert_offer(offer("honey", "alice", 1000, category="food"))
+        graph.upsert_offer(offer("jam", "bob", 1000, category="food"))
+        graph.set_favorites("alice", [{"product_id": "elsewhere", "category": "food"}])
+        graph.set_favorites("bob", [{"product_id": "honey"}])
+        direct = graph.matches("alice")["direct"]
+        assert direct[0]["you_get"][0]["weight"] == server.EXCHANGE_INTEREST_WEIGHT
+        assert direct[0]["score"] == 1.0 + server.EXCHANGE_INTEREST_WEIGHT
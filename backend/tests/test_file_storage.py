@@ -0,0 +1,64 @@
+"""
+Unit tests for attachment helpers: byte-range parsing and content-type sniffing.
+"""
+import pytest
+from fastapi import HTTPException
+
+import server
+
+
+class TestFileHelpers:
+    """Byte ranges and content sniffing for stored attachments"""
+
+    def test_no_or_multi_range_serves_whole_file(self):
+        assert server.parse_byte_range(None, 100) is None
+        assert server.parse_byte_range("bytes=0-1,5-6", 100) is None
+        assert server.parse_byte_range("items=0-1", 100) is None
+
+    def test_ranges(self):
+        assert server.parse_byte_range("bytes=0-9", 100) == (0, 9)
+        assert server.parse_byte_range("bytes=90-", 100) == (90, 99)
+        assert server.parse_byte_range("bytes=-10", 100) == (90, 99)
+        assert server.parse_byte_range("bytes=50-500", 100) == (50, 99)
+        assert server.parse_byte_range("bytes=-500", 100) == (0, 99)
+
+    @pytest.mark.parametrize("header", ["bytes=100-", "bytes=20-10", "bytes=abc-", "bytes=-0"])
+    def test_unsatisfiable_ranges(self, header):
+        with pytest.raises(HTTPException) as exc:
+            server.parse_byte_range(header, 100)
+        assert exc.value.status_code == 416
+        assert exc.value.headers["Content-Range"] == "bytes */100"
+
+    def test_magic_bytes_win_over_extension(self):
+        assert server.sniff_content_type(b"%PDF-1.7", "report.txt") == "application/pdf"
+        assert server.sniff_content_type(b"\x89PNG\r\n\x1a\n....", "photo.jpg") == "image/png"
+        assert server.sniff_content_type(b"ID3\x03", "track") == "audio/mpeg"
+        assert server.sniff_content_type(b"RIFF\x00\x00\x00\x00WEBPVP8 ", "x") == "image/webp"
+
+    def test_office_documents_keep_their_type(self):
+        docx = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+        assert server.sniff_content_type(b"PK\x03\x04", "contract.docx") == docx
+        assert server.sniff_content_type(b"PK\x03\x04", "archive.bin") == "application/zip"
+
+    def test_fallbacks(self):
+        assert server.sniff_content_type(b"hello", "notes.txt") == "text/plain"
+        assert server.sniff_content_type(b"hello", "blob", "text/csv; charset=utf-8") == "text/csv"
+        assert server.sniff_content_type(b"hello", "blob", "application/octet-stream") == "application/octet-stream"
+
+    def test_only_media_and_pdf_render_inline(self):
+        assert server.is_inline_safe("application/pdf")
+        assert server.is_inline_safe("image/png")
+        assert server.is_inline_safe("audio/mpeg")
+        assert not server.is_inline_safe("image/svg+xml")
+        assert not server.is_inline_safe("text/html")
+        assert not server.is_inline_safe("application/octet-stream")
+
+    def test_attached_file_ids_from_url_fields(self):
+        doc = {
+            "image_url": "https://kaif.example/api/files/file_0123456789ab",
+            "audio_url": "/api/files/file_ba9876543210",
+            "file_url": "https://elsewhere.example/doc.pdf"
+        }
+        assert server.attached_file_ids(doc, ("image_url", "audio_url", "file_url")) == {"file_0123456789ab", "file_ba9876543210"}
+        assert server.attached_file_ids(doc, ("image_url",)) == {"file_0123456789ab"}
+        assert server.attached_file_ids(None, ("image_url",)) == set()
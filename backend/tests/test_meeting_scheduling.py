@@ -0,0 +1,60 @@
+"""
+Unit tests for meeting scheduling: preferred-date parsing and free-window computation.
+"""
+from datetime import datetime, timezone
+
+import server
+
+
+def utc(*args):
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+class TestMeetingScheduling:
+    """Preferred-date parsing and free-window computation"""
+
+    def test_local_formats_are_read_in_meeting_timezone(self):
+        offset = server.MEETING_TZ.utcoffset(None)
+        assert server.parse_preferred_date("2024-05-10 14:30") == utc(2024, 5, 10, 14, 30) - offset
+        assert server.parse_preferred_date("10.05.2024 14:30") == utc(2024, 5, 10, 14, 30) - offset
+
+    def test_date_only_starts_the_working_day(self):
+        offset = server.MEETING_TZ.utcoffset(None)
+        expected = utc(2024, 5, 10, server.MEETING_WORK_START_HOUR) - offset
+        assert server.parse_preferred_date("10.05.2024") == expected
+        assert server.parse_preferred_date("2024-05-10") == expected
+
+    def test_explicit_timezone_is_respected(self):
+        assert server.parse_preferred_date("2024-05-10T12:00:00Z") == utc(2024, 5, 10, 12)
+
+    def test_unparseable_dates(self):
+        assert server.parse_preferred_date(None) is None
+        assert server.parse_preferred_date("next tuesday") is None
+
+    def test_free_windows_subtract_merged_busy_intervals(self):
+        day = [(utc(2024, 5, 10, 6), utc(2024, 5, 10, 15))]
+        busy = [
+            (utc(2024, 5, 10, 7), utc(2024, 5, 10, 8)),
+            (utc(2024, 5, 10, 7, 30), utc(2024, 5, 10, 9)),
+            (utc(2024, 5, 10, 12), utc(2024, 5, 10, 13))
+        ]
+        assert server._free_windows(busy, day) == [
+            (utc(2024, 5, 10, 6), utc(2024, 5, 10, 7)),
+            (utc(2024, 5, 10, 9), utc(2024, 5, 10, 12)),
+            (utc(2024, 5, 10, 13), utc(2024, 5, 10, 15))
+        ]
+
+    def test_busy_interval_spanning_two_windows(self):
+        windows = [
+            (utc(2024, 5, 10, 6), utc(2024, 5, 10, 15)),
+            (utc(2024, 5, 11, 6), utc(2024, 5, 11, 15))
+        ]
+        busy = [(utc(2024, 5, 10, 14), utc(2024, 5, 11, 7))]
+        assert server._free_windows(busy, windows) == [
+            (utc(2024, 5, 10, 6), utc(2024, 5, 10, 14)),
+            (utc(2024, 5, 11, 7), utc(2024, 5, 11, 15))
+        ]
+
+    def test_no_busy_intervals(self):
+        windows = [(utc(2024, 5, 10, 6), utc(2024, 5, 10, 15))]
+        assert server._free_windows([], windows) == windows
@@ -0,0 +1,29 @@
+"""
+Unit tests for message history cursors: timestamp normalization and keyset bounds.
+"""
+import server
+
+
+class TestMessageCursors:
+    """Cursors order by (created_at, message_id) on normalized timestamps"""
+
+    def test_timestamps_are_normalized_to_the_stored_form(self):
+        assert server._normalize_timestamp("2024-01-01T10:00:00Z") == "2024-01-01T10:00:00+00:00"
+        assert server._normalize_timestamp("2024-01-01T13:00:00+03:00") == "2024-01-01T10:00:00+00:00"
+        assert server._normalize_timestamp("2024-01-01T10:00:00") == "2024-01-01T10:00:00+00:00"
+
+    def test_message_cursor_breaks_ties_on_message_id(self):
+        assert server._message_bound("T", "msg_b", "$lt") == {
+            "$or": [{"created_at": {"$lt": "T"}}, {"created_at": "T", "message_id": {"$lt": "msg_b"}}]
+        }
+        assert server._message_bound("T", "msg_b", "$gt") == {
+            "$or": [{"created_at": {"$gt": "T"}}, {"created_at": "T", "message_id": {"$gt": "msg_b"}}]
+        }
+
+    def test_inclusive_upper_bound(self):
+        assert server._message_bound("T", "msg_b", "$lte") == {
+            "$or": [{"created_at": {"$lt": "T"}}, {"created_at": "T", "message_id": {"$lte": "msg_b"}}]
+        }
+
+    def test_bare_timestamp_has_no_tiebreak(self):
+        assert server._message_bound("T", None, "$gt") == {"created_at": {"$gt": "T"}}
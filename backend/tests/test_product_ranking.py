@@ -0,0 +1,45 @@
+"""
+Unit tests for the query-independent product rank score.
+"""
+from datetime import datetime, timezone, timedelta
+
+import pytest
+
+import server
+
+
+def utc(*args):
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+class TestRankScore:
+    """Query-independent product quality used by sort=relevance"""
+
+    NOW = utc(2024, 6, 1)
+
+    def product(self, days_old=0, views=0, favorites=0):
+        return {
+            "created_at": (self.NOW - timedelta(days=days_old)).isoformat(),
+            "views": views, "favorites_count": favorites
+        }
+
+    def test_bounds(self):
+        top = server.compute_rank_score(self.product(0, 10 ** 6, 10 ** 6), True, self.NOW)
+        assert top == pytest.approx(1.0)
+        assert 0 <= server.compute_rank_score({}, False, self.NOW) < 0.01
+
+    def test_recency_halves_every_half_life(self):
+        fresh = server.compute_rank_score(self.product(0), False, self.NOW)
+        old = server.compute_rank_score(self.product(server.RANK_HALF_LIFE_DAYS), False, self.NOW)
+        assert old == pytest.approx(fresh / 2)
+
+    def test_popularity_and_verification_raise_the_score(self):
+        base = server.compute_rank_score(self.product(30), False, self.NOW)
+        assert server.compute_rank_score(self.product(30, views=50), False, self.NOW) > base
+        assert server.compute_rank_score(self.product(30, favorites=5), False, self.NOW) > base
+        assert server.compute_rank_score(self.product(30), True, self.NOW) == pytest.approx(base + server.RANK_WEIGHTS["verified"])
+
+    def test_future_and_invalid_dates(self):
+        future = {"created_at": (self.NOW + timedelta(days=3)).isoformat()}
+        assert server.compute_rank_score(future, False, self.NOW) == pytest.approx(server.RANK_WEIGHTS["recency"])
+        assert server.compute_rank_score({"created_at": "garbage"}, False, self.NOW) < 0.01
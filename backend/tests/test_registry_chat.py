@@ -242,16 +242,36 @@ class TestAdminChat:
         assert isinstance(data, list)
         print(f"✓ Admin can view all chat messages: {len(data)} messages")
     
-    def test_admin_can_send_reply(self, admin_token):
-        """Admin should be able to send messages"""
+    def test_admin_can_send_reply(self, admin_token, seller_token):
+        """Admin should be able to reply in a user's thread"""
+        me = requests.get(f"{BASE_URL}/api/auth/me", headers={"Authorization": f"Bearer {seller_token}"})
+        assert me.status_code == 200, f"Failed to get seller: {me.text}"
+        seller_id = me.json()["user_id"]
         headers = {"Authorization": f"Bearer {admin_token}", "Content-Type": "application/json"}
-        message = {"content": "TEST_Ответ администратора"}
+        message = {"content": "TEST_Ответ администратора", "thread_user_id": seller_id}
         response = requests.post(f"{BASE_URL}/api/admin-chat", headers=headers, json=message)
         assert response.status_code == 200, f"Failed to send admin reply: {response.text}"
         data = response.json()
         assert data["sender_role"] == "admin"
+        assert data["thread_user_id"] == seller_id
         print(f"✓ Admin sent reply: {data['message_id']}")
 
+    def test_admin_reply_requires_thread(self, admin_token):
+        """Admin post without a thread or announcement flag should be rejected"""
+        headers = {"Authorization": f"Bearer {admin_token}", "Content-Type": "application/json"}
+        response = requests.post(f"{BASE_URL}/api/admin-chat", headers=headers, json={"content": "TEST_Без адресата"})
+        assert response.status_code == 400, f"Expected 400, got {response.status_code}: {response.text}"
+        print("✓ Admin post without thread rejected")
+
+    def test_admin_can_send_announcement(self, admin_token):
+        """Admin should be able to post to everyone when explicitly flagged"""
+        headers = {"Authorization": f"Bearer {admin_token}", "Content-Type": "application/json"}
+        message = {"content": "TEST_Объявление", "announcement": True}
+        response = requests.post(f"{BASE_URL}/api/admin-chat", headers=headers, json=message)
+        assert response.status_code == 200, f"Failed to send announcement: {response.text}"
+        assert response.json()["thread_user_id"] == "all"
+        print("✓ Admin sent announcement")
+
 
 class TestCleanup:
     """Cleanup test data after tests"""
@@ -0,0 +1,82 @@
+"""
+Unit tests for registry spreadsheet import: header mapping, normalization,
+row errors and the dry-run diff. No running server or database is needed.
+"""
+import pytest
+from fastapi import HTTPException
+
+import server
+
+
+def registry_frame(rows):
+    """Build an import frame the way _load_registry_frame leaves it: all strings, stripped"""
+    raw = "\n".join([";".join(rows[0].keys())] + [";".join(r.values()) for r in rows]).encode("utf-8")
+    return server._load_registry_frame(raw, "registry.csv")
+
+
+class TestRegistryImport:
+    """Spreadsheet normalization and the dry-run diff"""
+
+    def test_headers_are_mapped_from_russian_aliases(self):
+        frame = registry_frame([{"ФИО": "Иванов И.И.", "Номер пайщика": "101", "Лишнее": "x"}])
+        assert list(frame.columns) == ["name", "shareholder_number"]
+
+    def test_missing_required_columns_are_rejected(self):
+        with pytest.raises(HTTPException) as exc:
+            registry_frame([{"name": "Иванов"}])
+        assert exc.value.status_code == 400
+
+    def test_values_are_normalized(self):
+        frame = registry_frame([{
+            "name": "Иванов", "shareholder_number": "101", "inn": "7707-083893",
+            "phone": "8 (912) 345-67-89", "email": "Ivan@Mail.RU", "pai_amount": "1 500,50",
+            "status": "Активен", "join_date": "05.01.2024"
+        }])
+        records, errors = server._normalize_registry_frame(frame)
+        assert errors == []
+        assert records == [{
+            "name": "Иванов", "shareholder_number": "101", "inn": "7707083893",
+            "phone": "+79123456789", "email": "ivan@mail.ru", "pai_amount": 1500.5,
+            "status": "active", "join_date": "2024-01-05"
+        }]
+
+    def test_iso_and_day_first_dates_are_both_accepted(self):
+        frame = registry_frame([
+            {"name": "A", "shareholder_number": "1", "join_date": "2024-03-04"},
+            {"name": "B", "shareholder_number": "2", "join_date": "03.04.2024"}
+        ])
+        records, _ = server._normalize_registry_frame(frame)
+        assert [r["join_date"] for r in records] == ["2024-03-04", "2024-04-03"]
+
+    def test_invalid_rows_are_reported_with_spreadsheet_row_numbers(self):
+        frame = registry_frame([
+            {"name": "A", "shareholder_number": "1", "inn": "123", "pai_amount": "-5"},
+            {"name": "", "shareholder_number": "2", "inn": "", "pai_amount": ""},
+            {"name": "C", "shareholder_number": "3", "inn": "", "pai_amount": "10"}
+        ])
+        records, errors = server._normalize_registry_frame(frame)
+        assert [r["shareholder_number"] for r in records] == ["3"]
+        assert errors[0]["row"] == 2
+        assert set(errors[0]["errors"]) == {"INN must have 10 or 12 digits", "pai_amount must be a non-negative number"}
+        assert errors[1]["row"] == 3
+        assert errors[1]["errors"] == ["name is required"]
+
+    def test_duplicated_numbers_in_file_are_errors(self):
+        frame = registry_frame([
+            {"name": "A", "shareholder_number": "7"},
+            {"name": "B", "shareholder_number": "7"}
+        ])
+        records, errors = server._normalize_registry_frame(frame)
+        assert records == []
+        assert len(errors) == 2
+
+    def test_empty_cells_do_not_overwrite(self):
+        frame = registry_frame([{"name": "A", "shareholder_number": "1", "phone": ""}])
+        records, _ = server._normalize_registry_frame(frame)
+        assert "phone" not in records[0]
+
+    def test_dry_run_diff(self):
+        record = {"name": "A", "shareholder_number": "1", "pai_amount": 100.0}
+        assert server._registry_changes(None, record) == record
+        assert server._registry_changes({"name": "A", "shareholder_number": "1", "pai_amount": 100.0}, record) == {}
+        assert server._registry_changes({"name": "Old", "shareholder_number": "1", "pai_amount": 100.0}, record) == {"name": "A"}
@@ -0,0 +1,76 @@
+"""
+Unit tests for registry keyset paging over nullable sort fields. The cursor
+predicate is evaluated in-process with Mongo's null ordering, so no database
+is needed.
+"""
+import pytest
+
+import server
+
+
+def matches(row, predicate):
+    """Evaluate the subset of the query language keyset_after emits"""
+    for key, cond in predicate.items():
+        if key == "$or":
+            if not any(matches(row, clause) for clause in cond):
+                return False
+            continue
+        value = row.get(key)
+        if not isinstance(cond, dict):
+            if value != cond:
+                return False
+            continue
+        for op, bound in cond.items():
+            if op == "$ne":
+                ok = value != bound
+            elif value is None:
+                ok = False  # $lt/$gt never match null or missing
+            else:
+                ok = value < bound if op == "$lt" else value > bound
+            if not ok:
+                return False
+    return True
+
+
+def walk(rows, field, descending, limit=2):
+    """Page through rows the way registry_page does and return the entry ids seen"""
+    def key(row):
+        value = row.get(field)
+        return (value is not None, value if value is not None else 0, row["entry_id"])
+    ordered = sorted(rows, key=key, reverse=descending)
+    seen, cursor = [], None
+    while True:
+        page = [r for r in ordered if cursor is None or matches(r, cursor)][:limit + 1]
+        seen += [r["entry_id"] for r in page[:limit]]
+        if len(page) <= limit:
+            return seen
+        last = page[limit - 1]
+        cursor = server.keyset_after(field, last.get(field), "entry_id", last["entry_id"], descending, nullable=True)
+
+
+ROWS = [
+    {"entry_id": "reg_a", "pai_amount": 100.0, "join_date": "2023-01-01"},
+    {"entry_id": "reg_b", "pai_amount": None, "join_date": None},
+    {"entry_id": "reg_c", "pai_amount": 50.0, "join_date": "2022-05-01"},
+    {"entry_id": "reg_d"},
+    {"entry_id": "reg_e", "pai_amount": 50.0, "join_date": "2024-03-01"},
+]
+
+
+class TestRegistryPaging:
+    """Null and missing sort values page like any other tier"""
+
+    @pytest.mark.parametrize("field", ["pai_amount", "join_date"])
+    @pytest.mark.parametrize("descending", [False, True])
+    def test_every_row_is_returned_once(self, field, descending):
+        seen = walk(ROWS, field, descending)
+        assert sorted(seen) == [r["entry_id"] for r in ROWS]
+
+    def test_nulls_first_ascending_last_descending(self):
+        assert walk(ROWS, "pai_amount", descending=False) == ["reg_b", "reg_d", "reg_c", "reg_e", "reg_a"]
+        assert walk(ROWS, "pai_amount", descending=True) == ["reg_a", "reg_e", "reg_c", "reg_d", "reg_b"]
+
+    def test_non_nullable_cursor_is_unchanged(self):
+        assert server.keyset_after("created_at", "T", "entry_id", "reg_b") == {
+            "$or": [{"created_at": {"$lt": "T"}}, {"created_at": "T", "entry_id": {"$lt": "reg_b"}}]
+        }
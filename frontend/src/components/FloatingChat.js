@@ -3,16 +3,19 @@ import { useAuth } from '../contexts/AuthContext';
 import { useLanguage } from '../contexts/LanguageContext';
 import { Button } from '../components/ui/button';
 import { Input } from '../components/ui/input';
+import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from '../components/ui/select';
 import { MessageCircle, X, Send, Minimize2 } from 'lucide-react';
 
 const API = `${process.env.REACT_APP_BACKEND_URL}/api`;
 
 const TEXTS = {
-  ru: { title: 'Чат с администратором', placeholder: 'Сообщение...', loginRequired: 'Войдите, чтобы написать' },
-  en: { title: 'Chat with Admin', placeholder: 'Message...', loginRequired: 'Sign in to chat' },
-  zh: { title: '与管理员聊天', placeholder: '消息...', loginRequired: '登录以聊天' },
+  ru: { title: 'Чат с администратором', placeholder: 'Сообщение...', loginRequired: 'Войдите, чтобы написать', selectThread: 'Выберите собеседника', announcement: 'Объявление для всех' },
+  en: { title: 'Chat with Admin', placeholder: 'Message...', loginRequired: 'Sign in to chat', selectThread: 'Choose a conversation', announcement: 'Announcement to everyone' },
+  zh: { title: '与管理员聊天', placeholder: '消息...', loginRequired: '登录以聊天', selectThread: '选择对话', announcement: '全体公告' },
 };
 
+const ANNOUNCEMENTS = 'all';
+
 export default function FloatingChat() {
   const { user, token } = useAuth();
   const { lang } = useLanguage();
@@ -22,35 +25,99 @@ export default function FloatingChat() {
   const [loading, setLoading] = useState(false);
   const bottomRef = useRef(null);
   const text = TEXTS[lang] || TEXTS.ru;
+  const isAdmin = user?.role === 'admin';
+  // Admins answer one user's thread at a time; announcements are a separate, explicit choice
+  const [threads, setThreads] = useState([]);
+  const [threadId, setThreadId] = useState('');
+
+  const lastIdRef = useRef(null);
+
+  const appendMessages = useCallback((incoming) => {
+    if (incoming.length === 0) return;
+    setMessages(prev => {
+      const seen = new Set(prev.map(m => m.message_id));
+      return [...prev, ...incoming.filter(m => !seen.has(m.message_id))];
+    });
+    lastIdRef.current = incoming[incoming.length - 1].message_id;
+  }, []);
+
+  const fetchThreads = useCallback(async () => {
+    if (!token || !isAdmin) return;
+    try {
+      const res = await fetch(`${API}/admin-chat/threads`, { headers: { 'Authorization': `Bearer ${token}` } });
+      if (res.ok) setThreads(await res.json());
+    } catch {}
+  }, [token, isAdmin]);
 
   const fetchMessages = useCallback(async () => {
-    if (!token) return;
+    if (!token || (isAdmin && !threadId)) return;
     try {
-      const res = await fetch(`${API}/admin-chat`, { headers: { 'Authorization': `Bearer ${token}` } });
-      if (res.ok) setMessages(await res.json());
+      // After the first load only ask for newer messages; unchanged chats answer 304
+      const params = new URLSearchParams();
+      if (isAdmin) params.set('thread_user_id', threadId);
+      if (lastIdRef.current) params.set('since', lastIdRef.current);
+      const query = params.toString() ? `?${params}` : '';
+      const res = await fetch(`${API}/admin-chat${query}`, { headers: { 'Authorization': `Bearer ${token}` } });
+      if (res.status === 200) appendMessages(await res.json());
     } catch {}
-  }, [token]);
+  }, [token, isAdmin, threadId, appendMessages]);
 
   useEffect(() => {
-    if (open && token) {
-      fetchMessages();
-      const interval = setInterval(fetchMessages, 5000);
-      return () => clearInterval(interval);
+    setMessages([]);
+    lastIdRef.current = null;
+  }, [token, threadId]);
+
+  useEffect(() => {
+    if (open) fetchThreads();
+  }, [open, fetchThreads]);
+
+  useEffect(() => {
+    if (!open || !token || (isAdmin && !threadId)) return;
+    fetchMessages();
+    // Push new messages over WebSocket; fall back to polling if the socket can't be kept open
+    let interval = null;
+    const startPolling = () => {
+      if (!interval) interval = setInterval(fetchMessages, 5000);
+    };
+    let ws = null;
+    try {
+      ws = new WebSocket(`${API.replace(/^http/, 'ws')}/ws?token=${encodeURIComponent(token)}`);
+      ws.onmessage = (e) => {
+        const event = JSON.parse(e.data);
+        if (event.type !== 'admin_chat') return;
+        if (isAdmin && event.data.thread_user_id !== threadId) {
+          fetchThreads();
+          return;
+        }
+        appendMessages([event.data]);
+      };
+      ws.onclose = startPolling;
+    } catch {
+      startPolling();
     }
-  }, [open, token, fetchMessages]);
+    return () => {
+      if (ws) { ws.onclose = null; ws.close(); }
+      if (interval) clearInterval(interval);
+    };
+  }, [open, token, isAdmin, threadId, fetchMessages, fetchThreads, appendMessages]);
 
   useEffect(() => {
     if (bottomRef.current) bottomRef.current.scrollIntoView({ behavior: 'smooth' });
   }, [messages]);
 
   const sendMessage = async () => {
-    if (!input.trim() || !token) return;
+    if (!input.trim() || !token || (isAdmin && !threadId)) return;
     setLoading(true);
+    const body = { content: input };
+    if (isAdmin) {
+      if (threadId === ANNOUNCEMENTS) body.announcement = true;
+      else body.thread_user_id = threadId;
+    }
     try {
       await fetch(`${API}/admin-chat`, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json', 'Authorization': `Bearer ${token}` },
-        body: JSON.stringify({ content: input })
+        body: JSON.stringify(body)
       });
       setInput('');
       fetchMessages();
@@ -89,10 +156,30 @@ export default function FloatingChat() {
             </Button>
           </div>
 
+          {isAdmin && (
+            <div className="px-3 py-2 border-b border-border">
+              <Select value={threadId} onValueChange={setThreadId}>
+                <SelectTrigger data-testid="chat-thread-select" className="h-9 text-sm">
+                  <SelectValue placeholder={text.selectThread} />
+                </SelectTrigger>
+                <SelectContent className="z-[60]">
+                  <SelectItem value={ANNOUNCEMENTS}>{text.announcement}</SelectItem>
+                  {threads.map(th => (
+                    <SelectItem key={th.thread_user_id} value={th.thread_user_id}>
+                      {th.user?.name || th.user?.email || th.thread_user_id}{th.unread > 0 ? ` (${th.unread})` : ''}
+                    </SelectItem>
+                  ))}
+                </SelectContent>
+              </Select>
+            </div>
+          )}
+
           {/* Messages */}
           <div className="flex-1 overflow-y-auto p-4 space-y-3 min-h-[250px] max-h-[350px]">
             {!user ? (
               <p className="text-center text-sm text-muted-foreground py-8">{text.loginRequired}</p>
+            ) : isAdmin && !threadId ? (
+              <p className="text-center text-sm text-muted-foreground py-8">{text.selectThread}</p>
             ) : messages.length === 0 ? (
               <p className="text-center text-sm text-muted-foreground py-8">
                 {lang === 'en' ? 'No messages yet. Start a conversation!' : 'Нет сообщений. Начните общение!'}
@@ -137,7 +224,7 @@ export default function FloatingChat() {
                 size="sm"
                 className="h-10 px-3 rounded-full"
                 onClick={sendMessage}
-                disabled={loading || !input.trim()}
+                disabled={loading || !input.trim() || (isAdmin && !threadId)}
                 data-testid="chat-send-btn"
               >
                 <Send className="h-4 w-4" />
@@ -108,6 +108,25 @@ export default function AdminPanel() {
     } catch { toast.error(t('common.error')); }
   };
 
+  // Attachments: the file body is streamed as-is, the server sniffs its type
+  const uploadAttachment = async (file, ownerType) => {
+    if (!file) return null;
+    try {
+      const res = await fetch(`${API}/files?filename=${encodeURIComponent(file.name)}&owner_type=${ownerType}`, {
+        method: 'POST',
+        headers: { 'Authorization': `Bearer ${token}`, 'Content-Type': file.type || 'application/octet-stream' },
+        body: file
+      });
+      if (!res.ok) throw new Error();
+      const data = await res.json();
+      toast.success(t('common.success'));
+      return `${process.env.REACT_APP_BACKEND_URL}${data.url}`;
+    } catch {
+      toast.error(t('common.error'));
+      return null;
+    }
+  };
+
   // KB CRUD
   const handleSaveKb = async () => {
     try {
@@ -127,7 +146,12 @@ export default function AdminPanel() {
       toast.success(t('common.success')); fetchData();
     } catch { toast.error(t('common.error')); }
   };
-  const openEditKb = (doc) => {
+  const openEditKb = async (doc) => {
+    // The list omits content; load the full document before editing
+    try {
+      const res = await fetch(`${API}/knowledge-base/${doc.doc_id}`);
+      if (res.ok) doc = await res.json();
+    } catch {}
     setEditKb(doc);
     setKbForm({ title: doc.title, category: doc.category, description: doc.description || '', file_url: doc.file_url || '', content: doc.content || '' });
     setShowKbDialog(true);
@@ -468,6 +492,7 @@ export default function AdminPanel() {
             <div className="space-y-2">
               <Label>Ссылка на файл (URL)</Label>
               <Input data-testid="kb-file-url" value={kbForm.file_url} onChange={e => setKbForm({...kbForm, file_url: e.target.value})} className="h-12" placeholder="https://..." />
+              <Input data-testid="kb-file-upload" type="file" onChange={async e => { const url = await uploadAttachment(e.target.files[0], 'kb'); if (url) setKbForm(f => ({...f, file_url: url})); }} />
             </div>
             <div className="space-y-2">
               <Label>Содержание (текст)</Label>
@@ -499,10 +524,12 @@ export default function AdminPanel() {
             <div className="space-y-2">
               <Label>Изображение (URL)</Label>
               <Input data-testid="news-image" value={newsForm.image_url} onChange={e => setNewsForm({...newsForm, image_url: e.target.value})} className="h-12" placeholder="https://..." />
+              <Input data-testid="news-image-upload" type="file" accept="image/*" onChange={async e => { const url = await uploadAttachment(e.target.files[0], 'news'); if (url) setNewsForm(f => ({...f, image_url: url})); }} />
             </div>
             <div className="space-y-2">
               <Label>Аудио запись (URL)</Label>
               <Input data-testid="news-audio" value={newsForm.audio_url} onChange={e => setNewsForm({...newsForm, audio_url: e.target.value})} className="h-12" placeholder="https://...mp3" />
+              <Input data-testid="news-audio-upload" type="file" accept="audio/*" onChange={async e => { const url = await uploadAttachment(e.target.files[0], 'news'); if (url) setNewsForm(f => ({...f, audio_url: url})); }} />
             </div>
             <div className="space-y-2">
               <Label>Полный текст</Label>
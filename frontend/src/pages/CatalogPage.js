@@ -39,19 +39,22 @@ export default function CatalogPage() {
     const params = new URLSearchParams();
     if (search) params.set('search', search);
     if (category) params.set('category', category);
+    if (sortOrder !== 'newest') params.set('sort', sortOrder);
     params.set('page', page.toString());
     params.set('limit', '20');
 
     try {
-      const res = await fetch(`${API}/products?${params}`);
+      // Signed-in requests come back with is_favorite on every product
+      const res = await fetch(`${API}/products?${params}`, token ? { headers: { 'Authorization': `Bearer ${token}` } } : {});
       const data = await res.json();
       setProducts(data.products || []);
+      setFavorites(new Set((data.products || []).filter(p => p.is_favorite).map(p => p.product_id)));
       setTotal(data.total || 0);
     } catch (err) {
       toast.error(t('common.error'));
     }
     setLoading(false);
-  }, [search, category, page, t]);
+  }, [search, category, sortOrder, page, token, t]);
 
   const fetchCategories = useCallback(async () => {
     try {
@@ -60,20 +63,8 @@ export default function CatalogPage() {
     } catch {}
   }, []);
 
-  const fetchFavorites = useCallback(async () => {
-    if (!token) return;
-    try {
-      const res = await fetch(`${API}/favorites`, {
-        headers: { 'Authorization': `Bearer ${token}` }
-      });
-      const data = await res.json();
-      setFavorites(new Set(data.map(p => p.product_id)));
-    } catch {}
-  }, [token]);
-
   useEffect(() => { fetchCategories(); }, [fetchCategories]);
   useEffect(() => { fetchProducts(); }, [fetchProducts]);
-  useEffect(() => { fetchFavorites(); }, [fetchFavorites]);
 
   const toggleFavorite = async (productId) => {
     if (!token) { navigate('/auth'); return; }
@@ -139,6 +130,16 @@ export default function CatalogPage() {
             ))}
           </SelectContent>
         </Select>
+        <Select value={sortOrder} onValueChange={v => { setSortOrder(v); setPage(1); }}>
+          <SelectTrigger data-testid="catalog-sort" className="w-48 h-12">
+            <ArrowUpDown className="h-4 w-4 mr-2" />
+            <SelectValue />
+          </SelectTrigger>
+          <SelectContent>
+            <SelectItem value="newest">{t('catalog.sortNewest')}</SelectItem>
+            <SelectItem value="relevance">{t('catalog.sortRelevance')}</SelectItem>
+          </SelectContent>
+        </Select>
       </div>
 
       {/* Results */}
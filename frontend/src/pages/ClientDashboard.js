@@ -9,6 +9,7 @@ import { toast } from 'sonner';
 import { Heart, Handshake, Calendar, Eye, ShoppingCart, Package } from 'lucide-react';
 
 const API = `${process.env.REACT_APP_BACKEND_URL}/api`;
+const DASHBOARD_PAGE = 50;
 
 export default function ClientDashboard() {
   const { user, token } = useAuth();
@@ -19,22 +20,47 @@ export default function ClientDashboard() {
   const [deals, setDeals] = useState([]);
   const [meetings, setMeetings] = useState([]);
   const [loading, setLoading] = useState(true);
+  // Per-section totals and last loaded page, for "load more"
+  const [totals, setTotals] = useState({});
+  const [pages, setPages] = useState({});
 
   const fetchData = useCallback(async () => {
     setLoading(true);
     try {
-      const [favRes, dealRes, meetRes] = await Promise.all([
-        fetch(`${API}/favorites`, { headers: { 'Authorization': `Bearer ${token}` } }),
-        fetch(`${API}/deals`, { headers: { 'Authorization': `Bearer ${token}` } }),
-        fetch(`${API}/meetings`, { headers: { 'Authorization': `Bearer ${token}` } })
-      ]);
-      setFavorites(await favRes.json());
-      setDeals(await dealRes.json());
-      setMeetings(await meetRes.json());
+      const res = await fetch(`${API}/dashboard/client?limit=${DASHBOARD_PAGE}`, { headers: { 'Authorization': `Bearer ${token}` } });
+      if (!res.ok) throw new Error();
+      const data = await res.json();
+      setFavorites(data.favorites.items);
+      setDeals(data.deals.items);
+      setMeetings(data.meetings.items);
+      setTotals({ favorites: data.favorites.total, deals: data.deals.total, meetings: data.meetings.total });
+      setPages({ favorites: 1, deals: 1, meetings: 1 });
     } catch { toast.error(t('common.error')); }
     setLoading(false);
   }, [token, t]);
 
+  const loadMore = async (section) => {
+    const setters = { favorites: setFavorites, deals: setDeals, meetings: setMeetings };
+    const page = (pages[section] || 1) + 1;
+    try {
+      const res = await fetch(`${API}/dashboard/client?section=${section}&page=${page}&limit=${DASHBOARD_PAGE}`, { headers: { 'Authorization': `Bearer ${token}` } });
+      if (!res.ok) throw new Error();
+      const data = (await res.json())[section];
+      setters[section](prev => [...prev, ...data.items]);
+      // A short page means there is nothing left, whatever the count said
+      setTotals(prev => ({ ...prev, [section]: data.items.length < DASHBOARD_PAGE ? 0 : data.total }));
+      setPages(prev => ({ ...prev, [section]: page }));
+    } catch { toast.error(t('common.error')); }
+  };
+
+  const loadMoreButton = (section, loaded) => loaded < (totals[section] || 0) && (
+    <div className="flex justify-center pt-4">
+      <Button variant="outline" className="rounded-full" onClick={() => loadMore(section)} data-testid={`load-more-${section}`}>
+        {t('common.loadMore')} ({loaded}/{totals[section]})
+      </Button>
+    </div>
+  );
+
   useEffect(() => { if (token) fetchData(); }, [token, fetchData]);
 
   const removeFavorite = async (productId) => {
@@ -43,6 +69,7 @@ export default function ClientDashboard() {
         method: 'DELETE', headers: { 'Authorization': `Bearer ${token}` }
       });
       setFavorites(prev => prev.filter(p => p.product_id !== productId));
+      setTotals(prev => ({ ...prev, favorites: Math.max((prev.favorites || 0) - 1, 0) }));
       toast.success(t('common.success'));
     } catch {}
   };
@@ -65,17 +92,17 @@ export default function ClientDashboard() {
       <div className="grid grid-cols-3 gap-4 mb-8" data-testid="client-stats">
         <div className="bg-card border border-border rounded-lg p-6 space-y-1">
           <Heart className="h-5 w-5 text-red-500 mb-2" />
-          <p className="font-special text-2xl font-bold">{favorites.length}</p>
+          <p className="font-special text-2xl font-bold">{Math.max(totals.favorites || 0, favorites.length)}</p>
           <p className="text-xs text-muted-foreground">{t('nav.favorites')}</p>
         </div>
         <div className="bg-card border border-border rounded-lg p-6 space-y-1">
           <Handshake className="h-5 w-5 text-primary mb-2" />
-          <p className="font-special text-2xl font-bold">{deals.length}</p>
+          <p className="font-special text-2xl font-bold">{Math.max(totals.deals || 0, deals.length)}</p>
           <p className="text-xs text-muted-foreground">{t('nav.deals')}</p>
         </div>
         <div className="bg-card border border-border rounded-lg p-6 space-y-1">
           <Calendar className="h-5 w-5 text-secondary mb-2" />
-          <p className="font-special text-2xl font-bold">{meetings.length}</p>
+          <p className="font-special text-2xl font-bold">{Math.max(totals.meetings || 0, meetings.length)}</p>
           <p className="text-xs text-muted-foreground">{t('nav.meetings')}</p>
         </div>
       </div>
@@ -95,22 +122,25 @@ export default function ClientDashboard() {
               <Button variant="outline" className="mt-4 rounded-full" onClick={() => navigate('/catalog')}>{t('landing.hero.cta')}</Button>
             </div>
           ) : (
-            <div className="grid grid-cols-1 sm:grid-cols-2 lg:grid-cols-3 gap-4" data-testid="favorites-grid">
-              {favorites.map(p => (
-                <div key={p.product_id} className="bg-card border border-border rounded-lg overflow-hidden hover:border-primary/50 transition-all duration-300 cursor-pointer" onClick={() => navigate(`/products/${p.product_id}`)}>
-                  <div className="aspect-[4/3] bg-muted">
-                    {p.images?.[0] ? <img src={p.images[0]} alt="" className="w-full h-full object-cover" /> : <div className="w-full h-full flex items-center justify-center text-4xl">📦</div>}
-                  </div>
-                  <div className="p-4 space-y-2">
-                    <h3 className="font-semibold text-sm truncate">{p.title}</h3>
-                    <p className="font-special font-bold text-primary">{p.price ? `${p.price.toLocaleString()} ${p.currency || '₽'}` : t('product.negotiable')}</p>
-                    <Button variant="ghost" size="sm" className="text-red-500" onClick={e => { e.stopPropagation(); removeFavorite(p.product_id); }}>
-                      <Heart className="h-4 w-4 fill-red-500 mr-1" /> {t('product.removeFromFavorites')}
-                    </Button>
+            <>
+              <div className="grid grid-cols-1 sm:grid-cols-2 lg:grid-cols-3 gap-4" data-testid="favorites-grid">
+                {favorites.map(p => (
+                  <div key={p.product_id} className="bg-card border border-border rounded-lg overflow-hidden hover:border-primary/50 transition-all duration-300 cursor-pointer" onClick={() => navigate(`/products/${p.product_id}`)}>
+                    <div className="aspect-[4/3] bg-muted">
+                      {p.images?.[0] ? <img src={p.images[0]} alt="" className="w-full h-full object-cover" /> : <div className="w-full h-full flex items-center justify-center text-4xl">📦</div>}
+                    </div>
+                    <div className="p-4 space-y-2">
+                      <h3 className="font-semibold text-sm truncate">{p.title}</h3>
+                      <p className="font-special font-bold text-primary">{p.price ? `${p.price.toLocaleString()} ${p.currency || '₽'}` : t('product.negotiable')}</p>
+                      <Button variant="ghost" size="sm" className="text-red-500" onClick={e => { e.stopPropagation(); removeFavorite(p.product_id); }}>
+                        <Heart className="h-4 w-4 fill-red-500 mr-1" /> {t('product.removeFromFavorites')}
+                      </Button>
+                    </div>
                   </div>
-                </div>
-              ))}
-            </div>
+                ))}
+              </div>
+              {loadMoreButton('favorites', favorites.length)}
+            </>
           )}
         </TabsContent>
 
@@ -131,6 +161,7 @@ export default function ClientDashboard() {
                   )}
                 </div>
               ))}
+              {loadMoreButton('deals', deals.length)}
             </div>
           )}
         </TabsContent>
@@ -147,6 +178,7 @@ export default function ClientDashboard() {
                   <Badge className={statusColor(m.status)}>{m.status}</Badge>
                 </div>
               ))}
+              {loadMoreButton('meetings', meetings.length)}
             </div>
           )}
         </TabsContent>
@@ -4,7 +4,8 @@ import { useLanguage } from '../contexts/LanguageContext';
 import { useAuth } from '../contexts/AuthContext';
 import { Tabs, TabsContent, TabsList, TabsTrigger } from '../components/ui/tabs';
 import { Badge } from '../components/ui/badge';
-import { FileText, Download, ExternalLink, FolderOpen } from 'lucide-react';
+import { Input } from '../components/ui/input';
+import { FileText, Download, ExternalLink, FolderOpen, Search } from 'lucide-react';
 
 const API = `${process.env.REACT_APP_BACKEND_URL}/api`;
 
@@ -22,6 +23,9 @@ export default function KnowledgeBasePage() {
   const [docs, setDocs] = useState([]);
   const [loading, setLoading] = useState(true);
   const [activeTab, setActiveTab] = useState(searchParams.get('tab') || 'catalogs');
+  const [query, setQuery] = useState('');
+  const [results, setResults] = useState(null);
+  const [contents, setContents] = useState({});
 
   const fetchDocs = useCallback(async () => {
     setLoading(true);
@@ -34,12 +38,63 @@ export default function KnowledgeBasePage() {
 
   useEffect(() => { fetchDocs(); }, [fetchDocs]);
 
+  useEffect(() => {
+    const q = query.trim();
+    if (q.length < 2) { setResults(null); return; }
+    const timer = setTimeout(async () => {
+      try {
+        const res = await fetch(`${API}/knowledge-base/search?q=${encodeURIComponent(q)}`);
+        if (res.ok) setResults((await res.json()).results);
+      } catch {}
+    }, 300);
+    return () => clearTimeout(timer);
+  }, [query]);
+
+  const toggleContent = async (docId) => {
+    if (contents[docId] !== undefined) {
+      setContents(prev => { const next = { ...prev }; delete next[docId]; return next; });
+      return;
+    }
+    try {
+      const res = await fetch(`${API}/knowledge-base/${docId}`);
+      const doc = await res.json();
+      setContents(prev => ({ ...prev, [docId]: doc.content || '' }));
+    } catch {}
+  };
+
   return (
     <div className="min-h-screen max-w-7xl mx-auto px-6 md:px-12 py-8" data-testid="knowledge-base-page">
       <h1 className="text-2xl sm:text-3xl font-bold mb-8 tracking-tight">
         {lang === 'en' ? 'Knowledge Base' : lang === 'zh' ? '知识库' : 'База знаний'}
       </h1>
 
+      <div className="relative mb-6">
+        <Search className="absolute left-3 top-1/2 -translate-y-1/2 h-4 w-4 text-muted-foreground" />
+        <Input
+          data-testid="kb-search-input"
+          value={query}
+          onChange={e => setQuery(e.target.value)}
+          placeholder={lang === 'en' ? 'Search documents...' : lang === 'zh' ? '搜索文件...' : 'Поиск по документам...'}
+          className="h-12 pl-10"
+        />
+      </div>
+
+      {results !== null && (
+        <div className="space-y-3 mb-8" data-testid="kb-search-results">
+          {results.length === 0 ? (
+            <p className="text-center py-8 text-muted-foreground">{lang === 'en' ? 'Nothing found' : lang === 'zh' ? '未找到' : 'Ничего не найдено'}</p>
+          ) : results.map(hit => (
+            <div key={hit.doc_id} className="bg-card border border-border rounded-lg p-5" data-testid={`kb-hit-${hit.doc_id}`}>
+              <div className="flex items-center gap-2 mb-1">
+                <h3 className="font-semibold text-sm" dangerouslySetInnerHTML={{ __html: hit.title_highlight }} />
+                <Badge variant="outline" className="text-xs">{(CATEGORY_META[hit.category] || {})[lang] || hit.category}</Badge>
+              </div>
+              <p className="text-sm text-muted-foreground" dangerouslySetInnerHTML={{ __html: hit.snippet }} />
+            </div>
+          ))}
+        </div>
+      )}
+
       <Tabs value={activeTab} onValueChange={setActiveTab}>
         <TabsList className="flex flex-wrap mb-8 h-auto gap-1">
           {Object.entries(CATEGORY_META).map(([key, names]) => (
@@ -67,7 +122,10 @@ export default function KnowledgeBasePage() {
                       <div className="flex-1 min-w-0 space-y-1">
                         <h3 className="font-semibold text-sm">{doc.title}</h3>
                         {doc.description && <p className="text-xs text-muted-foreground">{doc.description}</p>}
-                        {doc.content && <p className="text-sm text-muted-foreground mt-2 whitespace-pre-wrap">{doc.content}</p>}
+                        {contents[doc.doc_id] !== undefined && <p className="text-sm text-muted-foreground mt-2 whitespace-pre-wrap">{contents[doc.doc_id]}</p>}
+                        <button onClick={() => toggleContent(doc.doc_id)} className="text-xs text-primary hover:underline" data-testid={`kb-read-${doc.doc_id}`}>
+                          {contents[doc.doc_id] !== undefined ? (lang === 'en' ? 'Hide' : 'Свернуть') : (lang === 'en' ? 'Read' : 'Читать')}
+                        </button>
                         <p className="text-xs text-muted-foreground">{new Date(doc.created_at).toLocaleDateString()}</p>
                       </div>
                       {doc.file_url && (
@@ -50,9 +50,13 @@ export default function ProductDetailPage() {
     if (!token) return;
     const checkFav = async () => {
       try {
-        const res = await fetch(`${API}/favorites`, { headers: { 'Authorization': `Bearer ${token}` } });
+        const res = await fetch(`${API}/favorites/status`, {
+          method: 'POST',
+          headers: { 'Content-Type': 'application/json', 'Authorization': `Bearer ${token}` },
+          body: JSON.stringify({ product_ids: [productId] })
+        });
         const data = await res.json();
-        setIsFav(data.some(p => p.product_id === productId));
+        setIsFav(Boolean(data.favorited?.[0]));
       } catch {}
     };
     checkFav();
@@ -15,6 +15,7 @@ import { toast } from 'sonner';
 import { Plus, Package, TrendingUp, Eye, Handshake, Pencil, Trash2, Calendar, ClipboardList } from 'lucide-react';
 
 const API = `${process.env.REACT_APP_BACKEND_URL}/api`;
+const DASHBOARD_PAGE = 50;
 
 export default function ShareholderDashboard() {
   const { user, token } = useAuth();
@@ -29,6 +30,9 @@ export default function ShareholderDashboard() {
   const [showAddProduct, setShowAddProduct] = useState(false);
   const [editProduct, setEditProduct] = useState(null);
   const [registryEntries, setRegistryEntries] = useState([]);
+  // Per-section totals and last loaded page, for "load more"
+  const [totals, setTotals] = useState({});
+  const [pages, setPages] = useState({});
 
   const [productForm, setProductForm] = useState({
     title: '', description: '', category: 'other', price: '',
@@ -41,23 +45,42 @@ export default function ShareholderDashboard() {
   const fetchData = useCallback(async () => {
     setLoading(true);
     try {
-      const [prodRes, dealRes, meetRes, statRes, regRes] = await Promise.all([
-        fetch(`${API}/my-products`, { headers: { 'Authorization': `Bearer ${token}` } }),
-        fetch(`${API}/deals`, { headers: { 'Authorization': `Bearer ${token}` } }),
-        fetch(`${API}/meetings`, { headers: { 'Authorization': `Bearer ${token}` } }),
-        fetch(`${API}/shareholder/stats`, { headers: { 'Authorization': `Bearer ${token}` } }),
-        fetch(`${API}/registry`, { headers: { 'Authorization': `Bearer ${token}` } })
-      ]);
-      setProducts(await prodRes.json());
-      setDeals(await dealRes.json());
-      setMeetings(await meetRes.json());
-      setStats(await statRes.json());
-      const regData = await regRes.json();
-      setRegistryEntries(Array.isArray(regData) ? regData : []);
+      const res = await fetch(`${API}/dashboard/shareholder?limit=${DASHBOARD_PAGE}`, { headers: { 'Authorization': `Bearer ${token}` } });
+      if (!res.ok) throw new Error();
+      const data = await res.json();
+      setProducts(data.products.items);
+      setDeals(data.deals.items);
+      setMeetings(data.meetings.items);
+      setTotals({ products: data.products.total, deals: data.deals.total, meetings: data.meetings.total });
+      setPages({ products: 1, deals: 1, meetings: 1 });
+      setStats(data.stats);
+      setRegistryEntries(data.registry);
     } catch { toast.error(t('common.error')); }
     setLoading(false);
   }, [token, t]);
 
+  const loadMore = async (section) => {
+    const setters = { products: setProducts, deals: setDeals, meetings: setMeetings };
+    const page = (pages[section] || 1) + 1;
+    try {
+      const res = await fetch(`${API}/dashboard/shareholder?section=${section}&page=${page}&limit=${DASHBOARD_PAGE}`, { headers: { 'Authorization': `Bearer ${token}` } });
+      if (!res.ok) throw new Error();
+      const data = (await res.json())[section];
+      setters[section](prev => [...prev, ...data.items]);
+      // A short page means there is nothing left, whatever the count said
+      setTotals(prev => ({ ...prev, [section]: data.items.length < DASHBOARD_PAGE ? 0 : data.total }));
+      setPages(prev => ({ ...prev, [section]: page }));
+    } catch { toast.error(t('common.error')); }
+  };
+
+  const loadMoreButton = (section, loaded) => loaded < (totals[section] || 0) && (
+    <div className="flex justify-center pt-4">
+      <Button variant="outline" className="rounded-full" onClick={() => loadMore(section)} data-testid={`load-more-${section}`}>
+        {t('common.loadMore')} ({loaded}/{totals[section]})
+      </Button>
+    </div>
+  );
+
   useEffect(() => { if (token) fetchData(); }, [token, fetchData]);
 
   const handleSaveProduct = async () => {
@@ -185,6 +208,7 @@ export default function ShareholderDashboard() {
                   </div>
                 </div>
               ))}
+              {loadMoreButton('products', products.length)}
             </div>
           )}
         </TabsContent>
@@ -218,6 +242,7 @@ export default function ShareholderDashboard() {
                   )}
                 </div>
               ))}
+              {loadMoreButton('deals', deals.length)}
             </div>
           )}
         </TabsContent>
@@ -234,6 +259,7 @@ export default function ShareholderDashboard() {
                   <Badge className={statusColor(m.status)}>{m.status}</Badge>
                 </div>
               ))}
+              {loadMoreButton('meetings', meetings.length)}
             </div>
           )}
         </TabsContent>
@@ -55,6 +55,8 @@ const translations = {
   "catalog.filters": { ru: "Фильтры", en: "Filters", zh: "筛选" },
   "catalog.category": { ru: "Категория", en: "Category", zh: "分类" },
   "catalog.allCategories": { ru: "Все категории", en: "All categories", zh: "所有分类" },
+  "catalog.sortNewest": { ru: "Сначала новые", en: "Newest first", zh: "最新" },
+  "catalog.sortRelevance": { ru: "По релевантности", en: "Most relevant", zh: "最相关" },
   "catalog.priceRange": { ru: "Диапазон цен", en: "Price range", zh: "价格范围" },
   "catalog.region": { ru: "Регион", en: "Region", zh: "地区" },
   "catalog.noProducts": { ru: "Товары не найдены", en: "No products found", zh: "未找到商品" },
@@ -122,6 +124,7 @@ const translations = {
   "common.send": { ru: "Отправить", en: "Send", zh: "发送" },
   "common.loading": { ru: "Загрузка...", en: "Loading...", zh: "加载中..." },
   "common.noData": { ru: "Нет данных", en: "No data", zh: "没有数据" },
+  "common.loadMore": { ru: "Показать ещё", en: "Load more", zh: "加载更多" },
   "common.success": { ru: "Успешно!", en: "Success!", zh: "成功！" },
   "common.error": { ru: "Ошибка", en: "Error", zh: "错误" },
   "common.rub": { ru: "₽", en: "₽", zh: "₽" },